@@ -0,0 +1,254 @@
+# api/audio_preprocess.py
+"""
+Audio preprocessing for `/transcribe`: decode the browser recording to PCM,
+downmix to mono 16 kHz (what Whisper works at anyway), drop leading and
+trailing silence, shorten long pauses – the minutes spent examining the
+patient – and re-encode compactly before the upload to Groq.
+
+Speech is found with an energy VAD over 30 ms frames, computed for the whole
+recording in a few NumPy operations: frame RMS in dBFS against an adaptive
+threshold (the recording's noise floor plus a margin), clicks shorter than
+90 ms discarded, and every speech run padded so word onsets and tails
+survive.  Pauses up to *max_pause* are kept as they are; longer ones are cut
+down to that length.
+
+A `TimeMap` records where each kept stretch came from, so timestamps in the
+transcript (Whisper's segments) map back to positions in the original
+recording.
+
+Decoding uses `ffmpeg` (any browser format) and falls back to the standard
+`wave` module for WAV input; re-encoding is Opus in Ogg with ffmpeg, 16-bit
+WAV without.  Without NumPy, or when the result would not be smaller, the
+original recording is uploaded unchanged.
+"""
+
+from __future__ import annotations
+
+import bisect
+import io
+import shutil
+import subprocess
+import wave
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from utils.logger import logger
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAME = SAMPLE_RATE * FRAME_MS // 1000
+
+
+def _numpy() -> Any:
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _ffmpeg() -> Optional[str]:
+    return shutil.which("ffmpeg")
+
+
+class TimeMap:
+    """
+    Kept stretches as `(processed_start, original_start, duration)` seconds,
+    in order; maps a position in the processed audio back to the original.
+    """
+
+    def __init__(self, spans: List[Tuple[float, float, float]]) -> None:
+        self.spans = spans
+        self._starts = [s[0] for s in spans]
+
+    @classmethod
+    def identity(cls, duration: float) -> "TimeMap":
+        return cls([(0.0, 0.0, duration)])
+
+    def to_original(self, t: float) -> float:
+        if not self.spans:
+            return t
+        i = max(bisect.bisect_right(self._starts, t) - 1, 0)
+        out_start, src_start, duration = self.spans[i]
+        return src_start + min(max(t - out_start, 0.0), duration)
+
+    def to_json(self) -> List[List[float]]:
+        return [[round(a, 3), round(b, 3), round(c, 3)] for a, b, c in self.spans]
+
+
+class PreparedAudio(NamedTuple):
+    data: bytes
+    filename: str
+    content_type: str
+    time_map: TimeMap
+    stats: Dict[str, Any]
+
+
+# ───────────────────────────────────────────────────────────────
+# Decoding / encoding
+# ───────────────────────────────────────────────────────────────
+def decode(data: bytes) -> Any:
+    """Mono 16 kHz float32 samples in [-1, 1]; raises ValueError when the audio cannot be decoded."""
+    np = _numpy()
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return _decode_wav(np, data)
+    if _ffmpeg() is None:
+        raise ValueError("ffmpeg is needed to decode non-WAV audio")
+    proc = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+         "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1"],
+        input=data, capture_output=True, check=False,
+    )
+    if proc.returncode != 0:
+        raise ValueError(f"ffmpeg could not decode the audio: {proc.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(proc.stdout, dtype="<i2").astype(np.float32) / 32768.0
+
+
+def _decode_wav(np: Any, data: bytes) -> Any:
+    try:
+        with wave.open(io.BytesIO(data)) as wav:
+            channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            raw = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError) as e:
+        raise ValueError(f"Unreadable WAV: {e}") from e
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width} bytes")
+    samples = samples[: len(samples) // channels * channels].reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE:
+        n_out = int(round(len(samples) * SAMPLE_RATE / rate))
+        samples = np.interp(
+            np.arange(n_out, dtype=np.float64) * (rate / SAMPLE_RATE), np.arange(len(samples)), samples
+        ).astype(np.float32)
+    return samples
+
+
+def encode(samples: Any) -> Tuple[bytes, str, str]:
+    """`(bytes, filename, content type)`: Opus/Ogg at speech bitrate with ffmpeg, else 16-bit WAV."""
+    np = _numpy()
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+    if _ffmpeg() is not None:
+        proc = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1",
+             "-i", "pipe:0", "-c:a", "libopus", "-b:a", "24k", "-application", "voip", "-f", "ogg", "pipe:1"],
+            input=pcm, capture_output=True, check=False,
+        )
+        if proc.returncode == 0:
+            return proc.stdout, "recording.ogg", "audio/ogg"
+        logger.warning(f"ffmpeg Opus encoding failed, sending WAV: {proc.stderr.decode(errors='replace').strip()}")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm)
+    return buf.getvalue(), "recording.wav", "audio/wav"
+
+
+# ───────────────────────────────────────────────────────────────
+# Voice activity
+# ───────────────────────────────────────────────────────────────
+def speech_frames(
+    samples: Any,
+    margin_db: float = 10.0,
+    min_speech_ms: int = 90,
+    pad_ms: int = 240,
+) -> Any:
+    """
+    Boolean speech mask, one entry per 30 ms frame.  The threshold is the
+    10th-percentile frame energy (the noise floor) plus *margin_db*, kept
+    between -60 dBFS and 20 dB under the loud (90th-percentile) frames so
+    continuous speech is not cut into pieces.
+    """
+    np = _numpy()
+    n = len(samples) // FRAME
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    frames = samples[: n * FRAME].reshape(n, FRAME).astype(np.float64)
+    energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    floor, loud = np.percentile(energy_db, [10, 90])
+    threshold = min(max(floor + margin_db, -60.0), loud - 20.0)
+    voiced = energy_db > threshold
+
+    # Drop voiced runs shorter than min_speech_ms (clicks, bumps)
+    edges = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    short = (ends - starts) * FRAME_MS < min_speech_ms
+    if short.any():
+        cleared = np.zeros(n + 1, dtype=np.int32)
+        np.add.at(cleared, starts[short], 1)
+        np.add.at(cleared, ends[short], -1)
+        voiced &= np.cumsum(cleared[:n]) == 0
+
+    # Pad every run so onsets and trailing syllables are kept
+    pad = pad_ms // FRAME_MS
+    return np.convolve(voiced.astype(np.int32), np.ones(2 * pad + 1, dtype=np.int32), mode="same") > 0
+
+
+def compact(samples: Any, speech: Any, max_pause_ms: int = 600) -> Tuple[Any, TimeMap]:
+    """
+    Keep speech, pauses of at most *max_pause_ms* as they are, and the first
+    *max_pause_ms* of any longer pause; drop leading and trailing silence.
+    """
+    np = _numpy()
+    if not speech.any():
+        return samples[:0], TimeMap([])
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    # Each run keeps up to max_pause frames of the silence after it; the
+    # trailing silence (after the last run) is dropped
+    gaps = np.append(starts[1:] - ends[:-1], 0)
+    ends = ends + np.minimum(gaps, max_pause_ms // FRAME_MS)
+    # Runs that now reach the next one are merged
+    touching = ends[:-1] >= starts[1:]
+    starts = starts[np.concatenate(([True], ~touching))]
+    ends = ends[np.concatenate((~touching, [True]))]
+
+    delta = np.zeros(len(speech) + 1, dtype=np.int32)
+    np.add.at(delta, starts, 1)
+    np.add.at(delta, ends, -1)
+    keep = np.repeat(np.cumsum(delta[:-1]) > 0, FRAME)
+    lengths = (ends - starts) * FRAME
+    out_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    spans = [
+        (o / SAMPLE_RATE, a * FRAME / SAMPLE_RATE, n / SAMPLE_RATE)
+        for o, a, n in zip(out_starts.tolist(), starts.tolist(), lengths.tolist())
+    ]
+    return samples[: len(keep)][keep], TimeMap(spans)
+
+
+# ───────────────────────────────────────────────────────────────
+# Entry point
+# ───────────────────────────────────────────────────────────────
+def prepare_upload(data: bytes, filename: str, content_type: str, max_pause_ms: int = 600) -> PreparedAudio:
+    """
+    The recording to send for transcription: the compacted, re-encoded audio
+    when that is smaller, otherwise *data* unchanged (also when NumPy is
+    missing or the audio cannot be decoded).
+    """
+    original = PreparedAudio(data, filename, content_type, TimeMap([]), {"preprocessed": False, "bytes_in": len(data)})
+    if _numpy() is None:
+        return original
+    try:
+        samples = decode(data)
+    except ValueError as e:
+        logger.warning(f"Audio preprocessing skipped: {e}")
+        return original
+
+    duration = len(samples) / SAMPLE_RATE
+    kept, time_map = compact(samples, speech_frames(samples), max_pause_ms)
+    stats = {
+        "bytes_in": len(data),
+        "original_seconds": round(duration, 2),
+        "kept_seconds": round(len(kept) / SAMPLE_RATE, 2),
+    }
+    if len(kept) == 0:
+        return original._replace(time_map=TimeMap.identity(duration), stats={**original.stats, **stats})
+    encoded, out_name, out_type = encode(kept)
+    if len(encoded) >= len(data):
+        return original._replace(time_map=TimeMap.identity(duration), stats={**original.stats, **stats})
+    return PreparedAudio(encoded, out_name, out_type, time_map, {**stats, "preprocessed": True, "bytes_out": len(encoded)})
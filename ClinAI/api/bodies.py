@@ -0,0 +1,197 @@
+"""
+Compressed storage for the large `conversation` and `note` text bodies.
+
+Patient documents keep only the derived fields (summary, keywords, timeline,
+…); the raw transcript and note live in a side collection, compressed
+(zstd when `zstandard` is installed, zlib otherwise) and keyed on
+`patient_id`.  Searches, listings and the change feed never touch them, so
+the working set shrinks to the small derived documents; endpoints that
+need the bodies load them on demand.
+
+This module is also the migration for existing data: it moves inline
+bodies into the side collection, unsets them on the patient documents and
+reports collection sizes and read latency before and after.
+
+The codec is shared with the sync `helper_mongo` (imported there as
+`api.bodies`), so module-level imports stay standard-library only.
+
+Usage examples
+--------------
+• Measure only (no writes):
+    python bodies.py --dry-run
+
+• Migrate with zstd, 500 documents per batch:
+    python bodies.py --codec zstd --batch-size 500
+
+Prerequisites
+-------------
+• .env file with ATLAS_URI
+• `pip install pymongo python-dotenv` (`zstandard` for the zstd codec)
+"""
+
+from __future__ import annotations
+
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+BODY_FIELDS = ("conversation", "note")
+CODECS = ("zstd", "zlib")
+
+
+def _zstd() -> Any:
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def resolve_codec(name: str) -> str:
+    """*name*, or zlib when zstd was asked for but `zstandard` is missing."""
+    if name not in CODECS:
+        raise ValueError(f"Unsupported body codec: {name}")
+    if name == "zstd" and _zstd() is None:
+        return "zlib"
+    return name
+
+
+def compress_text(text: str, codec: str) -> bytes:
+    raw = (text or "").encode("utf-8")
+    if codec == "zstd":
+        return _zstd().ZstdCompressor(level=3).compress(raw)
+    return zlib.compress(raw, 6)
+
+
+def decompress_text(data: bytes | None, codec: str) -> str:
+    if not data:
+        return ""
+    if codec == "zstd":
+        return _zstd().ZstdDecompressor().decompress(bytes(data)).decode("utf-8")
+    return zlib.decompress(bytes(data)).decode("utf-8")
+
+
+def encode_body(patient_id: str, conversation: str, note: str, codec: str) -> Dict[str, Any]:
+    """Side-collection document for one patient."""
+    doc: Dict[str, Any] = {"patient_id": patient_id, "codec": codec, "raw_bytes": 0, "stored_bytes": 0}
+    for field, text in zip(BODY_FIELDS, (conversation, note)):
+        blob = compress_text(text, codec)
+        doc[field] = blob
+        doc["raw_bytes"] += len((text or "").encode("utf-8"))
+        doc["stored_bytes"] += len(blob)
+    doc["updated_at"] = datetime.now(timezone.utc)
+    return doc
+
+
+def decode_body(doc: Dict[str, Any]) -> Dict[str, str]:
+    codec = doc.get("codec", "zlib")
+    return {field: decompress_text(doc.get(field), codec) for field in BODY_FIELDS}
+
+
+def split_record(record: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """(derived fields, {conversation, note}) for a full patient record."""
+    derived = {k: v for k, v in record.items() if k not in BODY_FIELDS}
+    return derived, {field: record.get(field) or "" for field in BODY_FIELDS}
+
+
+# ---------------------------------------------------------------------------
+# Migration
+# ---------------------------------------------------------------------------
+def collection_size(db: Any, name: str) -> Dict[str, Any]:
+    stats = db.command("collStats", name)
+    return {k: stats.get(k, 0) for k in ("count", "size", "avgObjSize", "storageSize", "totalIndexSize")}
+
+
+def sample_read_latency(collection: Any, patient_ids: Iterable[str], projection: Optional[Dict[str, int]] = None) -> Dict[str, float]:
+    """p50/p95 milliseconds of single-document reads for *patient_ids*."""
+    import time
+
+    timings = []
+    for patient_id in patient_ids:
+        started = time.perf_counter()
+        collection.find_one({"patient_id": patient_id}, projection)
+        timings.append((time.perf_counter() - started) * 1000)
+    if not timings:
+        return {"p50_ms": 0.0, "p95_ms": 0.0}
+    timings.sort()
+    return {
+        "p50_ms": round(timings[len(timings) // 2], 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+    }
+
+
+def migrate(collection: Any, bodies: Any, codec: str, batch_size: int = 500) -> Dict[str, int]:
+    """Move inline bodies into *bodies*; idempotent, safe to re-run after fresh ingests."""
+    from pymongo import UpdateOne
+
+    bodies.create_index("patient_id", unique=True)
+    moved = raw = stored = 0
+    query = {"$or": [{field: {"$exists": True}} for field in BODY_FIELDS]}
+    while True:
+        docs = list(collection.find(query, {"patient_id": 1, **{f: 1 for f in BODY_FIELDS}}).limit(batch_size))
+        if not docs:
+            break
+        encoded = [encode_body(d["patient_id"], d.get("conversation"), d.get("note"), codec) for d in docs]
+        bodies.bulk_write(
+            [UpdateOne({"patient_id": b["patient_id"]}, {"$set": b}, upsert=True) for b in encoded],
+            ordered=False,
+        )
+        # Unset only after the body is safely stored
+        collection.bulk_write(
+            [UpdateOne({"_id": d["_id"]}, {"$unset": {f: "" for f in BODY_FIELDS}}) for d in docs],
+            ordered=False,
+        )
+        moved += len(docs)
+        raw += sum(b["raw_bytes"] for b in encoded)
+        stored += sum(b["stored_bytes"] for b in encoded)
+        print(f"Migrated {moved} documents…", flush=True)
+    return {"moved": moved, "raw_bytes": raw, "stored_bytes": stored}
+
+
+def main() -> None:
+    import argparse
+    import json
+    import os
+    import random
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
+
+    parser = argparse.ArgumentParser(description="Move conversation/note bodies into a compressed side collection")
+    parser.add_argument("--codec", choices=CODECS, default="zstd")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--samples", type=int, default=200, help="Reads per latency measurement")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the current sizes and latency")
+    parser.add_argument("--mongodb-uri", default=os.getenv("ATLAS_URI"))
+    parser.add_argument("--db", default=os.getenv("MONGODB_DB_NAME", "clinical_data"))
+    parser.add_argument("--collection", default=os.getenv("MONGODB_COLLECTION", "patient_records"))
+    parser.add_argument("--bodies-collection", default=os.getenv("MONGODB_BODIES_COLLECTION", "patient_bodies"))
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongodb_uri)
+    db = client[args.db]
+    collection, bodies = db[args.collection], db[args.bodies_collection]
+    ids = [d["patient_id"] for d in collection.aggregate([{"$sample": {"size": args.samples}}, {"$project": {"patient_id": 1}}])]
+    random.shuffle(ids)
+
+    def measure() -> Dict[str, Any]:
+        return {
+            "collection": collection_size(db, args.collection),
+            "full_document_read": sample_read_latency(collection, ids, {"_id": 0}),
+        }
+
+    report: Dict[str, Any] = {"before": measure()}
+    if not args.dry_run:
+        codec = resolve_codec(args.codec)
+        if codec != args.codec:
+            print("zstandard not installed; falling back to zlib")
+        report["migration"] = {"codec": codec, **migrate(collection, bodies, codec, args.batch_size)}
+        report["after"] = {**measure(), "bodies_collection": collection_size(db, args.bodies_collection)}
+    print(json.dumps(report, indent=2))
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+# api/change_feed.py
+from __future__ import annotations
+
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from pymongo.errors import OperationFailure, PyMongoError
+from utils.logger import logger
+from utils.metrics import metrics
+
+UpsertHandler = Callable[[Dict[str, Any]], Optional[Awaitable[None]]]
+DeleteHandler = Callable[[str], Optional[Awaitable[None]]]
+
+
+class _Subscriber:
+    def __init__(self, name: str, on_upsert: UpsertHandler, on_delete: DeleteHandler | None, fields: List[str]):
+        self.name = name
+        self.on_upsert = on_upsert
+        self.on_delete = on_delete
+        self.fields = fields
+
+
+class ChangeFeed:
+    """
+    Keeps in-process derived structures (indexes, caches) in step with the
+    patient collection.
+
+    On start every subscriber is bootstrapped from one projected scan, then a
+    background task tails a change stream and replays inserts, updates and
+    deletes.  The resume token is persisted so a restart catches up on
+    everything written while the process was down; if the oplog has rolled
+    past that token the feed opens a fresh stream and rescans instead.
+    Deployments without change streams (standalone mongod, mongomock) fall
+    back to polling the `updated_at` field; deletes are only observed in change-stream mode.
+    """
+
+    def __init__(
+        self,
+        collection: Any,
+        state_collection: Any,
+        *,
+        name: str = "patient_records",
+        poll_interval: float = 2.0,
+        persist_interval: float = 1.0,
+        batch_size: int = 5000,
+    ) -> None:
+        self.collection = collection
+        self.state_collection = state_collection
+        self.name = name
+        self.poll_interval = poll_interval
+        self.persist_interval = persist_interval
+        self.batch_size = batch_size
+        self.mode = "stopped"
+        self._subscribers: List[_Subscriber] = []
+        self._ids: Dict[Any, str] = {}  # _id → patient_id, to resolve delete events
+        self._task: Optional[asyncio.Task] = None
+        self._resume_token: Any = None
+        self._last_seen: Optional[datetime] = None
+        self._last_seen_ids: Set[str] = set()
+        self._last_persist = 0.0
+
+    # ───────────────────────────────────────────────────────────────
+    def subscribe(
+        self,
+        name: str,
+        on_upsert: UpsertHandler,
+        on_delete: DeleteHandler | None = None,
+        fields: List[str] | None = None,
+    ) -> None:
+        """Register handlers; *fields* is the projection the handler needs."""
+        self._subscribers.append(_Subscriber(name, on_upsert, on_delete, fields or []))
+
+    def _projection(self) -> Dict[str, int]:
+        projection = {"patient_id": 1, "updated_at": 1}
+        for sub in self._subscribers:
+            projection.update({f: 1 for f in sub.fields})
+        return projection
+
+    # ───────────────────────────────────────────────────────────────
+    async def start(self, follow: bool = True) -> None:
+        """Bootstrap subscribers; with *follow*, keep them current in the background."""
+        if not follow:
+            await self._bootstrap()
+            return
+
+        state = await self.state_collection.find_one({"_id": self.name}) or {}
+        self._resume_token = state.get("resume_token")
+        self._last_seen = state.get("last_seen")
+
+        stream = await self._open_stream()
+        metrics.set("change_feed_mode", self.mode)
+        await self._bootstrap()
+        self._task = asyncio.create_task(
+            self._tail_stream(stream) if stream is not None else self._poll(),
+            name=f"change-feed-{self.name}",
+        )
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self._persist_state(force=True)
+        self.mode = "stopped"
+        metrics.set("change_feed_mode", self.mode)
+
+    # ───────────────────────────────────────────────────────────────
+    async def _open_stream(self) -> Any:
+        """Open (and position) a change stream, or return None to poll."""
+        kwargs: Dict[str, Any] = {"full_document": "updateLookup"}
+        if self._resume_token is not None:
+            kwargs["resume_after"] = self._resume_token
+        try:
+            stream = self.collection.watch(**kwargs)
+            await stream.try_next()  # establishes the start point before the bootstrap scan
+            self._resume_token = stream.resume_token
+            self.mode = "change_stream"
+            logger.info("Change feed '%s' using change streams", self.name)
+            return stream
+        except OperationFailure as exc:
+            if _streams_unsupported(exc):
+                logger.info("Change streams unavailable (%s); polling updated_at", exc)
+            elif self._resume_token is not None:
+                # Stale token (oplog rolled past it): start fresh; the bootstrap scan covers the gap.
+                logger.warning("Change feed '%s' cannot resume (%s); starting a fresh stream", self.name, exc)
+                self._resume_token = None
+                return await self._open_stream()
+            else:
+                logger.info("Change streams unavailable (%s); polling updated_at", exc)
+        except (NotImplementedError, AttributeError) as exc:
+            logger.info("Change streams unavailable (%s); polling updated_at", exc)
+        await self.collection.create_index("updated_at")
+        self.mode = "polling"
+        return None
+
+    async def _bootstrap(self, resync: bool = False) -> None:
+        """Replay every document; with *resync*, also drop ones deleted since the last scan."""
+        if not self._subscribers:
+            return
+        started = time.perf_counter()
+        n = 0
+        known = set(self._ids.values()) if resync else set()
+        cursor = self.collection.find({}, self._projection()).batch_size(self.batch_size)
+        async for doc in cursor:
+            await self._dispatch_upsert(doc)
+            self._advance_watermark(doc)
+            known.discard(doc.get("patient_id"))
+            n += 1
+        if known:
+            self._ids = {k: v for k, v in self._ids.items() if v not in known}
+            for patient_id in known:
+                await self._dispatch_delete(patient_id)
+        metrics.set("change_feed_bootstrap_docs", n)
+        metrics.set("change_feed_bootstrap_seconds", round(time.perf_counter() - started, 3))
+        logger.info("Change feed '%s' bootstrapped %d documents in %.2fs", self.name, n, time.perf_counter() - started)
+
+    # ───────────────────────────────────────────────────────────────
+    async def _tail_stream(self, stream: Any) -> None:
+        while True:
+            try:
+                async with stream:
+                    while stream.alive:
+                        change = await stream.try_next()
+                        if change is not None:
+                            await self._handle_change(change)
+                        self._resume_token = stream.resume_token
+                        await self._persist_state()
+                        if change is None:
+                            await asyncio.sleep(0.1)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as exc:
+                if not _resume_lost(exc):
+                    logger.warning("Change stream error (%s); reopening", exc)
+                    await asyncio.sleep(1.0)
+                    stream = self.collection.watch(full_document="updateLookup", resume_after=self._resume_token)
+                    continue
+                # Events since the token are gone: reposition first, then rescan so nothing falls in between.
+                logger.warning("Change feed '%s' lost its resume point (%s); resyncing", self.name, exc)
+                self._resume_token = None
+                stream = await self._open_stream()
+                await self._bootstrap(resync=True)
+                await self._persist_state(force=True)
+                if stream is None:
+                    metrics.set("change_feed_mode", self.mode)
+                    await self._poll()
+            except PyMongoError as exc:
+                logger.warning("Change stream error (%s); reopening", exc)
+                await asyncio.sleep(1.0)
+                stream = self.collection.watch(full_document="updateLookup", resume_after=self._resume_token)
+
+    async def _handle_change(self, change: Dict[str, Any]) -> None:
+        op = change.get("operationType")
+        metrics.incr("change_feed_events")
+        if op in ("insert", "update", "replace"):
+            doc = change.get("fullDocument")
+            if doc is None:  # document deleted before the lookup ran
+                return
+            await self._dispatch_upsert(doc)
+            self._record_lag(doc.get("updated_at"), change.get("clusterTime"))
+        elif op == "delete":
+            patient_id = self._ids.pop(change.get("documentKey", {}).get("_id"), None)
+            if patient_id is not None:
+                await self._dispatch_delete(patient_id)
+            self._record_lag(None, change.get("clusterTime"))
+
+    async def _poll(self) -> None:
+        while True:
+            query: Dict[str, Any] = {"updated_at": {"$exists": True}}
+            if self._last_seen is not None:
+                query = {"updated_at": {"$gte": self._last_seen}}
+            cursor = (
+                self.collection.find(query, self._projection())
+                .sort("updated_at", 1)
+                .batch_size(self.batch_size)
+            )
+            async for doc in cursor:
+                if doc.get("updated_at") == self._last_seen and doc.get("patient_id") in self._last_seen_ids:
+                    continue  # already applied at the watermark
+                await self._dispatch_upsert(doc)
+                self._advance_watermark(doc)
+                self._record_lag(doc.get("updated_at"), None)
+                metrics.incr("change_feed_events")
+            await self._persist_state()
+            await asyncio.sleep(self.poll_interval)
+
+    # ───────────────────────────────────────────────────────────────
+    async def _dispatch_upsert(self, doc: Dict[str, Any]) -> None:
+        patient_id = doc.get("patient_id")
+        if patient_id is None:
+            return
+        if "_id" in doc:
+            self._ids[doc["_id"]] = patient_id
+        for sub in self._subscribers:
+            try:
+                result = sub.on_upsert(doc)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as exc:
+                logger.error("Change feed subscriber '%s' failed on %s: %s", sub.name, patient_id, exc)
+
+    async def _dispatch_delete(self, patient_id: str) -> None:
+        for sub in self._subscribers:
+            if sub.on_delete is None:
+                continue
+            try:
+                result = sub.on_delete(patient_id)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as exc:
+                logger.error("Change feed subscriber '%s' failed deleting %s: %s", sub.name, patient_id, exc)
+
+    def _advance_watermark(self, doc: Dict[str, Any]) -> None:
+        ts = doc.get("updated_at")
+        if ts is None:
+            return
+        if self._last_seen is None or ts > self._last_seen:
+            self._last_seen = ts
+            self._last_seen_ids = {doc.get("patient_id")}
+        elif ts == self._last_seen:
+            self._last_seen_ids.add(doc.get("patient_id"))
+
+    def _record_lag(self, updated_at: Optional[datetime], cluster_time: Any) -> None:
+        """Freshness lag = now − time the write happened."""
+        now = datetime.now(timezone.utc)
+        if isinstance(updated_at, datetime):
+            if updated_at.tzinfo is None:
+                updated_at = updated_at.replace(tzinfo=timezone.utc)
+            lag = (now - updated_at).total_seconds()
+        elif cluster_time is not None:
+            lag = now.timestamp() - cluster_time.time
+        else:
+            return
+        metrics.set("change_feed_lag_seconds", round(max(lag, 0.0), 3))
+        metrics.set("change_feed_last_event_at", now.isoformat())
+
+    async def _persist_state(self, force: bool = False) -> None:
+        if not force and time.monotonic() - self._last_persist < self.persist_interval:
+            return
+        self._last_persist = time.monotonic()
+        try:
+            await self.state_collection.update_one(
+                {"_id": self.name},
+                {"$set": {"resume_token": self._resume_token, "last_seen": self._last_seen}},
+                upsert=True,
+            )
+        except PyMongoError as exc:
+            logger.warning("Could not persist change feed state: %s", exc)
+
+
+# Server codes: 40573 "only supported on replica sets", 136 CappedPositionLost,
+# 280 ChangeStreamFatalError, 286 ChangeStreamHistoryLost.
+_UNSUPPORTED_CODES = {40573}
+_RESUME_LOST_CODES = {136, 280, 286}
+
+
+def _streams_unsupported(exc: OperationFailure) -> bool:
+    message = str(exc).lower()
+    return exc.code in _UNSUPPORTED_CODES or "not supported" in message or "only supported on replica" in message
+
+
+def _resume_lost(exc: OperationFailure) -> bool:
+    return exc.code in _RESUME_LOST_CODES or "resume" in str(exc).lower()
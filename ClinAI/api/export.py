@@ -0,0 +1,351 @@
+"""
+Cohort export: stream patient records matching a keyword set as NDJSON, CSV
+or Parquet, with constant memory.
+
+Records are pulled from a Mongo cursor with a server-side projection and
+batch size, encoded one batch at a time and (optionally) compressed on the
+fly, so exporting 1M records never holds more than one batch in RAM.  The
+same `CohortExporter` backs the `/api/export` endpoint and this CLI.
+
+Usage examples
+--------------
+• Every diabetic patient on metformin, gzipped NDJSON:
+    python export.py --keywords "diabetes mellitus,metformin" --mode and \
+        --compression gzip -o cohort.ndjson.gz
+
+• Whole collection as Parquet with zstd column compression:
+    python export.py --format parquet --compression zstd -o patients.parquet
+
+Prerequisites
+-------------
+• .env file with ATLAS_URI
+• `pip install pymongo python-dotenv` (`pyarrow` for Parquet, `zstandard`
+  for zstd-compressed NDJSON/CSV)
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+import re
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+COMPRESSIONS = ("none", "gzip", "zstd")
+
+DEFAULT_FIELDS = ["patient_id", "name", "age", "gender", "summary", "keywords", "prescriptions", "timeline"]
+EXPORTABLE_FIELDS = set(DEFAULT_FIELDS) | {"note", "conversation", "updated_at"}
+
+
+# ---------------------------------------------------------------------------
+# Query helpers
+# ---------------------------------------------------------------------------
+def cohort_filter(terms: List[str], mode: str = "and") -> Dict[str, Any]:
+    """Mongo filter matching whole comma-separated keywords, case-insensitively."""
+    clauses = [
+        {"keywords": {"$regex": rf"(^|,)\s*{re.escape(t.strip())}\s*(,|$)", "$options": "i"}}
+        for t in terms if t.strip()
+    ]
+    if not clauses:
+        return {}
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and" if mode == "and" else "$or": clauses}
+
+
+def cohort_projection(fields: List[str]) -> Dict[str, int]:
+    projection = {"_id": 0}
+    projection.update({f: 1 for f in fields})
+    return projection
+
+
+def parse_fields(raw: str | None) -> List[str]:
+    if not raw:
+        return list(DEFAULT_FIELDS)
+    fields = [f.strip() for f in raw.split(",") if f.strip()]
+    unknown = set(fields) - EXPORTABLE_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown export fields: {sorted(unknown)}")
+    return fields
+
+
+def _cell(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+# ---------------------------------------------------------------------------
+# Streaming compressors
+# ---------------------------------------------------------------------------
+class _Passthrough:
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def _zstd() -> Any:
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def _pyarrow() -> Any:
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def _compressor(name: str) -> Any:
+    if name == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 → gzip container
+    if name == "zstd":
+        return _zstd().ZstdCompressor(level=3).compressobj()
+    return _Passthrough()
+
+
+class _Sink(io.RawIOBase):
+    """File-like buffer that pyarrow writes into; drained after every batch."""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def write(self, data: Any) -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._pos += len(chunk)
+        return len(chunk)
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+
+# ---------------------------------------------------------------------------
+# Exporter
+# ---------------------------------------------------------------------------
+class CohortExporter:
+    """
+    Incremental encoder: `start()`, then `write(batch)` per cursor batch, then
+    `finish()`; each returns the bytes to emit next.
+    """
+
+    def __init__(self, fmt: str = "ndjson", fields: List[str] | None = None, compression: str = "none") -> None:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported format: {fmt}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unsupported compression: {compression}")
+        # Optional libraries are checked up front, so a caller can reject the
+        # request before anything is streamed
+        if fmt == "parquet" and _pyarrow() is None:
+            raise ValueError("Parquet export needs pyarrow, which is not installed")
+        if compression == "zstd" and fmt != "parquet" and _zstd() is None:
+            raise ValueError("zstd compression needs zstandard, which is not installed")
+        self.fmt = fmt
+        self.fields = fields or list(DEFAULT_FIELDS)
+        self.compression = compression
+        self.rows = 0
+        # Parquet compresses column chunks itself; the byte stream stays raw.
+        self._stream = _compressor("none" if fmt == "parquet" else compression)
+        self._parquet_writer: Any = None
+        self._sink: Optional[_Sink] = None
+
+    @property
+    def media_type(self) -> str:
+        if self.compression == "gzip" and self.fmt != "parquet":
+            return "application/gzip"
+        if self.compression == "zstd" and self.fmt != "parquet":
+            return "application/zstd"
+        return FORMATS[self.fmt][0]
+
+    @property
+    def filename(self) -> str:
+        name = f"cohort.{FORMATS[self.fmt][1]}"
+        if self.fmt != "parquet" and self.compression == "gzip":
+            name += ".gz"
+        elif self.fmt != "parquet" and self.compression == "zstd":
+            name += ".zst"
+        return name
+
+    def start(self) -> bytes:
+        if self.fmt == "csv":
+            buf = io.StringIO()
+            csv.writer(buf).writerow(self.fields)
+            return self._stream.compress(buf.getvalue().encode("utf-8"))
+        return b""
+
+    def write(self, docs: List[Dict[str, Any]]) -> bytes:
+        if not docs:
+            return b""
+        self.rows += len(docs)
+        if self.fmt == "ndjson":
+            payload = "".join(
+                json.dumps({f: _cell(d.get(f)) for f in self.fields}, ensure_ascii=False) + "\n" for d in docs
+            ).encode("utf-8")
+            return self._stream.compress(payload)
+        if self.fmt == "csv":
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            for d in docs:
+                writer.writerow([_cell(d.get(f)) for f in self.fields])
+            return self._stream.compress(buf.getvalue().encode("utf-8"))
+        return self._write_parquet(docs)
+
+    def finish(self) -> bytes:
+        if self.fmt == "parquet":
+            if self._parquet_writer is None:
+                self._open_parquet()
+            self._parquet_writer.close()
+            return self._sink.drain()
+        return self._stream.flush()
+
+    def _open_parquet(self) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([(f, pa.string()) for f in self.fields])
+        self._sink = _Sink()
+        codec = self.compression if self.compression in ("gzip", "zstd") else "snappy"
+        self._parquet_writer = pq.ParquetWriter(self._sink, schema, compression=codec)
+
+    def _write_parquet(self, docs: List[Dict[str, Any]]) -> bytes:
+        import pyarrow as pa
+
+        if self._parquet_writer is None:
+            self._open_parquet()
+        columns = {f: [None if d.get(f) is None else str(_cell(d.get(f))) for d in docs] for f in self.fields}
+        self._parquet_writer.write_table(pa.table(columns, schema=self._parquet_writer.schema))
+        return self._sink.drain()
+
+
+def iter_export(batches: Iterable[List[Dict[str, Any]]], exporter: CohortExporter) -> Iterator[bytes]:
+    """Synchronous driver: encoded chunks for an iterable of document batches."""
+    head = exporter.start()
+    if head:
+        yield head
+    for batch in batches:
+        chunk = exporter.write(batch)
+        if chunk:
+            yield chunk
+    tail = exporter.finish()
+    if tail:
+        yield tail
+
+
+def attach_bodies(
+    batches: Iterable[List[Dict[str, Any]]], bodies: Any, patients: Any = None
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Fill conversation/note from the compressed bodies collection, one batch
+    at a time; with *patients*, records not migrated yet get their inline
+    bodies instead.
+    """
+    from bodies import BODY_FIELDS, decode_body
+
+    for batch in batches:
+        cursor = bodies.find({"patient_id": {"$in": [d["patient_id"] for d in batch]}}, {"_id": 0})
+        found = {doc["patient_id"]: decode_body(doc) for doc in cursor}
+        missing = [d["patient_id"] for d in batch if d["patient_id"] not in found]
+        if missing and patients is not None:
+            legacy = patients.find(
+                {"patient_id": {"$in": missing}}, {"_id": 0, "patient_id": 1, **{f: 1 for f in BODY_FIELDS}}
+            )
+            found.update({doc["patient_id"]: {f: doc.get(f, "") for f in BODY_FIELDS} for doc in legacy})
+        for doc in batch:
+            doc.update(found.get(doc["patient_id"], {}))
+        yield batch
+
+
+def iter_cursor_batches(cursor: Iterable[Dict[str, Any]], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch: List[Dict[str, Any]] = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+def main() -> None:
+    import argparse
+    import os
+    import sys
+    import time
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
+
+    parser = argparse.ArgumentParser(description="Export a patient cohort from MongoDB")
+    parser.add_argument("--keywords", default="", help="Comma-separated keywords (empty = all patients)")
+    parser.add_argument("--mode", choices=["and", "or"], default="and")
+    parser.add_argument("--fields", help=f"Comma-separated fields (default: {','.join(DEFAULT_FIELDS)})")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="none")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    parser.add_argument("--mongodb-uri", default=os.getenv("ATLAS_URI"))
+    parser.add_argument("--db", default=os.getenv("MONGODB_DB_NAME", "clinical_data"))
+    parser.add_argument("--collection", default=os.getenv("MONGODB_COLLECTION", "patient_records"))
+    parser.add_argument("--bodies-collection", default=os.getenv("MONGODB_BODIES_COLLECTION", "patient_bodies"))
+    args = parser.parse_args()
+
+    from bodies import BODY_FIELDS
+
+    fields = parse_fields(args.fields)
+    exporter = CohortExporter(args.format, fields, args.compression)
+    client = MongoClient(args.mongodb_uri)
+    wants_bodies = any(f in BODY_FIELDS for f in fields)
+    cursor = client[args.db][args.collection].find(
+        cohort_filter(args.keywords.split(","), args.mode),
+        cohort_projection([f for f in fields if f not in BODY_FIELDS] + ["patient_id"]),
+        batch_size=args.batch_size,
+    )
+    batches = iter_cursor_batches(cursor, args.batch_size)
+    if wants_bodies:
+        batches = attach_bodies(batches, client[args.db][args.bodies_collection], client[args.db][args.collection])
+
+    started = time.perf_counter()
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in iter_export(batches, exporter):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+        client.close()
+    elapsed = time.perf_counter() - started
+    print(f"Exported {exporter.rows} records in {elapsed:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# api/extractor_backends.py
+from __future__ import annotations
+
+import asyncio
+import importlib
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from utils.logger import logger
+
+BACKENDS = ("mcp", "inprocess")
+
+
+class MCPExtractorBackend:
+    """
+    Extractors behind the stdio MCP server (`ClinAI_server/main.py`) – the
+    same tools an agent would use.  Every call is a JSON round-trip over the
+    subprocess pipe.  *workers* server subprocesses are spawned per API
+    worker; each call goes to the one with the fewest calls in flight.
+    """
+
+    name = "mcp"
+
+    def __init__(self, server_script_path: str, workers: int = 1) -> None:
+        from mcp_client import MCPClient  # pulls in the mcp SDK; only needed for this backend
+
+        self.server_script_path = server_script_path
+        self.clients = [MCPClient() for _ in range(max(workers, 1))]
+        self._in_flight = [0] * len(self.clients)
+
+    async def start(self) -> None:
+        await asyncio.gather(*(c.connect_to_server(self.server_script_path) for c in self.clients))
+
+    async def call(self, tool: str, payload: Dict[str, Any]) -> Optional[str]:
+        i = min(range(len(self.clients)), key=self._in_flight.__getitem__)
+        self._in_flight[i] += 1
+        try:
+            result = await self.clients[i].call_tool(tool, payload)
+        finally:
+            self._in_flight[i] -= 1
+        content = getattr(result, "content", None)
+        if getattr(result, "isError", False):
+            # The tool raised (e.g. Gemini failed); surface it instead of its error text
+            raise RuntimeError(f"{tool} failed: {content[0].text if content else 'unknown error'}")
+        return content[0].text if content else None
+
+    async def stream(self, tool: str, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """MCP tools return whole results, so this "stream" is one piece, at the end."""
+        text = await self.call(tool, payload)
+        if text:
+            yield text
+
+    async def stats(self) -> Dict[str, Any]:
+        """
+        Demographic rule hit rates summed over the server subprocesses, their
+        tool routes and, when profiling, each subprocess's call profile.
+        """
+        results = await asyncio.gather(*(c.call_tool("extractor_stats", {}) for c in self.clients))
+        totals: Dict[str, Dict[str, Any]] = {}
+        extra: Dict[str, Any] = {}
+        for result in results:
+            content = getattr(result, "content", None)
+            worker = json.loads(content[0].text) if content else {}
+            extra.setdefault("routes", worker.get("routes"))
+            if "profile" in worker:
+                extra.setdefault("profile", []).append(worker["profile"])
+            for field, counts in worker.get("demographics", {}).items():
+                total = totals.setdefault(field, {"rule": 0, "llm": 0})
+                total["rule"] += counts.get("rule", 0)
+                total["llm"] += counts.get("llm", 0)
+        for counts in totals.values():
+            calls = counts["rule"] + counts["llm"]
+            counts["hit_rate"] = round(counts["rule"] / calls, 3) if calls else 0.0
+        return {"demographics": totals, **extra, "workers": len(self.clients)}
+
+    async def close(self) -> None:
+        for client in self.clients:
+            await client.cleanup()
+
+
+class InProcessExtractorBackend:
+    """
+    Calls the MCP server's extractor functions (`ClinAI_server/extractors.py`)
+    directly on a thread pool sized to the LLM budget: no subprocess, no
+    serialisation, no shared pipe.
+    """
+
+    name = "inprocess"
+
+    def __init__(self, server_dir: str | Path, max_workers: int = 8) -> None:
+        self.server_dir = str(Path(server_dir).resolve())
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._module: Any = None
+        self._tools: Dict[str, Callable[[str, str], str]] = {}
+        self._streams: Dict[str, Callable[[str, str], Iterator[str]]] = {}
+
+    def _load(self) -> Any:
+        if self.server_dir not in sys.path:
+            sys.path.append(self.server_dir)
+        return importlib.import_module("extractors")
+
+    async def start(self) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="extractor")
+        self._module = await asyncio.get_running_loop().run_in_executor(self._executor, self._load)
+        self._tools = self._module.TOOL_FUNCTIONS
+        self._streams = self._module.STREAM_FUNCTIONS
+        logger.info("In-process extractors loaded from %s: %s", self.server_dir, sorted(self._tools))
+
+    async def call(self, tool: str, payload: Dict[str, Any]) -> Optional[str]:
+        fn = self._tools.get(tool)
+        if fn is None:
+            raise ValueError(f"Unknown extractor tool: {tool}")
+        data = payload.get("data", {})
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, data.get("note", ""), data.get("conversation", ""))
+
+    async def stream(self, tool: str, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        The tool's output piece by piece as the LLM generates it.  The
+        blocking generator runs on the pool and hands pieces to the loop;
+        closing this iterator early stops it at the next piece.
+        """
+        fn = self._streams.get(tool)
+        if fn is None:
+            text = await self.call(tool, payload)
+            if text:
+                yield text
+            return
+        data = payload.get("data", {})
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def pump() -> None:
+            try:
+                for piece in fn(data.get("note", ""), data.get("conversation", "")):
+                    if stop.is_set():
+                        return
+                    loop.call_soon_threadsafe(queue.put_nowait, ("piece", piece))
+                loop.call_soon_threadsafe(queue.put_nowait, ("end", None))
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+
+        loop.run_in_executor(self._executor, pump)
+        try:
+            while True:
+                kind, value = await queue.get()
+                if kind == "error":
+                    raise value
+                if kind == "end":
+                    return
+                yield value
+        finally:
+            stop.set()
+
+    async def stats(self) -> Dict[str, Any]:
+        return self._module.extractor_stats() if self._module is not None else {}
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def make_backend(kind: str, server_script_path: str, max_workers: int = 8, mcp_workers: int = 1) -> Any:
+    """Extractor backend for `Settings.extractor_backend`."""
+    if kind == "mcp":
+        return MCPExtractorBackend(server_script_path, workers=mcp_workers)
+    if kind == "inprocess":
+        return InProcessExtractorBackend(Path(server_script_path).parent, max_workers=max_workers)
+    raise ValueError(f"Unknown extractor backend '{kind}' (expected one of {BACKENDS})")
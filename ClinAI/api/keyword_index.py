@@ -0,0 +1,174 @@
+# api/keyword_index.py
+from __future__ import annotations
+
+import bisect
+import heapq
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Set, Tuple
+
+from utils.fields import normalize_term, split_keywords
+
+
+class KeywordIndex:
+    """
+    In-memory inverted index: normalized keyword → patient IDs.
+
+    Fed by the change feed (bootstrap scan + incremental updates) and by the
+    write handlers directly, so a save is searchable before its change event
+    arrives.  Exact lookups are a dict hit; prefix lookups bisect a sorted
+    term list that is re-sorted lazily after new terms appear.
+
+    *canonical* maps a term to its index key (default `normalize_term`); pass
+    `MedicalVocabulary.canonical` so synonyms such as "HTN" and "high blood
+    pressure" share one posting list.
+    """
+
+    def __init__(self, canonical: Callable[[str], str] = normalize_term) -> None:
+        self._key = canonical
+        self._postings: Dict[str, Set[str]] = {}
+        self._by_patient: Dict[str, Tuple[str, ...]] = {}
+        self._sorted_terms: List[str] = []
+        self._dirty = False
+        self._stale = 0  # terms still in _sorted_terms whose postings emptied
+        self._version = 0
+        self._facet_cache: Dict[int, Tuple[int, List[Tuple[str, int]]]] = {}
+        self._term_watchers: List[Callable[[str, bool], None]] = []
+
+    def __len__(self) -> int:
+        return len(self._by_patient)
+
+    @property
+    def version(self) -> int:
+        """Bumped on every mutation; lets dependants cache derived views."""
+        return self._version
+
+    def __contains__(self, term: str) -> bool:
+        """Whether *term* (already an index key) has any patient."""
+        return term in self._postings
+
+    def term_counts(self) -> Iterator[Tuple[str, int]]:
+        for term, postings in self._postings.items():
+            yield term, len(postings)
+
+    def watch_terms(self, fn: Callable[[str, bool], None]) -> None:
+        """Call `fn(term, added)` when a term gains its first patient (True) or loses its last (False)."""
+        self._term_watchers.append(fn)
+
+    # ───────────────────────────────────────────────────────────────
+    # Maintenance
+    # ───────────────────────────────────────────────────────────────
+    def upsert(self, patient_id: str, keywords: str | Iterable[str] | None) -> None:
+        raw = split_keywords(keywords) if isinstance(keywords, str) or keywords is None else keywords
+        terms = tuple(dict.fromkeys(t for t in (self._key(k) for k in raw) if t))
+        old = self._by_patient.get(patient_id, ())
+        if terms == old:
+            return
+        self._version += 1
+        for term in set(old) - set(terms):
+            self._discard(term, patient_id)
+        for term in set(terms) - set(old):
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = set()
+                self._sorted_terms.append(term)
+                self._dirty = True
+                for fn in self._term_watchers:
+                    fn(term, True)
+            postings.add(patient_id)
+        if terms:
+            self._by_patient[patient_id] = terms
+        else:
+            self._by_patient.pop(patient_id, None)
+
+    def remove(self, patient_id: str) -> None:
+        self._version += 1
+        for term in self._by_patient.pop(patient_id, ()):
+            self._discard(term, patient_id)
+
+    def on_upsert(self, doc: Dict[str, Any]) -> None:
+        """Change-feed handler."""
+        self.upsert(doc["patient_id"], doc.get("keywords"))
+
+    def _discard(self, term: str, patient_id: str) -> None:
+        postings = self._postings.get(term)
+        if postings is None:
+            return
+        postings.discard(patient_id)
+        if not postings:
+            del self._postings[term]
+            self._stale += 1
+            for fn in self._term_watchers:
+                fn(term, False)
+
+    def _ensure_sorted(self) -> None:
+        if self._stale > max(1024, len(self._sorted_terms) // 10):
+            self._sorted_terms = [t for t in self._sorted_terms if t in self._postings]
+            self._stale = 0
+            self._dirty = True
+        if self._dirty:
+            # Mostly a sorted run plus a short appended tail – timsort merges it in ~O(n).
+            terms = sorted(self._sorted_terms)
+            self._sorted_terms = [t for i, t in enumerate(terms) if i == 0 or t != terms[i - 1]]
+            self._dirty = False
+
+    # ───────────────────────────────────────────────────────────────
+    # Queries
+    # ───────────────────────────────────────────────────────────────
+    def lookup(self, term: str) -> Set[str]:
+        return self._postings.get(self._key(term), set())
+
+    def terms_with_prefix(self, prefix: str, limit: int | None = None) -> List[str]:
+        self._ensure_sorted()
+        prefix = self._key(prefix)
+        if not prefix:
+            return []
+        out: List[str] = []
+        i = bisect.bisect_left(self._sorted_terms, prefix)
+        while i < len(self._sorted_terms) and self._sorted_terms[i].startswith(prefix):
+            term = self._sorted_terms[i]
+            if term in self._postings:
+                out.append(term)
+                if limit is not None and len(out) >= limit:
+                    break
+            i += 1
+        return out
+
+    def match(self, term: str, prefix: bool = False) -> Set[str]:
+        if not prefix:
+            return self.lookup(term)
+        matched: Set[str] = set()
+        for t in self.terms_with_prefix(term):
+            matched |= self._postings[t]
+        return matched
+
+    def query(self, terms: Iterable[str], mode: str = "and", prefix: bool = False) -> Set[str]:
+        """Boolean AND/OR across *terms*; AND intersects smallest posting first."""
+        sets = [self.match(t, prefix=prefix) for t in terms if normalize_term(t)]
+        if not sets:
+            return set()
+        if mode == "or":
+            return set().union(*sets)
+        sets.sort(key=len)
+        result = set(sets[0])
+        for s in sets[1:]:
+            result &= s
+            if not result:
+                break
+        return result
+
+    def count(self, term: str) -> int:
+        return len(self._postings.get(self._key(term), ()))
+
+    def facets(self, top: int = 50, terms: Iterable[str] | None = None) -> List[Tuple[str, int]]:
+        """Most frequent keywords, optionally restricted to *terms*."""
+        if terms is None:
+            cached = self._facet_cache.get(top)
+            if cached is not None and cached[0] == self._version:
+                return cached[1]
+            result = heapq.nlargest(top, ((t, len(p)) for t, p in self._postings.items()), key=lambda item: item[1])
+            self._facet_cache[top] = (self._version, result)
+            return result
+        pool = ((t, self._postings[t]) for t in (self._key(x) for x in terms) if t in self._postings)
+        return heapq.nlargest(top, ((t, len(p)) for t, p in pool), key=lambda item: item[1])
+
+    def stats(self) -> Dict[str, int]:
+        return {"patients": len(self._by_patient), "terms": len(self._postings)}
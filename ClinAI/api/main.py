@@ -1,50 +1,288 @@
 from __future__ import annotations
 
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, List
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.encoders import jsonable_encoder
 from motor.motor_asyncio import AsyncIOMotorClient
 from pydantic_settings import BaseSettings
-import google.generativeai as genai
 import requests
 import io
 import uuid
 import json
-
-from mcp_client import MCPClient
-from mcp.types import CallToolResult, TextContent
+import time
+import heapq
+import hashlib
+
+from bodies import BODY_FIELDS
+from change_feed import ChangeFeed
+from extractor_backends import make_backend
+from audio_preprocess import PreparedAudio, TimeMap, prepare_upload
+from export import CohortExporter, cohort_filter, cohort_projection, parse_fields
+from keyword_index import KeywordIndex
+from repository import AsyncMongoDBHelper, PatientDetails, PatientRecord, SearchResult, client_options
+from shared_state import SharedCache, SharedRateLimiter, make_shared_state
+from similarity_index import SimilarityIndex
+from static_assets import StaticAssets
+from suggest_index import SuggestIndex
+from timeline_index import TimelineIndex
+from utils.deadline import DeadlineExceeded, Hedger, deadline, no_deadline, time_left
+from utils.fields import normalize_term, parse_drug_names, split_keywords
+from utils.metrics import metrics
+from utils.single_flight import SingleFlight
+from vocabulary import DEFAULT_VOCABULARY, MedicalVocabulary
 
 # ────────────────────────────────────────────────────────────────
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+
+# Heavy SDKs (google.generativeai, mcp) are imported on first use or during
+# startup, not at module import, to keep replica cold starts short.
+_genai: Any = None
+
+def gemini() -> Any:
+    """`google.generativeai`, imported and configured on first use."""
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        _genai = genai
+    return _genai
 
 class Settings(BaseSettings):
     server_script_path: str = os.getenv("SERVER_SCRIPT_PATH", "/Users/mani/Desktop/Clinai_project/ClinAI_server/main.py")
+    # "mcp": extractor tools over the stdio MCP server at server_script_path;
+    # "inprocess": the same extractor functions called directly in this process
+    extractor_backend: str = os.getenv("EXTRACTOR_BACKEND", "mcp")
+    # MCP server subprocesses per API worker; a node runs
+    # (uvicorn --workers) × mcp_workers of them
+    mcp_workers: int = int(os.getenv("MCP_WORKERS", "1"))
     mongodb_uri: str = os.getenv("ATLAS_URI")
     mongodb_db_name: str = os.getenv("MONGODB_DB_NAME", "clinical_data")
     mongodb_collection: str = os.getenv("MONGODB_COLLECTION", "patient_records")
+    # Raw conversation/note bodies live compressed in this side collection
+    mongodb_bodies_collection: str = os.getenv("MONGODB_BODIES_COLLECTION", "patient_bodies")
+    body_codec: str = "zstd"
+    # Shared Motor connection pool (timeouts left as None keep driver defaults)
+    mongodb_max_pool_size: int = 100
+    mongodb_min_pool_size: int = 0
+    mongodb_max_idle_time_ms: int | None = None
+    mongodb_connect_timeout_ms: int | None = None
+    mongodb_server_selection_timeout_ms: int | None = None
+    mongodb_socket_timeout_ms: int | None = None
+    mongodb_wait_queue_timeout_ms: int | None = None
+    mongodb_read_preference: str = "primary"
+    # Per-route read routing.  Routes: search (/api/search scans), list (result
+    # pages fetched by id), export, patient (single-record pages).  Secondaries
+    # more than max_staleness behind are skipped; a patient saved by this
+    # process is read from the primary for read_your_writes_seconds.  Try it
+    # against a local replica set, e.g.
+    #   mongod --replSet rs0 (x3) + rs.initiate(), ATLAS_URI=mongodb://localhost:27017/?replicaSet=rs0
+    mongodb_read_routes: Dict[str, str] = {
+        "search": "secondaryPreferred",
+        "list": "secondaryPreferred",
+        "export": "secondaryPreferred",
+        "patient": "primaryPreferred",
+    }
+    mongodb_max_staleness_seconds: int = 90
+    mongodb_read_your_writes_seconds: float = 30.0
+    # Derived-structure maintenance (change streams, or polling on updated_at)
+    change_feed_enabled: bool = True
+    change_feed_state_collection: str = "_clinai_change_feed"
+    change_feed_poll_interval: float = 2.0
+    # Concurrent extractor calls allowed across all requests in this process
+    llm_max_concurrency: int = 8
+    # Extractor calls per minute across *all* workers and nodes (0 = unlimited)
+    llm_rate_limit_per_minute: int = 0
+    # Time budgets (0 = none).  When /api/search runs out it answers without
+    # the LLM rerank; when /save_record does, the record is saved with the
+    # unfinished extractor fields listed in `pending_fields` and completed
+    # in the background.
+    search_deadline_seconds: float = 8.0
+    save_deadline_seconds: float = 20.0
+    # Upper bound on any single LLM call, deadline or not
+    llm_call_timeout_seconds: float = 60.0
+    # Hedged LLM calls: a duplicate goes out once the first has taken longer
+    # than this percentile of recent calls to the same tool; first answer wins
+    llm_hedging: bool = True
+    llm_hedge_percentile: float = 95.0
+    llm_hedge_min_delay_seconds: float = 0.1
+    # /transcribe: decode, downmix to mono 16 kHz, trim silence and cut
+    # pauses longer than this before uploading (see audio_preprocess.py)
+    audio_preprocessing: bool = True
+    audio_max_pause_ms: int = 600
+    # State shared by every worker: extraction cache, in-flight claims and
+    # rate-limit counters.  memory:// (this process only), file:///path (all
+    # workers on a node) or redis://host:port/db (cluster-wide)
+    shared_state_url: str = os.getenv("SHARED_STATE_URL", "memory://")
+    extraction_cache_ttl_seconds: int = 7 * 24 * 3600
+    extraction_inflight_ttl_seconds: float = 300.0
+    # How long a /save_record response is replayed for a repeated Idempotency-Key
+    idempotency_ttl_seconds: int = 24 * 3600
+    # /api/enrich:prefetch – extraction started while the clinician reviews
+    # the transcript; at most this many prefetches run at once per worker
+    speculative_enrichment: bool = True
+    speculative_max_in_flight: int = 16
+    # Extractor calls all prefetches together may have started at once, on
+    # their own budget: a save never queues behind more than this many
+    speculative_max_concurrency: int = 2
+    batch_chunk_size: int = 25
+    batch_max_records: int = 1000
+    # Start serving (liveness) while Mongo, the MCP subprocess and the change
+    # feed initialise in the background; /readyz reports when they are done
+    serve_before_ready: bool = True
+    # Synonym/abbreviation dictionary for search; Gemini only interprets
+    # queries in which it finds no known term
+    medical_vocabulary_path: str = os.getenv("MEDICAL_VOCABULARY_PATH", str(DEFAULT_VOCABULARY))
 
 settings = Settings()
 
+STARTUP_COMPONENTS = ("extractors", "mongo", "change_feed", "llm_sdk")
+
+async def start_component(name: str, coro: Any) -> None:
+    """Run one startup step, recording its status and duration for /readyz."""
+    started = time.perf_counter()
+    try:
+        await coro
+        app.state.readiness[name] = "ready"
+    except Exception as e:
+        app.state.readiness[name] = f"error: {e}"
+        print(f"[STARTUP ERROR] {name}: {e}")
+        raise
+    finally:
+        app.state.startup_seconds[name] = round(time.perf_counter() - started, 3)
+        metrics.set(f"startup_{name}_seconds", app.state.startup_seconds[name])
+        app.state.startup_events[name].set()
+
+async def wait_for_component(name: str) -> None:
+    """Block a request until *name* finished starting; raise if it failed."""
+    await app.state.startup_events[name].wait()
+    if app.state.readiness[name] != "ready":
+        raise RuntimeError(f"{name} unavailable ({app.state.readiness[name]})")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    mcp_client = MCPClient()
-    mongo_client = AsyncIOMotorClient(settings.mongodb_uri)
+    extractors = make_backend(
+        settings.extractor_backend, settings.server_script_path, settings.llm_max_concurrency, settings.mcp_workers
+    )
+    shared_state = make_shared_state(settings.shared_state_url)
+    mongo_client = AsyncIOMotorClient(settings.mongodb_uri, **client_options(
+        max_pool_size=settings.mongodb_max_pool_size,
+        min_pool_size=settings.mongodb_min_pool_size,
+        max_idle_time_ms=settings.mongodb_max_idle_time_ms,
+        connect_timeout_ms=settings.mongodb_connect_timeout_ms,
+        server_selection_timeout_ms=settings.mongodb_server_selection_timeout_ms,
+        socket_timeout_ms=settings.mongodb_socket_timeout_ms,
+        wait_queue_timeout_ms=settings.mongodb_wait_queue_timeout_ms,
+        read_preference=settings.mongodb_read_preference,
+    ))
+    repo = AsyncMongoDBHelper(
+        mongo_client,
+        settings.mongodb_db_name,
+        settings.mongodb_collection,
+        bodies_collection_name=settings.mongodb_bodies_collection,
+        body_codec=settings.body_codec,
+        routes=settings.mongodb_read_routes,
+        max_staleness_seconds=settings.mongodb_max_staleness_seconds,
+        read_your_writes_seconds=settings.mongodb_read_your_writes_seconds,
+    )
+    change_feed = ChangeFeed(
+        repo.collection,
+        repo.db[settings.change_feed_state_collection],
+        name=settings.mongodb_collection,
+        poll_interval=settings.change_feed_poll_interval,
+    )
+    vocabulary = MedicalVocabulary.load(settings.medical_vocabulary_path)
+    keyword_index = KeywordIndex(canonical=vocabulary.canonical)
+    suggest_index = SuggestIndex(keyword_index)
+    timeline_index = TimelineIndex(vocabulary)
+    similarity_index = SimilarityIndex(canonical=vocabulary.canonical)
+    change_feed.subscribe("keywords", keyword_index.on_upsert, keyword_index.remove, fields=["keywords"])
+    change_feed.subscribe("suggest", suggest_index.on_upsert, suggest_index.remove, fields=["prescriptions", "name"])
+    change_feed.subscribe("timeline", timeline_index.on_upsert, timeline_index.remove, fields=["timeline"])
+    change_feed.subscribe("similarity", similarity_index.on_upsert, similarity_index.remove, fields=["keywords", "prescriptions"])
+    app.state.extractors = extractors
+    app.state.repo = repo
+    app.state.change_feed = change_feed
+    app.state.vocabulary = vocabulary
+    app.state.keyword_index = keyword_index
+    app.state.suggest_index = suggest_index
+    app.state.timeline_index = timeline_index
+    app.state.similarity_index = similarity_index
+    app.state.llm_budget = asyncio.Semaphore(settings.llm_max_concurrency)
+    app.state.shared_state = shared_state
+    app.state.extraction_cache = SharedCache(
+        shared_state,
+        "extract",
+        ttl=settings.extraction_cache_ttl_seconds,
+        inflight_ttl=settings.extraction_inflight_ttl_seconds,
+    )
+    app.state.idempotency = SharedCache(
+        shared_state,
+        "idempotency",
+        ttl=settings.idempotency_ttl_seconds,
+        inflight_ttl=settings.extraction_inflight_ttl_seconds,
+    )
+    app.state.search_flight = SingleFlight("search")
+    app.state.hedgers = {}  # LLM call kind → Hedger
+    # Blocking Gemini calls made by the API itself (search).  Sized with room
+    # for attempts a hedge has overtaken, which run on until their own timeout.
+    app.state.llm_executor = ThreadPoolExecutor(max_workers=settings.llm_max_concurrency * 4, thread_name_prefix="gemini")
+    app.state.completions = {}  # patient_id → task finishing fields a save left pending
+    app.state.speculative = {}  # content hash → prefetch task
+    app.state.speculative_forms = {}  # form id → content hash of its latest prefetch
+    app.state.speculative_budget = asyncio.Semaphore(settings.speculative_max_concurrency)
+    app.state.save_flight = SingleFlight("save")
+    app.state.llm_rate_limit = (
+        SharedRateLimiter(shared_state, "llm", settings.llm_rate_limit_per_minute)
+        if settings.llm_rate_limit_per_minute > 0 else None
+    )
+    app.state.readiness = {name: "pending" for name in STARTUP_COMPONENTS}
+    app.state.startup_seconds = {}
+    app.state.startup_events = {name: asyncio.Event() for name in STARTUP_COMPONENTS}
+    app.state.started_at = time.monotonic()
+
+    async def mongo_then_feed():
+        await start_component("mongo", repo.ensure_indexes())
+        await start_component("change_feed", change_feed.start(follow=settings.change_feed_enabled))
+
+    async def startup():
+        # Extractor start-up (MCP subprocess spawn), Mongo round-trips and the Gemini SDK import overlap
+        results = await asyncio.gather(
+            start_component("extractors", extractors.start()),
+            mongo_then_feed(),
+            start_component("llm_sdk", asyncio.to_thread(gemini)),
+            return_exceptions=True,
+        )
+        app.state.startup_seconds["total"] = round(time.monotonic() - app.state.started_at, 3)
+        metrics.set("startup_ready_seconds", app.state.startup_seconds["total"])
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            raise errors[0]
+
+    app.state.startup = asyncio.create_task(startup(), name="startup")
     try:
-        await mcp_client.connect_to_server(settings.server_script_path)
-        app.state.client = mcp_client
-        app.state.db = mongo_client[settings.mongodb_db_name]
+        if not settings.serve_before_ready:
+            await app.state.startup
         yield
     finally:
-        await mcp_client.cleanup()
+        if not app.state.startup.done():
+            app.state.startup.cancel()
+        await asyncio.gather(app.state.startup, return_exceptions=True)
+        for task in [*app.state.speculative.values(), *app.state.completions.values()]:
+            task.cancel()
+        await change_feed.stop()
+        await extractors.close()
+        await shared_state.close()
+        app.state.llm_executor.shutdown(wait=False, cancel_futures=True)
         mongo_client.close()
 
 app = FastAPI(title="ClinAI Client API", lifespan=lifespan)
@@ -56,20 +294,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.get("/healthz", include_in_schema=False)
+async def liveness():
+    """Liveness: the process is up and serving, even while still starting."""
+    return JSONResponse(content={"status": "alive", "uptime_s": round(time.monotonic() - app.state.started_at, 3)})
+
+@app.get("/readyz", include_in_schema=False)
+async def readiness():
+    """Readiness: Mongo, the extractor backend and the in-memory indexes are all initialised."""
+    ready = all(status == "ready" for status in app.state.readiness.values())
+    return JSONResponse(
+        content={"ready": ready, "components": app.state.readiness, "startup_seconds": app.state.startup_seconds},
+        status_code=200 if ready else 503,
+    )
+
 @app.get("/patient/{patient_id}/details")
 async def get_patient_details(patient_id: str):
-    rec = await app.state.db[settings.mongodb_collection].find_one(
-        {"patient_id": str(patient_id)},
-        {"_id": 0, "summary": 1, "keywords": 1, "name": 1, "age": 1, "gender": 1},
-    )
+    rec = await app.state.repo.reader("patient").get_conversation(patient_id, PatientDetails)
     if rec is None:
         raise HTTPException(status_code=404, detail="Patient not found")
 
     # Parse keywords if it's comma-separated
-    keywords_raw = rec.get("keywords", "")
-    keywords_parsed = []
-    if keywords_raw and keywords_raw != "No main keywords found.":
-        keywords_parsed = [k.strip() for k in keywords_raw.split(",")]
+    keywords_parsed = split_keywords(rec.get("keywords", ""))
 
     # Pass through the stored data, properly formatted
     bundle: Dict[str, Any] = {
@@ -85,37 +331,50 @@ async def get_patient_details(patient_id: str):
 # ────────────────────────────────────────────────────────────────
 # Static frontend pages
 frontend_dir = Path(__file__).parent.parent / "frontend"
-app.mount("/static", StaticFiles(directory=frontend_dir / "static", html=True), name="static")
+assets = StaticAssets(frontend_dir)
+
+@app.get("/static/{path:path}", include_in_schema=False)
+async def serve_static(path: str, request: Request):
+    return assets.asset(path, request)
 
 @app.get("/", include_in_schema=False)
-async def serve_home():
-    return FileResponse(frontend_dir / "index.html")
+async def serve_home(request: Request):
+    return assets.page("index.html", request)
 
 @app.get("/create", include_in_schema=False)
-async def serve_create():
-    return FileResponse(frontend_dir / "create.html")
+async def serve_create(request: Request):
+    return assets.page("create.html", request)
 
 @app.get("/patients", include_in_schema=False)
-async def serve_patients_page():
-    return FileResponse(frontend_dir / "patients.html")
+async def serve_patients_page(request: Request):
+    return assets.page("patients.html", request)
 
 @app.get("/patient/{patient_id}", include_in_schema=False)
-async def serve_patient_page(patient_id: str):
-    return FileResponse(frontend_dir / "patient.html")
+async def serve_patient_page(patient_id: str, request: Request):
+    return assets.page("patient.html", request)
 
 # ────────────────────────────────────────────────────────────────
 @app.post("/transcribe")
 async def transcribe_audio(file: UploadFile = File(...)):
     try:
         audio_bytes = await file.read()
+        if settings.audio_preprocessing:
+            prepared = await asyncio.to_thread(
+                prepare_upload, audio_bytes, file.filename, file.content_type, settings.audio_max_pause_ms
+            )
+        else:
+            prepared = PreparedAudio(audio_bytes, file.filename, file.content_type, TimeMap([]), {"preprocessed": False})
+        metrics.incr("transcribe_bytes_in", len(audio_bytes))
+        metrics.incr("transcribe_bytes_uploaded", len(prepared.data))
         headers = {
             "Authorization": f"Bearer " + os.getenv("GROQ_API_KEY")
         }
         files = {
-            "file": (file.filename, audio_bytes, file.content_type)
+            "file": (prepared.filename, prepared.data, prepared.content_type)
         }
         data = {
-            "model": "whisper-large-v3"
+            "model": "whisper-large-v3",
+            "response_format": "verbose_json"
         }
 
         response = requests.post(
@@ -126,8 +385,21 @@ async def transcribe_audio(file: UploadFile = File(...)):
         )
 
         if response.status_code == 200:
-            transcription = response.json().get("text", "")
-            return JSONResponse(content={"transcription": transcription})
+            result = response.json()
+            # Segment times are in the compacted audio; report them in the original recording's timeline.
+            segments = [
+                {
+                    "start": round(prepared.time_map.to_original(seg.get("start", 0.0)), 2),
+                    "end": round(prepared.time_map.to_original(seg.get("end", 0.0)), 2),
+                    "text": seg.get("text", ""),
+                }
+                for seg in result.get("segments") or []
+            ]
+            return JSONResponse(content={
+                "transcription": result.get("text", ""),
+                "segments": segments,
+                "audio": {**prepared.stats, "time_map": prepared.time_map.to_json()},
+            })
         else:
             print(f"[GROQ ERROR] Status: {response.status_code}, Response: {response.text}")
             return JSONResponse(
@@ -156,7 +428,7 @@ The doctor always speaks first.
 ### LABELED OUTPUT (start immediately)
 """
     try:
-        model = genai.GenerativeModel("models/gemini-2.0-flash")
+        model = gemini().GenerativeModel("models/gemini-2.0-flash")
         convo = model.start_chat()
         response = convo.send_message(prompt)
         labeled = response.text.strip()
@@ -165,6 +437,268 @@ The doctor always speaks first.
         print(f"[GEMINI ERROR] {str(e)}")
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+# ────────────────────────────────────────────────────────────────
+# LLM calls: hedged, bounded by the request deadline
+
+def hedger(name: str) -> Hedger:
+    """The Hedger (latency history) for one kind of LLM call."""
+    h = app.state.hedgers.get(name)
+    if h is None:
+        h = app.state.hedgers[name] = Hedger(
+            name,
+            settings.llm_hedge_percentile,
+            settings.llm_hedge_min_delay_seconds,
+            enabled=settings.llm_hedging,
+        )
+    return h
+
+async def generate_json(stage: str, prompt: str, temperature: float, max_output_tokens: int, share: float = 1.0) -> Any:
+    """
+    One JSON-mode Gemini call for a search *stage*, off the event loop and
+    hedged, within *share* of the request's remaining time.  Raises
+    `DeadlineExceeded` when that runs out.
+    """
+    timeout = time_left(settings.llm_call_timeout_seconds, share)
+
+    def generate() -> Any:
+        genai = gemini()
+        model = genai.GenerativeModel("models/gemini-2.0-flash")
+        response = model.generate_content(
+            prompt,
+            generation_config=genai.GenerationConfig(
+                temperature=temperature,
+                response_mime_type="application/json",
+                max_output_tokens=max_output_tokens
+            ),
+            request_options={"timeout": timeout or settings.llm_call_timeout_seconds},
+        )
+        return json.loads(response.text.strip())
+
+    loop = asyncio.get_running_loop()
+    return await hedger(stage).run(lambda: loop.run_in_executor(app.state.llm_executor, generate), timeout)
+
+# ────────────────────────────────────────────────────────────────
+# Record enrichment (extractor tools, over MCP or in-process)
+
+# record field → (extractor tool, fallback value when the tool fails)
+EXTRACTION_TOOLS: Dict[str, tuple] = {
+    "timeline": ("patient_timeline", ""),
+    "keywords": ("patient_keywords", ""),
+    "prescriptions": ("patient_prescriptions", ""),
+    "summary": ("patient_summary", ""),
+    "name": ("patient_name", "NA"),
+    "age": ("patient_age", "NA"),
+    "gender": ("patient_gender", "NA"),
+}
+
+async def run_extraction_tool(field: str, payload: Dict[str, Any], idx: str, failed: List[str]) -> str:
+    """
+    Call one extractor tool, hedged.  Each attempt holds a slot of the
+    process-wide LLM budget (and the shared rate limit) until its call has
+    really finished: neither backend can stop a call in flight (a thread
+    or the MCP server keeps running it), so a cancelled loser keeps its
+    slot until then.  No duplicate is sent while the budget is exhausted.
+    """
+    tool, fallback = EXTRACTION_TOOLS[field]
+    budget = app.state.llm_budget
+
+    async def attempt() -> Any:
+        await budget.acquire()
+        try:
+            if app.state.llm_rate_limit is not None:
+                await app.state.llm_rate_limit.acquire()
+            call = asyncio.ensure_future(app.state.extractors.call(tool, payload))
+        except BaseException:
+            budget.release()
+            raise
+        call.add_done_callback(lambda t: (budget.release(), t.cancelled() or t.exception()))
+        return await asyncio.shield(call)
+
+    try:
+        await wait_for_component("extractors")
+        text = await hedger(tool).run(
+            attempt, settings.llm_call_timeout_seconds, can_hedge=lambda: not budget.locked()
+        ) or fallback
+        print(f"[EXTRACTOR OUTPUT] {tool} for patient_id: {idx}\n{text}")
+        return text
+    except Exception as e:
+        print(f"[EXTRACTOR ERROR] {tool} failed for patient_id: {idx}: {str(e)}")
+        failed.append(field)
+        return fallback
+
+async def enrich_record(
+    idx: str,
+    notes: str,
+    conversation: str,
+    pending: List[str] | None = None,
+    fields: Iterable[str] = EXTRACTION_TOOLS,
+    speculative: bool = False,
+) -> Dict[str, str]:
+    """
+    Extractor *fields* for an encounter.  Each field is cached in shared state
+    under (field, content hash): a field already being extracted – by a
+    speculative prefetch or another worker – is waited for rather than sent
+    to the LLM again, and only fields missing from the cache (e.g. ones that
+    failed last time) are re-run.
+
+    Under a request deadline, fields still running when it expires get
+    their fallback value and are appended to *pending*; their extraction
+    carries on (shared through the cache's in-flight calls).
+
+    A *speculative* (prefetch) field first takes a slot of the small
+    prefetch budget and keeps it until its extraction has finished, even
+    when the prefetch is cancelled; fields still waiting for a slot are
+    simply dropped on cancel.
+    """
+    digest = content_hash(notes, conversation)
+    payload = {"data": {"note": notes, "conversation": conversation}}
+
+    async def extract(field: str) -> str:
+        async def compute():
+            failed: List[str] = []
+            text = await run_extraction_tool(field, payload, idx, failed)
+            # Never cache a failure, nor an answer indistinguishable from the
+            # fallback: a later save of the same text should try again
+            fallback = EXTRACTION_TOOLS[field][1]
+            return text, not failed and text.strip() not in ("", fallback)
+
+        if not speculative:
+            return await app.state.extraction_cache.get_or_compute(f"{field}:{digest}", compute)
+        budget = app.state.speculative_budget
+        await budget.acquire()
+        shared = asyncio.ensure_future(app.state.extraction_cache.get_or_compute(f"{field}:{digest}", compute))
+        shared.add_done_callback(lambda t: (budget.release(), t.cancelled() or t.exception()))
+        return await asyncio.shield(shared)
+
+    tasks = {field: asyncio.ensure_future(extract(field)) for field in fields}
+    try:
+        await asyncio.wait(tasks.values(), timeout=time_left())
+    except asyncio.CancelledError:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    values = {}
+    for field, task in tasks.items():
+        if task.done():
+            values[field] = task.result()
+            continue
+        task.cancel()  # only this wait: the shared extraction is shielded and carries on
+        values[field] = EXTRACTION_TOOLS[field][1]
+        if pending is not None:
+            pending.append(field)
+    return values
+
+def build_record(idx: str, conversation: str, notes: str, fields: Dict[str, str]) -> Dict[str, Any]:
+    return {
+        "patient_id": idx,
+        "conversation": conversation,
+        "note": notes,
+        **fields,
+        "updated_at": datetime.now(timezone.utc),
+    }
+
+def index_record(record: Dict[str, Any]) -> None:
+    """
+    Make a just-written record visible to the in-memory indexes right away.
+    Fields missing from *record* (still pending) keep their indexed values.
+    """
+    pid = record["patient_id"]
+    if "keywords" in record:
+        app.state.keyword_index.upsert(pid, record["keywords"])
+    if "prescriptions" in record and "name" in record:
+        app.state.suggest_index.upsert(pid, record["prescriptions"], record["name"])
+    if "timeline" in record:
+        app.state.timeline_index.upsert(pid, record["timeline"])
+    app.state.similarity_index.upsert(pid, record.get("keywords"), record.get("prescriptions"))
+
+def content_hash(notes: str, conversation: str) -> str:
+    return hashlib.sha256(f"{notes}\x00{conversation}".encode("utf-8")).hexdigest()
+
+@app.post("/api/enrich:prefetch")
+async def prefetch_enrichment(request: Request):
+    """
+    Start the extractors for an encounter that is still being reviewed.
+    Results land in the extraction cache under the content hash, so a later
+    /save_record of the same text reuses them (or joins them mid-flight);
+    edited text just misses the cache and is extracted at save time.
+    A prefetch for the same *form* with different text supersedes the
+    previous one, which is cancelled.
+    """
+    data = await request.json()
+    conversation = str(data.get("conversation", "")).strip()
+    notes = str(data.get("notes", "")).strip()
+    form = str(data.get("form", "")).strip()
+    if not (conversation or notes):
+        raise HTTPException(status_code=400, detail="Conversation or notes must be provided")
+
+    digest = content_hash(notes, conversation)
+    speculative = app.state.speculative
+    if form:
+        previous = app.state.speculative_forms.get(form)
+        if previous is not None and previous != digest and previous in speculative:
+            speculative.pop(previous).cancel()
+            metrics.incr("speculative_superseded")
+    if not settings.speculative_enrichment:
+        status = "disabled"
+    elif digest in speculative:
+        status = "running"
+    elif len(speculative) >= settings.speculative_max_in_flight:
+        status = "skipped"
+        metrics.incr("speculative_skipped")
+    else:
+        status = "started"
+        task = asyncio.create_task(enrich_record(f"prefetch-{digest[:12]}", notes, conversation, speculative=True))
+        speculative[digest] = task
+        if form:
+            app.state.speculative_forms[form] = digest
+        task.add_done_callback(lambda t: (
+            speculative.get(digest) is t and speculative.pop(digest),
+            form and app.state.speculative_forms.get(form) == digest and app.state.speculative_forms.pop(form),
+            t.cancelled() or t.exception(),
+        ))
+        metrics.incr("speculative_started")
+    return JSONResponse(content={"key": digest, "status": status}, status_code=202)
+
+async def persist_record(idx: str, notes: str, conversation: str) -> Dict[str, Any]:
+    # All seven extractors run concurrently under the global LLM budget
+    pending: List[str] = []
+    fields = await enrich_record(idx, notes, conversation, pending)
+    # Pending fields are left out, so a re-save does not overwrite good
+    # values with fallbacks; a new record gets the fallbacks until completed
+    record = build_record(idx, conversation, notes, {f: v for f, v in fields.items() if f not in pending})
+    record["pending_fields"] = pending
+
+    # Save to MongoDB
+    inserted = await app.state.repo.upsert_conversation(record, defaults={f: fields[f] for f in pending})
+
+    print(f"[MONGODB] Record saved for patient_id: {idx}, Inserted: {inserted}")
+    index_record(record)
+
+    # A newer save supersedes the background completion of an older one
+    previous = app.state.completions.pop(idx, None)
+    if previous is not None:
+        previous.cancel()
+    if pending:
+        print(f"[SAVE_RECORD] Deadline reached for patient_id: {idx}; pending fields: {pending}")
+        metrics.incr("save_fields_pending", len(pending))
+        with no_deadline():
+            task = asyncio.create_task(complete_pending_fields(record, pending))
+        app.state.completions[idx] = task
+        task.add_done_callback(lambda t: app.state.completions.get(idx) is t and app.state.completions.pop(idx))
+    return {"message": f"Record saved successfully for patient {idx}", "pending_fields": pending}
+
+async def complete_pending_fields(record: Dict[str, Any], pending: List[str]) -> None:
+    """Finish the extractor fields a deadline-bound save left pending and write them to the record."""
+    idx = record["patient_id"]
+    try:
+        fields = await enrich_record(idx, record["note"], record["conversation"], fields=pending)
+        await app.state.repo.set_fields(idx, {**fields, "pending_fields": []})
+        index_record({**record, **fields})
+        metrics.incr("save_fields_completed", len(pending))
+        print(f"[SAVE_RECORD] Pending fields completed for patient_id: {idx}: {pending}")
+    except Exception as e:
+        print(f"[SAVE_RECORD ERROR] Could not complete pending fields for patient_id: {idx}: {e}")
+
 @app.post("/save_record")
 async def save_record(request: Request):
     try:
@@ -184,95 +718,30 @@ async def save_record(request: Request):
         print(f"[SAVE_RECORD INPUT] Full notes length: {len(notes)}")
         print(f"[SAVE_RECORD INPUT] Full conversation length: {len(conversation)}")
 
-        payload = {"data": {"note": notes, "conversation": conversation}}
-
-        # Timeline (paragraph)
-        try:
-            timeline_result = await app.state.client.call_tool("patient_timeline", payload)
-            timeline = timeline_result.content[0].text if isinstance(timeline_result, CallToolResult) and timeline_result.content else ""
-            print(f"[MCP TOOL OUTPUT] patient_timeline for patient_id: {idx}\n{timeline}")
-        except Exception as e:
-            print(f"[MCP TOOL ERROR] patient_timeline failed for patient_id: {idx}: {str(e)}")
-            timeline = ""
-
-        # Keywords (plain string)
-        try:
-            keywords_result = await app.state.client.call_tool("patient_keywords", payload)
-            keywords = keywords_result.content[0].text if isinstance(keywords_result, CallToolResult) and keywords_result.content else ""
-            print(f"[MCP TOOL OUTPUT] patient_keywords for patient_id: {idx}\n{keywords}")
-        except Exception as e:
-            print(f"[MCP TOOL ERROR] patient_keywords failed for patient_id: {idx}: {str(e)}")
-            keywords = ""
-
-        # Prescriptions (plain string)
-        try:
-            prescriptions_result = await app.state.client.call_tool("patient_prescriptions", payload)
-            prescriptions = prescriptions_result.content[0].text if isinstance(prescriptions_result, CallToolResult) and prescriptions_result.content else ""
-            print(f"[MCP TOOL OUTPUT] patient_prescriptions for patient_id: {idx}\n{prescriptions}")
-        except Exception as e:
-            print(f"[MCP TOOL ERROR] patient_prescriptions failed for patient_id: {idx}: {str(e)}")
-            prescriptions = ""
-
-        # Summary (paragraph)
-        try:
-            summary_result = await app.state.client.call_tool("patient_summary", payload)
-            summary = summary_result.content[0].text if isinstance(summary_result, CallToolResult) and summary_result.content else ""
-            print(f"[MCP TOOL OUTPUT] patient_summary for patient_id: {idx}\n{summary}")
-        except Exception as e:
-            print(f"[MCP TOOL ERROR] patient_summary failed for patient_id: {idx}: {str(e)}")
-            summary = ""
-
-        # Name
-        try:
-            name_result = await app.state.client.call_tool("patient_name", payload)
-            name = name_result.content[0].text if isinstance(name_result, CallToolResult) and name_result.content else "NA"
-            print(f"[MCP TOOL OUTPUT] patient_name for patient_id: {idx}\n{name}")
-        except Exception as e:
-            print(f"[MCP TOOL ERROR] patient_name failed for patient_id: {idx}: {str(e)}")
-            name = "NA"
-
-        # Age
-        try:
-            age_result = await app.state.client.call_tool("patient_age", payload)
-            age = age_result.content[0].text if isinstance(age_result, CallToolResult) and age_result.content else "NA"
-            print(f"[MCP TOOL OUTPUT] patient_age for patient_id: {idx}\n{age}")
-        except Exception as e:
-            print(f"[MCP TOOL ERROR] patient_age failed for patient_id: {idx}: {str(e)}")
-            age = "NA"
-
-        # Gender
-        try:
-            gender_result = await app.state.client.call_tool("patient_gender", payload)
-            gender = gender_result.content[0].text if isinstance(gender_result, CallToolResult) and gender_result.content else "NA"
-            print(f"[MCP TOOL OUTPUT] patient_gender for patient_id: {idx}\n{gender}")
-        except Exception as e:
-            print(f"[MCP TOOL ERROR] patient_gender failed for patient_id: {idx}: {str(e)}")
-            gender = "NA"
-
-        # Create the record to store in MongoDB
-        record = {
-            "patient_id": idx,
-            "conversation": conversation,
-            "note": notes,
-            "summary": summary,
-            "timeline": timeline,
-            "keywords": keywords,
-            "prescriptions": prescriptions,
-            "name": name,
-            "age": age,
-            "gender": gender
-        }
-
-        # Save to MongoDB
-        result = await app.state.db[settings.mongodb_collection].update_one(
-            {"patient_id": idx},
-            {"$set": record},
-            upsert=True
-        )
-
-        print(f"[MONGODB] Record saved for patient_id: {idx}, Modified: {result.modified_count}, Upserted: {result.upserted_id}")
-
-        return JSONResponse(content={"message": f"Record saved successfully for patient {idx}"}, status_code=200)
+        # A double-submitted save (same idx and content) joins the one in
+        # flight.  With an Idempotency-Key the response is also replayed to
+        # retries – from any worker – for idempotency_ttl_seconds.
+        fingerprint = f"{idx}:{content_hash(notes, conversation)}"
+        idempotency_key = request.headers.get("Idempotency-Key", "").strip()
+        if not idempotency_key:
+            with deadline(settings.save_deadline_seconds):
+                return JSONResponse(content=await app.state.save_flight.do(
+                    fingerprint, lambda: persist_record(idx, notes, conversation)
+                ))
+
+        async def compute():
+            try:
+                content, status = await persist_record(idx, notes, conversation), 200
+            except Exception as e:
+                print(f"[MCP/MONGODB ERROR] Failed to process or save record: {str(e)}")
+                content, status = {"error": f"Failed to save record: {str(e)}"}, 500
+            return {"fingerprint": fingerprint, "status": status, "content": content}, status < 500
+
+        with deadline(settings.save_deadline_seconds):
+            stored = await app.state.idempotency.get_or_compute(idempotency_key, compute)
+        if stored["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        return JSONResponse(content=stored["content"], status_code=stored["status"])
 
     except HTTPException as he:
         raise he
@@ -280,25 +749,129 @@ async def save_record(request: Request):
         print(f"[MCP/MONGODB ERROR] Failed to process or save record: {str(e)}")
         return JSONResponse(content={"error": f"Failed to save record: {str(e)}"}, status_code=500)
 
+@app.post("/api/records:batch")
+async def save_records_batch(request: Request):
+    """
+    Save many encounters in one call.  Per-record status is streamed back as
+    NDJSON; identical inputs are enriched once; enrichment runs concurrently
+    under the global LLM budget, one chunk ahead of the chunk being
+    committed; each chunk is committed with one bulk_write.
+    """
+    data = await request.json()
+    records = data.get("records")
+    if not isinstance(records, list) or not records:
+        raise HTTPException(status_code=400, detail="'records' must be a non-empty list")
+    if len(records) > settings.batch_max_records:
+        raise HTTPException(status_code=413, detail=f"At most {settings.batch_max_records} records per batch")
+    try:
+        chunk_size = min(max(int(data.get("chunk_size", settings.batch_chunk_size)), 1), 500)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="'chunk_size' must be an integer")
+
+    # Validate and dedupe extraction work by content hash
+    valid: List[tuple] = []
+    errors: List[Dict[str, Any]] = []
+    tasks: Dict[str, asyncio.Task] = {}
+    digests: set = set()
+    for position, item in enumerate(records):
+        item = item if isinstance(item, dict) else {}
+        idx = str(item.get("idx", "")).strip()
+        conversation = str(item.get("conversation", "")).strip()
+        notes = str(item.get("notes", "")).strip()
+        if not idx or not (conversation or notes):
+            errors.append({"index": position, "idx": idx, "status": "error",
+                           "error": "Patient ID and conversation or notes are required"})
+            continue
+        digest = content_hash(notes, conversation)
+        deduped = digest in digests
+        digests.add(digest)
+        valid.append((position, idx, conversation, notes, digest, deduped))
+    metrics.incr("batch_records", len(records))
+    metrics.incr("batch_extractions_deduped", len(valid) - len(digests))
+
+    def start(chunk: List[tuple]) -> None:
+        for _, idx, conversation, notes, digest, _ in chunk:
+            if digest not in tasks:
+                tasks[digest] = asyncio.create_task(enrich_record(idx, notes, conversation))
+
+    async def body():
+        saved, failed = 0, len(errors)
+        try:
+            for status in errors:
+                yield json.dumps(status) + "\n"
+            start(valid[:chunk_size])
+            for offset in range(0, len(valid), chunk_size):
+                chunk = valid[offset:offset + chunk_size]
+                start(valid[offset + chunk_size:offset + 2 * chunk_size])
+                built = []
+                for position, idx, conversation, notes, digest, deduped in chunk:
+                    fields = await tasks[digest]
+                    built.append((position, idx, deduped, build_record(idx, conversation, notes, fields)))
+                try:
+                    counts = await app.state.repo.upsert_many_conversations([r for *_, r in built])
+                    chunk_error = (set(counts["failed"]), "write failed") if counts["failed"] else None
+                except Exception as e:
+                    chunk_error = ({idx for _, idx, _, _ in built}, str(e))
+                for position, idx, deduped, record in built:
+                    if chunk_error and idx in chunk_error[0]:
+                        failed += 1
+                        yield json.dumps({"index": position, "idx": idx, "status": "error", "error": chunk_error[1]}) + "\n"
+                        continue
+                    saved += 1
+                    index_record(record)
+                    yield json.dumps({"index": position, "idx": idx, "status": "saved", "deduped": deduped}) + "\n"
+                print(f"[BATCH SAVE] Committed chunk of {len(built)} records")
+            yield json.dumps({"summary": {
+                "received": len(records),
+                "saved": saved,
+                "failed": failed,
+                "unique_extractions": len(digests),
+            }}) + "\n"
+        finally:
+            # Client went away mid-stream: later chunks were never started;
+            # extractions already running are shared through the extraction
+            # cache and finish there (a retry of the batch reuses them), so
+            # this only stops waiting for them
+            for task in tasks.values():
+                task.cancel()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+@app.get("/api/metrics")
+async def get_metrics():
+    snapshot = metrics.snapshot()
+    snapshot["single_flight"] = {
+        "search": app.state.search_flight.stats(),
+        "save": app.state.save_flight.stats(),
+        "extract": app.state.extraction_cache.flight.stats(),
+        "idempotency": app.state.idempotency.flight.stats(),
+    }
+    snapshot["hedging"] = {name: h.stats() for name, h in sorted(app.state.hedgers.items())}
+    if app.state.readiness["extractors"] == "ready":
+        try:
+            snapshot["extractors"] = await app.state.extractors.stats()
+        except Exception as e:
+            print(f"[METRICS ERROR] extractor stats: {e}")
+    return JSONResponse(content=jsonable_encoder(snapshot))
+
 @app.get("/api/patient/{patient_id}")
 async def get_patient_data(patient_id: str):
     try:
-        rec = await app.state.db[settings.mongodb_collection].find_one(
-            {"patient_id": str(patient_id)},
-            {"_id": 0, "note": 1, "summary": 1, "prescriptions": 1, "timeline": 1, "keywords": 1, "name": 1, "age": 1, "gender": 1}
-        )
+        reader = app.state.repo.reader("patient")
+        rec, body = await asyncio.gather(reader.get_conversation(patient_id, PatientRecord), reader.get_body(patient_id))
         if rec is None:
             raise HTTPException(status_code=404, detail="Patient not found")
 
         data = {
-            "note": rec.get("note", ""),
+            "note": (body or {}).get("note", ""),
             "summary": rec.get("summary", ""),
             "prescriptions": rec.get("prescriptions", ""),
             "timeline": rec.get("timeline", ""),
             "keywords": rec.get("keywords", ""),
             "name": rec.get("name", "N/A"),
             "age": rec.get("age", "N/A"),
-            "gender": rec.get("gender", "N/A")
+            "gender": rec.get("gender", "N/A"),
+            "pending_fields": rec.get("pending_fields", []),
         }
 
         return JSONResponse(content=data)
@@ -308,6 +881,34 @@ async def get_patient_data(patient_id: str):
         print(f"[MONGODB ERROR] Failed to fetch patient data: {e}")
         return JSONResponse(content={"error": f"Failed to fetch patient data: {str(e)}"}, status_code=500)
 
+@app.get("/api/patient/{patient_id}/body")
+async def get_patient_body(patient_id: str):
+    """Raw conversation and note, decompressed on demand for the editor view."""
+    body = await app.state.repo.reader("patient").get_body(patient_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return JSONResponse(content=body)
+
+@app.get("/api/patient/{patient_id}/similar")
+async def similar_patients(patient_id: str, k: int = 10):
+    """
+    Clinically similar patients: nearest neighbours by keywords and drugs
+    from the in-memory MinHash/LSH index (no LLM), with the estimated
+    Jaccard similarity and the shared terms, plus each match's summary fields.
+    """
+    started = time.perf_counter()
+    similar = app.state.similarity_index.similar(patient_id, k=min(max(k, 1), 50))
+    if similar is None:
+        raise HTTPException(status_code=404, detail="Patient not found or has no keywords or prescriptions")
+    took_ms = (time.perf_counter() - started) * 1000
+    records = await app.state.repo.reader("list").get_by_patient_ids([s["patient_id"] for s in similar], SearchResult)
+    by_id = {r["patient_id"]: r for r in records}
+    return JSONResponse(content={
+        "patient_id": patient_id,
+        "results": [{**by_id.get(s["patient_id"], {}), **s} for s in similar],
+        "took_ms": round(took_ms, 3),
+    })
+
 @app.patch("/patient/{patient_id}/summary")
 async def update_patient_summary(patient_id: str, request: Request):
     try:
@@ -316,12 +917,7 @@ async def update_patient_summary(patient_id: str, request: Request):
         if not isinstance(summary, str):
             raise HTTPException(status_code=400, detail="Summary must be a string")
 
-        result = await app.state.db[settings.mongodb_collection].update_one(
-            {"patient_id": str(patient_id)},
-            {"$set": {"summary": summary}}
-        )
-
-        if result.matched_count == 0:
+        if not await app.state.repo.set_fields(patient_id, {"summary": summary}):
             raise HTTPException(status_code=404, detail="Patient not found")
 
         print(f"[MONGODB] Updated summary for patient_id: {patient_id}")
@@ -340,15 +936,11 @@ async def update_patient_timeline(patient_id: str, request: Request):
         if not isinstance(timeline, str):
             raise HTTPException(status_code=400, detail="Timeline must be a string")
 
-        result = await app.state.db[settings.mongodb_collection].update_one(
-            {"patient_id": str(patient_id)},
-            {"$set": {"timeline": timeline}}
-        )
-
-        if result.matched_count == 0:
+        if not await app.state.repo.set_fields(patient_id, {"timeline": timeline}):
             raise HTTPException(status_code=404, detail="Patient not found")
 
         print(f"[MONGODB] Updated timeline for patient_id: {patient_id}")
+        app.state.timeline_index.upsert(str(patient_id), timeline)
         return JSONResponse(content={"message": f"Timeline updated successfully for patient {patient_id}"}, status_code=200)
     except HTTPException as he:
         raise he
@@ -356,6 +948,68 @@ async def update_patient_timeline(patient_id: str, request: Request):
         print(f"[MONGODB ERROR] Failed to update timeline: {e}")
         return JSONResponse(content={"error": f"Failed to update timeline: {str(e)}"}, status_code=500)
 
+REGENERABLE_FIELDS = ("summary", "timeline")
+
+def sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/patient/{patient_id}/{field}:regenerate")
+async def regenerate_field(patient_id: str, field: str):
+    """
+    Re-run the summary or timeline extractor for a saved patient, streaming
+    the text as Server-Sent Events while it is generated: `token` events
+    with each new piece, then `done` with the full text once it has been
+    persisted (or `error`).  The stored value only changes when generation
+    completes; a client that disconnects mid-stream leaves it untouched.
+    Token-level streaming needs the in-process extractor backend – over MCP
+    the whole text arrives as one `token` event.
+    """
+    if field not in REGENERABLE_FIELDS:
+        raise HTTPException(status_code=404, detail=f"Only {', '.join(REGENERABLE_FIELDS)} can be regenerated")
+    body = await app.state.repo.reader("patient").get_body(patient_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    tool, _ = EXTRACTION_TOOLS[field]
+    payload = {"data": {"note": body.get("note", ""), "conversation": body.get("conversation", "")}}
+
+    async def events():
+        started = time.perf_counter()
+        first_token_ms = None
+        pieces: List[str] = []
+        try:
+            await wait_for_component("extractors")
+            async with app.state.llm_budget:
+                if app.state.llm_rate_limit is not None:
+                    await app.state.llm_rate_limit.acquire()
+                async for piece in app.state.extractors.stream(tool, payload):
+                    if first_token_ms is None:
+                        first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                        metrics.set("regenerate_last_first_token_ms", first_token_ms)
+                    pieces.append(piece)
+                    yield sse("token", {"text": piece})
+            text = "".join(pieces).strip()
+            if not text:
+                raise RuntimeError("the extractor returned no text")
+            if not await app.state.repo.set_fields(patient_id, {field: text}):
+                raise RuntimeError("Patient not found")
+            if field == "timeline":
+                app.state.timeline_index.upsert(patient_id, text)
+        except Exception as e:
+            print(f"[REGENERATE ERROR] {field} failed for patient_id: {patient_id}: {e}")
+            metrics.incr("regenerate_errors")
+            yield sse("error", {"error": f"Failed to regenerate {field}: {e}"})
+            return
+        total_ms = round((time.perf_counter() - started) * 1000, 1)
+        metrics.incr("regenerate_completed")
+        print(f"[MONGODB] Regenerated {field} for patient_id: {patient_id} (first token {first_token_ms} ms, total {total_ms} ms)")
+        yield sse("done", {"field": field, "text": text, "first_token_ms": first_token_ms, "total_ms": total_ms})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.patch("/patient/{patient_id}/prescriptions")
 async def update_patient_prescriptions(patient_id: str, request: Request):
     try:
@@ -364,15 +1018,12 @@ async def update_patient_prescriptions(patient_id: str, request: Request):
         if not isinstance(prescriptions, str):
             raise HTTPException(status_code=400, detail="Prescriptions must be a string")
 
-        result = await app.state.db[settings.mongodb_collection].update_one(
-            {"patient_id": str(patient_id)},
-            {"$set": {"prescriptions": prescriptions}}
-        )
-
-        if result.matched_count == 0:
+        if not await app.state.repo.set_fields(patient_id, {"prescriptions": prescriptions}):
             raise HTTPException(status_code=404, detail="Patient not found")
 
         print(f"[MONGODB] Updated prescriptions for patient_id: {patient_id}")
+        app.state.suggest_index.sources["drug"].upsert(str(patient_id), parse_drug_names(prescriptions))
+        app.state.similarity_index.upsert(str(patient_id), prescriptions=prescriptions)
         return JSONResponse(content={"message": f"Prescriptions updated successfully for patient {patient_id}"}, status_code=200)
     except HTTPException as he:
         raise he
@@ -387,70 +1038,224 @@ async def update_patient_keywords(patient_id: str, request: Request):
         if not isinstance(keywords, str):
             raise HTTPException(status_code=400, detail="Keywords must be a string")
 
-        result = await app.state.db[settings.mongodb_collection].update_one(
-            {"patient_id": str(patient_id)},
-            {"$set": {"keywords": keywords}}
-        )
-
-        if result.matched_count == 0:
+        if not await app.state.repo.set_fields(patient_id, {"keywords": keywords}):
             raise HTTPException(status_code=404, detail="Patient not found")
 
         print(f"[MONGODB] Updated keywords for patient_id: {patient_id}")
+        app.state.keyword_index.upsert(str(patient_id), keywords)
+        app.state.similarity_index.upsert(str(patient_id), keywords=keywords)
         return JSONResponse(content={"message": f"Keywords updated successfully for patient {patient_id}"}, status_code=200)
     except HTTPException as he:
         raise he
     except Exception as e:
         print(f"[MONGODB ERROR] Failed to update keywords: {e}")
         return JSONResponse(content={"error": f"Failed to update keywords: {str(e)}"}, status_code=500)
+
+@app.get("/api/keywords/lookup")
+async def keyword_lookup(q: str, mode: str = "and", prefix: bool = False, limit: int = 100):
+    """Exact (or prefix) keyword lookup; comma-separated terms combine with AND/OR."""
+    if mode not in ("and", "or"):
+        raise HTTPException(status_code=400, detail="mode must be 'and' or 'or'")
+    terms = [t for t in q.split(",") if t.strip()]
+    if not terms:
+        raise HTTPException(status_code=400, detail="At least one term is required")
+    started = time.perf_counter()
+    patient_ids = app.state.keyword_index.query(terms, mode=mode, prefix=prefix)
+    took_ms = (time.perf_counter() - started) * 1000
+    return JSONResponse(content={
+        "terms": terms,
+        "mode": mode,
+        "total": len(patient_ids),
+        "patient_ids": heapq.nsmallest(limit, patient_ids),
+        "took_ms": round(took_ms, 3),
+    })
+
+@app.get("/api/keywords/facets")
+async def keyword_facets(top: int = 50):
+    """Most frequent keywords across all patients, e.g. the top 50 conditions."""
+    facets = app.state.keyword_index.facets(top=top)
+    return JSONResponse(content={
+        "facets": [{"term": term, "count": count} for term, count in facets],
+        **app.state.keyword_index.stats(),
+    })
+
+TIMELINE_PATTERNS = ("sequence", "cooccurrence")
+
+@app.post("/api/timeline/query")
+async def timeline_query(request: Request):
+    """
+    Cross-patient temporal patterns over the extracted timelines, answered
+    from the in-memory event index (no LLM).  Body:
+      {"pattern": "sequence" | "cooccurrence",
+       "steps": ["type:surgery", "type:readmission"],   # a step may be a list: all in one event
+       "max_gap": 3,     # sequence: consecutive steps at most this many positions apart (1 = adjacent)
+       "window": 5,      # cooccurrence: all steps within this many consecutive events
+       "limit": 50}
+    Each returned patient comes with the events that matched, one per step.
+    """
+    data = await request.json()
+    pattern = data.get("pattern", "sequence")
+    steps = data.get("steps")
+    if pattern not in TIMELINE_PATTERNS:
+        raise HTTPException(status_code=400, detail=f"pattern must be one of {', '.join(TIMELINE_PATTERNS)}")
+    if not isinstance(steps, list) or not 1 <= len(steps) <= 8 or not all(
+        isinstance(step, str) or (isinstance(step, list) and step and all(isinstance(x, str) for x in step))
+        for step in steps
+    ):
+        raise HTTPException(status_code=400, detail="'steps' must be a list of 1 to 8 terms (or lists of terms)")
+    bound = data.get("max_gap" if pattern == "sequence" else "window")
+    if bound is not None and (not isinstance(bound, int) or not 1 <= bound <= 64):
+        raise HTTPException(status_code=400, detail="max_gap / window must be an integer between 1 and 64")
+    limit = min(max(int(data.get("limit", 50)), 1), 500)
+
+    index = app.state.timeline_index
+    started = time.perf_counter()
+    try:
+        if pattern == "sequence":
+            matches = index.sequence(steps, max_gap=bound)
+        else:
+            matches = index.cooccurrence(steps, window=bound)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    patient_ids = heapq.nsmallest(limit, matches.patient_ids)
+    results = [{"patient_id": pid, "events": matches.events(pid)} for pid in patient_ids]
+    took_ms = (time.perf_counter() - started) * 1000
+    return JSONResponse(content={
+        "pattern": pattern,
+        "steps": steps,
+        "keys": [index.step_keys(step) for step in steps],
+        "total": len(matches),
+        "results": results,
+        "took_ms": round(took_ms, 3),
+    })
+
+@app.get("/api/timeline/types")
+async def timeline_types():
+    """Event types found in the timelines, with how many patients have each."""
+    return JSONResponse(content={
+        "types": [{"type": t, "patients": n} for t, n in app.state.timeline_index.type_counts()],
+        **app.state.timeline_index.stats(),
+    })
+
+@app.get("/api/vocabulary/expand")
+async def vocabulary_expand(q: str):
+    """Local synonym expansion of a query: the terms `/api/search` would use without the LLM."""
+    started = time.perf_counter()
+    matches = app.state.vocabulary.scan(q)
+    expanded = app.state.vocabulary.expand(q)
+    took_ms = (time.perf_counter() - started) * 1000
+    return JSONResponse(content={
+        "q": q,
+        "matches": [{"term": m.surface, "canonical": m.canonical} for m in matches],
+        "structure": expanded,
+        "took_ms": round(took_ms, 3),
+        **app.state.vocabulary.stats(),
+    })
+
+@app.get("/api/export")
+async def export_cohort(
+    keywords: str = "",
+    mode: str = "and",
+    format: str = "ndjson",
+    fields: str | None = None,
+    compression: str = "none",
+    batch_size: int = 1000,
+):
+    """Stream every patient matching *keywords* as NDJSON, CSV or Parquet with constant memory."""
+    try:
+        field_list = parse_fields(fields)
+        exporter = CohortExporter(format, field_list, compression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    batch_size = min(max(batch_size, 1), 10000)
+    reader = app.state.repo.reader("export")
+    # conversation/note come from the bodies collection, joined per batch
+    wants_bodies = [f for f in field_list if f in BODY_FIELDS]
+    cursor = reader.iter_conversations(
+        cohort_filter(keywords.split(","), mode),
+        cohort_projection([f for f in field_list if f not in BODY_FIELDS] + ["patient_id"]),
+        batch_size=batch_size,
+    )
+
+    async def encode(batch: List[Dict[str, Any]]) -> bytes:
+        if wants_bodies and batch:
+            bodies = await reader.get_bodies([d["patient_id"] for d in batch])
+            for doc in batch:
+                doc.update(bodies.get(doc["patient_id"], {}))
+        # Encoding/compression is CPU work – keep it off the event loop
+        return await asyncio.to_thread(exporter.write, batch)
+
+    async def body():
+        head = exporter.start()
+        if head:
+            yield head
+        batch: List[Dict[str, Any]] = []
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                chunk = await encode(batch)
+                batch = []
+                if chunk:
+                    yield chunk
+        chunk = await encode(batch)
+        if chunk:
+            yield chunk
+        tail = await asyncio.to_thread(exporter.finish)
+        if tail:
+            yield tail
+        print(f"[EXPORT] Streamed {exporter.rows} records as {format} ({compression})")
+
+    return StreamingResponse(
+        body(),
+        media_type=exporter.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{exporter.filename}"'},
+    )
+
 @app.get("/update-patients", include_in_schema=False)
-async def serve_update_patients_page():
-    return FileResponse(frontend_dir / "updatepatients.html")
+async def serve_update_patients_page(request: Request):
+    return assets.page("updatepatients.html", request)
 
 @app.get("/update-patient/{patient_id}", include_in_schema=False)
-async def serve_update_patient_detail_page(patient_id: str):
-    return FileResponse(frontend_dir / "updatepatient.html")
+async def serve_update_patient_detail_page(patient_id: str, request: Request):
+    return assets.page("updatepatient.html", request)
 
 @app.get("/patients", include_in_schema=False)
-async def serve_patients_page():
-    return FileResponse(frontend_dir / "patients.html")
+async def serve_patients_page(request: Request):
+    return assets.page("patients.html", request)
 # Add this to your main.py - Semantic Search Backend
 
 # Add this to your main.py - Semantic Search Backend
 
 @app.get("/semantic-search", include_in_schema=False)
-async def serve_semantic_search_page():
-    return FileResponse(frontend_dir / "semantic-search.html")
+async def serve_semantic_search_page(request: Request):
+    return assets.page("semantic-search.html", request)
+
+@app.get("/api/suggest")
+async def suggest(q: str = "", limit: int = 10):
+    """Autocomplete over keywords, drug names and patient names, with match counts."""
+    started = time.perf_counter()
+    suggestions = app.state.suggest_index.suggest(q, limit=min(max(limit, 1), 50))
+    took_ms = (time.perf_counter() - started) * 1000
+    return JSONResponse(content={"q": q, "suggestions": suggestions, "took_ms": round(took_ms, 3)})
 
 @app.post("/api/search")
 async def semantic_search(request: Request):
     try:
         data = await request.json()
         query = data.get("query", "").strip()
-        
+        suggestion = data.get("suggestion")
+
+        # A picked autocomplete suggestion is an exact, indexed match – no LLM needed
+        if isinstance(suggestion, dict) and suggestion.get("kind") and suggestion.get("term"):
+            return JSONResponse(content=await exact_search(suggestion["kind"], suggestion["term"], query))
+
         if not query:
             raise HTTPException(status_code=400, detail="Query is required")
         
-        print(f"[SEMANTIC SEARCH] Query: {query}")
-        
-        # Step 1: Use Gemini to analyze the query and extract medical concepts
-        search_structure = await extract_structured_search_terms(query)
-        print(f"[SEMANTIC SEARCH] Extracted structure: {search_structure}")
-        
-        # Step 2: Use extracted medical concepts to search MongoDB
-        patients = await search_patient_records(search_structure)
-        print(f"[SEMANTIC SEARCH] Found {len(patients)} patients")
-        
-        # Step 3: Use Gemini to rank results by clinical relevance
-        ranked_results = await rank_search_results(query, search_structure, patients)
-        
-        # Return top results
-        top_results = ranked_results[:5]
-        
-        return JSONResponse(content={
-            "results": top_results,
-            "total_found": len(patients),
-            "query": query
-        })
+        # Identical queries in flight at the same time share one pipeline run
+        with deadline(settings.search_deadline_seconds):
+            content = await app.state.search_flight.do(normalize_term(query), lambda: run_semantic_search(query))
+        return JSONResponse(content=content)
         
     except Exception as e:
         print(f"[SEMANTIC SEARCH ERROR] {e}")
@@ -461,8 +1266,54 @@ async def semantic_search(request: Request):
             status_code=500
         )
 
-async def extract_structured_search_terms(query: str) -> Dict[str, Any]:
-    """Use Gemini to extract detailed structured search terms from natural language query"""
+async def run_semantic_search(query: str) -> Dict[str, Any]:
+    print(f"[SEMANTIC SEARCH] Query: {query}")
+
+    # Stages that ran out of time and answered with their fallback
+    degraded: List[str] = []
+
+    # Step 1: Use Gemini to analyze the query and extract medical concepts
+    search_structure = await extract_structured_search_terms(query, degraded)
+    print(f"[SEMANTIC SEARCH] Extracted structure: {search_structure}")
+
+    # Step 2: Use extracted medical concepts to search MongoDB
+    patients = await search_patient_records(search_structure)
+    print(f"[SEMANTIC SEARCH] Found {len(patients)} patients")
+
+    # Step 3: Use Gemini to rank results by clinical relevance (skipped when out of time)
+    ranked_results = await rank_search_results(query, search_structure, patients, degraded)
+
+    # Return top results
+    return {
+        "results": ranked_results[:5],
+        "total_found": len(patients),
+        "query": query,
+        "degraded": degraded,
+    }
+
+async def exact_search(kind: str, term: str, query: str = "", limit: int = 20) -> Dict[str, Any]:
+    """Resolve a suggestion through the in-memory indexes, then fetch by patient_id."""
+    if kind not in SuggestIndex.KINDS:
+        raise HTTPException(status_code=400, detail=f"Unknown suggestion kind: {kind}")
+    patient_ids = app.state.suggest_index.patients(kind, term)
+    print(f"[EXACT SEARCH] {kind}={term!r} → {len(patient_ids)} patients")
+    wanted = heapq.nsmallest(limit, patient_ids)
+    patients = await app.state.repo.reader("list").get_by_patient_ids(wanted, SearchResult)
+    for patient in patients:
+        patient["relevance_score"] = 100
+        patient["relevance_reason"] = f"Exact {kind} match"
+    return {"results": patients, "total_found": len(patient_ids), "query": query or term}
+
+async def extract_structured_search_terms(query: str, degraded: List[str] | None = None) -> Dict[str, Any]:
+    """
+    Structured search terms for a natural language query: local vocabulary first, Gemini if it finds nothing.
+    Gemini gets half the remaining deadline, leaving the rest for the scan and the rerank.
+    """
+    local = app.state.vocabulary.expand(query)
+    if local is not None:
+        metrics.incr("search_terms_vocabulary")
+        return local
+    metrics.incr("search_terms_llm")
     try:
         prompt = f"""
 You are a clinical search expert. Analyze this search query and extract structured search terms for finding relevant patient records in a medical database. Your task is to convert any natural language descriptions into proper medical terminology.
@@ -483,17 +1334,7 @@ For example, convert descriptions of symptoms into likely medical diagnoses.
 Return valid JSON only:
 """
         
-        model = genai.GenerativeModel("models/gemini-2.0-flash")
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.GenerationConfig(
-                temperature=0.1,
-                response_mime_type="application/json",
-                max_output_tokens=1200
-            )
-        )
-        
-        result = json.loads(response.text.strip())
+        result = await generate_json("search_terms", prompt, temperature=0.1, max_output_tokens=1200, share=0.5)
         
         # Add query as fallback
         if "original_query" not in result:
@@ -503,6 +1344,8 @@ Return valid JSON only:
         
     except Exception as e:
         print(f"[EXTRACT STRUCTURED TERMS ERROR] {e}")
+        if isinstance(e, DeadlineExceeded) and degraded is not None:
+            degraded.append("search_terms")
         # Minimal fallback with just original query
         return {
             "required_terms": [],
@@ -514,6 +1357,7 @@ Return valid JSON only:
             "original_query": query
         }
         
+        genai = gemini()
         model = genai.GenerativeModel("models/gemini-2.0-flash")
         response = model.generate_content(
             prompt,
@@ -568,11 +1412,17 @@ async def search_patient_records(search_structure: Dict[str, Any]) -> List[Dict]
         # Prioritize the keywords field for searching
         query_conditions = []
         
-        # Create an $or query with each term
-        for term in all_search_terms:
-            if term and len(term) > 2:  # Skip very short terms
-                # Prioritize keywords field
-                query_conditions.append({"keywords": {"$regex": f"{term}", "$options": "i"}})
+        if search_structure.get("patterns"):
+            # Vocabulary expansion: escaped whole-word patterns, so a synonym
+            # never matches inside another word ("mi" in "vitamin")
+            for pattern in search_structure["patterns"]:
+                query_conditions.append({"keywords": {"$regex": pattern, "$options": "i"}})
+        else:
+            # Create an $or query with each term
+            for term in all_search_terms:
+                if term and len(term) > 2:  # Skip very short terms
+                    # Prioritize keywords field
+                    query_conditions.append({"keywords": {"$regex": f"{term}", "$options": "i"}})
         
         # If no terms were extracted, use the original query
         if not query_conditions and search_structure.get("medical_context"):
@@ -612,22 +1462,7 @@ async def search_patient_records(search_structure: Dict[str, Any]) -> List[Dict]
         print(f"[SEARCH DEBUG] MongoDB query: {final_query}")
         
         # Execute MongoDB query with field projections
-        cursor = app.state.db[settings.mongodb_collection].find(
-            final_query,
-            {
-                "_id": 0,
-                "patient_id": 1,
-                "name": 1,
-                "age": 1,
-                "gender": 1,
-                "summary": 1,
-                "keywords": 1,
-                "prescriptions": 1,
-                "timeline": 1
-            }
-        ).limit(20)
-        
-        patients = await cursor.to_list(length=20)
+        patients = await app.state.repo.reader("search").get_conversations(final_query, limit=20, sort_by=None, shape=SearchResult)
         print(f"[SEARCH DEBUG] Found {len(patients)} patients")
         
         return patients
@@ -661,8 +1496,10 @@ def build_term_condition(term: str) -> Dict:
         {"conversation": {"$regex": word_boundary_term, "$options": "i"}}
     ]}
 
-async def rank_search_results(original_query: str, search_structure: Dict, patients: List[Dict]) -> List[Dict]:
-    """Use Gemini to rank search results by clinical relevance"""
+async def rank_search_results(
+    original_query: str, search_structure: Dict, patients: List[Dict], degraded: List[str] | None = None
+) -> List[Dict]:
+    """Use Gemini to rank search results by clinical relevance; basic ranking when out of time"""
     try:
         if not patients:
             return []
@@ -729,17 +1566,7 @@ Scoring criteria:
 Include "patient_index" (0-based) in your response to identify each patient.
 """
         
-        model = genai.GenerativeModel("models/gemini-2.0-flash")
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.GenerationConfig(
-                temperature=0.2,
-                response_mime_type="application/json",
-                max_output_tokens=1500
-            )
-        )
-        
-        rankings = json.loads(response.text.strip())
+        rankings = await generate_json("search_rank", prompt, temperature=0.2, max_output_tokens=1500)
         
         # Apply Gemini rankings to patients
         if len(rankings) == len(patients):
@@ -767,15 +1594,23 @@ Include "patient_index" (0-based) in your response to identify each patient.
         
         return relevant_patients
         
+    except DeadlineExceeded as e:
+        print(f"[RANKING] Skipped: {e}")
+        if degraded is not None:
+            degraded.append("rerank")
+        return basic_ranking(patients)
+
     except Exception as e:
         print(f"[RANKING ERROR] {e}")
         import traceback
         traceback.print_exc()
-        
-        # Basic scoring if Gemini fails
-        for i, patient in enumerate(patients):
-            score = max(85 - i * 5, 40)
-            patient["relevance_score"] = score
-            patient["relevance_reason"] = "Basic relevance ranking"
-        
-        return patients[:5]
\ No newline at end of file
+        return basic_ranking(patients)
+
+def basic_ranking(patients: List[Dict]) -> List[Dict]:
+    """Scores by search order, when Gemini ranking fails or there is no time for it."""
+    for i, patient in enumerate(patients):
+        score = max(85 - i * 5, 40)
+        patient["relevance_score"] = score
+        patient["relevance_reason"] = "Basic relevance ranking"
+    
+    return patients[:5]
\ No newline at end of file
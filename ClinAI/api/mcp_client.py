@@ -24,8 +24,11 @@ class MCPClient:
         self.logger = logger
 
     # ───────────────────────────────────────────────────────────────
-    async def connect_to_server(self, server_script_path: str) -> None:
-        """Spawn the MCP server (Python or Node) and initialise the session."""
+    async def connect_to_server(self, server_script_path: str, list_tools: bool = False) -> None:
+        """
+        Spawn the MCP server (Python or Node) and initialise the session.
+        Listing the tools costs another round-trip, so it is opt-in.
+        """
         try:
             if not server_script_path.endswith((".py", ".js")):
                 raise ValueError("Server script must be .py or .js")
@@ -43,8 +46,11 @@ class MCPClient:
             )
             await self.session.initialize()
 
-            tool_names = [t.name for t in (await self.session.list_tools()).tools]
-            self.logger.info(f"Connected to MCP Server. Tools: {tool_names}")
+            if list_tools:
+                tool_names = [t.name for t in (await self.session.list_tools()).tools]
+                self.logger.info(f"Connected to MCP Server. Tools: {tool_names}")
+            else:
+                self.logger.info("Connected to MCP Server")
 
         except Exception as exc:
             self.logger.error(f"Error connecting to MCP server: {exc}")
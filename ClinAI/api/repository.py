@@ -0,0 +1,393 @@
+# api/repository.py
+from __future__ import annotations
+
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Type, TypedDict
+
+import pymongo
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+from bodies import BODY_FIELDS, decode_body, encode_body, resolve_codec, split_record
+from utils.logger import logger
+
+
+# ───────────────────────────────────────────────────────────────
+# Typed projections – each shape doubles as the Mongo projection
+# ───────────────────────────────────────────────────────────────
+class PatientDetails(TypedDict, total=False):
+    summary: str
+    keywords: str
+    name: str
+    age: str
+    gender: str
+
+
+class PatientRecord(TypedDict, total=False):
+    summary: str
+    prescriptions: str
+    timeline: str
+    keywords: str
+    name: str
+    age: str
+    gender: str
+    pending_fields: List[str]  # extractor fields a deadline-bound save is still completing
+
+
+class SearchResult(TypedDict, total=False):
+    patient_id: str
+    name: str
+    age: str
+    gender: str
+    summary: str
+    keywords: str
+    prescriptions: str
+    timeline: str
+
+
+def projection(shape: Type[Any] | None) -> Dict[str, int]:
+    """Mongo projection for a TypedDict shape; `None` means the full document."""
+    fields = {"_id": 0}
+    if shape is not None:
+        fields.update({f: 1 for f in shape.__annotations__})
+    return fields
+
+
+def client_options(
+    *,
+    max_pool_size: int = 100,
+    min_pool_size: int = 0,
+    max_idle_time_ms: int | None = None,
+    connect_timeout_ms: int | None = None,
+    server_selection_timeout_ms: int | None = None,
+    socket_timeout_ms: int | None = None,
+    wait_queue_timeout_ms: int | None = None,
+    read_preference: str = "primary",
+    app_name: str = "clinai-api",
+) -> Dict[str, Any]:
+    """Keyword arguments for the one shared `AsyncIOMotorClient`; unset timeouts keep driver defaults."""
+    options = {
+        "maxPoolSize": max_pool_size,
+        "minPoolSize": min_pool_size,
+        "maxIdleTimeMS": max_idle_time_ms,
+        "connectTimeoutMS": connect_timeout_ms,
+        "serverSelectionTimeoutMS": server_selection_timeout_ms,
+        "socketTimeoutMS": socket_timeout_ms,
+        "waitQueueTimeoutMS": wait_queue_timeout_ms,
+        "readPreference": read_preference,
+        "appname": app_name,
+    }
+    return {k: v for k, v in options.items() if v is not None}
+
+
+_READ_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def read_preference(mode: str, max_staleness_seconds: int = -1) -> Any:
+    """pymongo read preference for *mode*; staleness bounds secondaries (MongoDB requires ≥ 90 s)."""
+    if mode not in _READ_MODES:
+        raise ValueError(f"Unknown read preference: {mode}")
+    if mode == "primary":
+        return Primary()
+    return _READ_MODES[mode](max_staleness=max_staleness_seconds)
+
+
+class AsyncMongoDBHelper:
+    """
+    Async counterpart of `helper_mongo.MongoDBHelper` for the API.
+
+    Wraps one collection of a Motor client owned by the caller, so every
+    handler shares a single connection pool.  Index creation is a separate
+    `ensure_indexes()` call made once at startup rather than on every
+    construction.  Reads take a TypedDict shape that fixes the projection.
+
+    `reader(route)` returns a view whose reads follow that route's read
+    preference (e.g. search on secondaries); writes always go to the
+    primary.  A patient written by this process within
+    `read_your_writes_seconds` is read from the primary on every route, so
+    the page shown after a save never comes from a lagging secondary.
+
+    The raw `conversation` and `note` bodies are stored compressed in a side
+    collection (see `bodies.py`) and only read through `get_body()`;
+    documents not yet migrated still have them inline, which `get_body()`
+    falls back to.
+    """
+
+    _REQUIRED_FIELDS = {"patient_id", "conversation", "note"}
+
+    def __init__(
+        self,
+        client: Any,
+        database_name: str = "clinical_data",
+        collection_name: str = "patient_records",
+        *,
+        bodies_collection_name: str = "patient_bodies",
+        body_codec: str = "zstd",
+        routes: Dict[str, str] | None = None,
+        max_staleness_seconds: int = -1,
+        read_your_writes_seconds: float = 0.0,
+    ) -> None:
+        self.client = client
+        self.db = client[database_name]
+        self.collection = self.db[collection_name]
+        self.route = "primary"
+        self._primary = self.collection.with_options(read_preference=Primary())
+        self.bodies = self.db[bodies_collection_name].with_options(read_preference=Primary())
+        self.body_codec = resolve_codec(body_codec)
+        self._routes = {
+            name: read_preference(mode, max_staleness_seconds) for name, mode in (routes or {}).items()
+        }
+        self._readers: Dict[str, AsyncMongoDBHelper] = {}
+        self._recent_writes: Dict[str, float] = {}
+        self.read_your_writes_seconds = read_your_writes_seconds
+
+    def reader(self, route: str) -> "AsyncMongoDBHelper":
+        """View of this helper reading with *route*'s preference (unknown routes read the primary)."""
+        if route not in self._routes:
+            return self
+        view = self._readers.get(route)
+        if view is None:
+            view = object.__new__(AsyncMongoDBHelper)
+            view.__dict__.update(self.__dict__)
+            view.collection = self.collection.with_options(read_preference=self._routes[route])
+            view.route = route
+            self._readers[route] = view
+        return view
+
+    def _note_writes(self, patient_ids: List[str]) -> None:
+        if self.read_your_writes_seconds <= 0:
+            return
+        now = time.monotonic()
+        for patient_id in patient_ids:
+            self._recent_writes[str(patient_id)] = now
+        if len(self._recent_writes) > 10_000:
+            cutoff = now - self.read_your_writes_seconds
+            for patient_id in [p for p, t in self._recent_writes.items() if t < cutoff]:
+                del self._recent_writes[patient_id]
+
+    def _collection_for(self, patient_id: str) -> Any:
+        written = self._recent_writes.get(str(patient_id))
+        if written is not None and time.monotonic() - written < self.read_your_writes_seconds:
+            return self._primary
+        return self.collection
+
+    async def ensure_indexes(self) -> None:
+        # Unique index on patient_id for O(1) look-ups; updated_at drives change-feed polling
+        await self._primary.create_index("patient_id", unique=True)
+        await self._primary.create_index("updated_at")
+        await self.bodies.create_index("patient_id", unique=True)
+        logger.info("Indexes ensured on %s.%s", self.db.name, self.collection.name)
+
+    # ───────────────────────────────────────────────────────────────
+    # Insertion helpers
+    # ───────────────────────────────────────────────────────────────
+    def _validate_doc(self, doc: Dict[str, Any]) -> None:
+        missing = self._REQUIRED_FIELDS - doc.keys()
+        if missing:
+            raise ValueError(f"Document missing required fields: {missing}")
+
+    def _body_op(self, patient_id: str, body: Dict[str, str]) -> UpdateOne:
+        doc = encode_body(patient_id, body["conversation"], body["note"], self.body_codec)
+        return UpdateOne({"patient_id": patient_id}, {"$set": doc}, upsert=True)
+
+    async def _write_bodies(self, items: List[Tuple[str, Dict[str, str]]]) -> None:
+        """Store (patient_id, body) pairs; bodies are written before the patient documents."""
+        if items:
+            await self.bodies.bulk_write([self._body_op(pid, body) for pid, body in items], ordered=False)
+
+    async def add_conversation(self, conversation_data: Dict[str, Any]) -> str:
+        """Insert a single patient record."""
+        self._validate_doc(conversation_data)
+        derived, body = split_record(conversation_data)
+        derived.setdefault("updated_at", datetime.now(timezone.utc))
+        try:
+            result = await self._primary.insert_one(derived)
+        except DuplicateKeyError:
+            logger.error("Duplicate patient_id %s", derived["patient_id"])
+            raise
+        await self._write_bodies([(derived["patient_id"], body)])
+        self._note_writes([derived["patient_id"]])
+        return str(result.inserted_id)
+
+    async def upsert_conversation(self, record: Dict[str, Any], defaults: Dict[str, Any] | None = None) -> bool:
+        """
+        Create or overwrite the record keyed on patient_id; True when newly
+        inserted.  *defaults* are only written when the record is new.
+        """
+        self._validate_doc(record)
+        derived, body = split_record(record)
+        await self._write_bodies([(derived["patient_id"], body)])
+        update: Dict[str, Any] = {
+            "$set": {**derived, "updated_at": datetime.now(timezone.utc)},
+            "$unset": {f: "" for f in BODY_FIELDS},
+        }
+        if defaults:
+            update["$setOnInsert"] = defaults
+        result = await self._primary.update_one({"patient_id": derived["patient_id"]}, update, upsert=True)
+        self._note_writes([record["patient_id"]])
+        return result.upserted_id is not None
+
+    async def upsert_many_conversations(self, conversations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Idempotent bulk write: one `$set` upsert per record, keyed on patient_id.
+        Returns the write counts plus the patient_ids whose write failed.
+        """
+        now = datetime.now(timezone.utc)
+        for conv in conversations:
+            self._validate_doc(conv)
+        split = [split_record(conv) for conv in conversations]
+        unset = {f: "" for f in BODY_FIELDS}
+        ops = [
+            UpdateOne({"patient_id": d["patient_id"]}, {"$set": {**d, "updated_at": now}, "$unset": unset}, upsert=True)
+            for d, _ in split
+        ]
+        if not ops:
+            return {"upserted": 0, "modified": 0, "matched": 0, "failed": []}
+        await self._write_bodies([(d["patient_id"], body) for d, body in split])
+        self._note_writes([conv["patient_id"] for conv in conversations])
+        try:
+            result = await self._primary.bulk_write(ops, ordered=False)
+            return {
+                "upserted": result.upserted_count,
+                "modified": result.modified_count,
+                "matched": result.matched_count,
+                "failed": [],
+            }
+        except BulkWriteError as exc:
+            errors = exc.details.get("writeErrors", [])
+            logger.warning("Bulk upsert completed with %d errors", len(errors))
+            return {
+                "upserted": exc.details.get("nUpserted", 0),
+                "modified": exc.details.get("nModified", 0),
+                "matched": exc.details.get("nMatched", 0),
+                "failed": [conversations[err["index"]]["patient_id"] for err in errors],
+            }
+
+    # ───────────────────────────────────────────────────────────────
+    # Retrieval helpers
+    # ───────────────────────────────────────────────────────────────
+    async def get_conversation(self, patient_id: str, shape: Type[Any] | None = None) -> Optional[Dict[str, Any]]:
+        return await self._collection_for(patient_id).find_one({"patient_id": str(patient_id)}, projection(shape))
+
+    async def get_body(self, patient_id: str) -> Optional[Dict[str, str]]:
+        """Lazily load the raw conversation and note for one patient."""
+        doc = await self.bodies.find_one({"patient_id": str(patient_id)}, {"_id": 0})
+        if doc is not None:
+            return decode_body(doc)
+        legacy = await self._collection_for(patient_id).find_one(
+            {"patient_id": str(patient_id)}, {"_id": 0, **{f: 1 for f in BODY_FIELDS}}
+        )
+        if legacy is None:
+            return None
+        return {f: legacy.get(f, "") for f in BODY_FIELDS}
+
+    async def get_bodies(self, patient_ids: List[str]) -> Dict[str, Dict[str, str]]:
+        """Bodies for many patients (exports), keyed by patient_id."""
+        if not patient_ids:
+            return {}
+        cursor = self.bodies.find({"patient_id": {"$in": list(patient_ids)}}, {"_id": 0})
+        found = {doc["patient_id"]: decode_body(doc) async for doc in cursor}
+        missing = [str(p) for p in patient_ids if str(p) not in found]
+        if missing:  # not migrated yet: bodies still inline on the patient document
+            legacy = self.collection.find(
+                {"patient_id": {"$in": missing}}, {"_id": 0, "patient_id": 1, **{f: 1 for f in BODY_FIELDS}}
+            )
+            async for doc in legacy:
+                found[doc["patient_id"]] = {f: doc.get(f, "") for f in BODY_FIELDS}
+        return found
+
+    async def get_conversations(
+        self,
+        query: Dict[str, Any] | None = None,
+        limit: int = 100,
+        skip: int = 0,
+        sort_by: str | None = "patient_id",
+        sort_order: int = pymongo.ASCENDING,
+        shape: Type[Any] | None = None,
+    ) -> List[Dict[str, Any]]:
+        cursor = self.collection.find(query or {}, projection(shape))
+        if sort_by is not None:
+            cursor = cursor.sort(sort_by, sort_order)
+        if skip:
+            cursor = cursor.skip(skip)
+        return await cursor.limit(limit).to_list(length=limit)
+
+    async def get_by_patient_ids(self, patient_ids: List[str], shape: Type[Any] | None = None) -> List[Dict[str, Any]]:
+        """Fetch a known set of records, ordered by patient_id."""
+        if not patient_ids:
+            return []
+        return await self.get_conversations({"patient_id": {"$in": list(patient_ids)}}, limit=len(patient_ids), shape=shape)
+
+    def iter_conversations(
+        self,
+        query: Dict[str, Any],
+        fields: Dict[str, int],
+        batch_size: int = 1000,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming cursor for large reads (exports); *fields* is a raw projection."""
+        return self.collection.find(query, fields, batch_size=batch_size)
+
+    # ───────────────────────────────────────────────────────────────
+    # Update / delete helpers
+    # ───────────────────────────────────────────────────────────────
+    async def set_fields(self, patient_id: str, fields: Dict[str, Any]) -> bool:
+        """`$set` *fields* on one record; False when the patient does not exist."""
+        fields = {k: v for k, v in fields.items() if k != "patient_id"}
+        fields["updated_at"] = datetime.now(timezone.utc)
+        res = await self._primary.update_one({"patient_id": str(patient_id)}, {"$set": fields})
+        self._note_writes([patient_id])
+        return res.matched_count > 0
+
+    async def update_conversation(self, patient_id: str, updates: Dict[str, Any]) -> bool:
+        if "patient_id" in updates:
+            logger.warning("Cannot modify patient_id; ignoring field in updates")
+            updates.pop("patient_id")
+        if not updates:
+            return False
+        derived, _ = split_record(updates)
+        if any(f in updates for f in BODY_FIELDS):
+            body = await self.get_body(patient_id) or {f: "" for f in BODY_FIELDS}
+            body.update({f: updates[f] for f in BODY_FIELDS if f in updates})
+            await self._write_bodies([(str(patient_id), body)])
+        derived["updated_at"] = datetime.now(timezone.utc)
+        res = await self._primary.update_one({"patient_id": str(patient_id)}, {"$set": derived})
+        self._note_writes([patient_id])
+        return res.modified_count > 0
+
+    async def delete_conversation(self, patient_id: str) -> bool:
+        res = await self._primary.delete_one({"patient_id": str(patient_id)})
+        await self.bodies.delete_one({"patient_id": str(patient_id)})
+        return res.deleted_count > 0
+
+    async def delete_conversations(self, query: Dict[str, Any]) -> int:
+        patient_ids = await self._primary.distinct("patient_id", query)
+        res = await self._primary.delete_many(query)
+        await self.bodies.delete_many({"patient_id": {"$in": patient_ids}})
+        return res.deleted_count
+
+    # ───────────────────────────────────────────────────────────────
+    # Misc helpers
+    # ───────────────────────────────────────────────────────────────
+    async def count_conversations(self, query: Dict[str, Any] | None = None) -> int:
+        return await self.collection.count_documents(query or {})
+
+    async def search_conversations(
+        self,
+        text_query: str,
+        fields: List[str] | None = None,
+        limit: int = 10,
+        shape: Type[Any] | None = None,
+    ) -> List[Dict[str, Any]]:
+        # conversation/note are compressed out of the patient documents, so
+        # the searchable text is the derived fields
+        if fields is None:
+            fields = ["summary", "keywords", "timeline"]
+        or_clauses = [{field: {"$regex": text_query, "$options": "i"}} for field in fields]
+        return await self.get_conversations({"$or": or_clauses}, limit=limit, sort_by=None, shape=shape)
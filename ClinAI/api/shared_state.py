@@ -0,0 +1,380 @@
+# api/shared_state.py
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from utils.logger import logger
+from utils.metrics import metrics
+from utils.single_flight import SingleFlight
+
+
+class SharedState:
+    """
+    Small key/value store for state that every API worker must agree on:
+    extraction results, in-flight claims and rate-limit counters.
+
+    Backends (chosen by `make_shared_state` from a URL):
+    • memory://            – this process only; the single-worker default
+    • file:///var/clinai   – one file per key; shared by the workers of a
+                             node (or any hosts mounting the directory)
+    • redis://host:6379/0  – any Redis-compatible server; shared cluster-wide
+    """
+
+    name = "base"
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    async def add(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        """Set *key* only if it does not exist; True when this call created it."""
+        raise NotImplementedError
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically add *amount*; *ttl* applies when the counter is created."""
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+    async def get_json(self, key: str) -> Any:
+        raw = await self.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set_json(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self.set(key, json.dumps(value).encode("utf-8"), ttl)
+
+
+class MemoryState(SharedState):
+    """
+    Keys expire lazily on access and in a sweep at most every
+    *sweep_interval* seconds, so keys never read again (old rate-limit
+    windows, idempotency records) do not pile up.  Beyond *max_entries* the
+    least recently used key is evicted.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 100_000, sweep_interval: float = 60.0) -> None:
+        self._data: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.time() + sweep_interval
+
+    def _live(self, key: str) -> Optional[bytes]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= time.time():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return item[0]
+
+    def _store(self, key: str, value: bytes, expires: Optional[float]) -> None:
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        now = time.time()
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            for stale in [k for k, (_, exp) in self._data.items() if exp is not None and exp <= now]:
+                del self._data[stale]
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            metrics.incr("shared_state_evictions")
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._live(key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        self._store(key, value, time.time() + ttl if ttl else None)
+
+    async def add(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        if self._live(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        current = self._live(key)
+        if current is None:
+            value, expires = amount, (time.time() + ttl if ttl else None)
+        else:
+            value, expires = int(current) + amount, self._data[key][1]
+        self._store(key, str(value).encode(), expires)
+        return value
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+
+class FileState(SharedState):
+    """
+    One file per key (`<expiry as double><value>`), written atomically with
+    `os.replace`.  Read-modify-write operations (add, incr) hold an exclusive
+    `flock` on the directory's lock file, so they are atomic across processes.
+    Expired files are removed when read and, at most every *sweep_interval*
+    seconds, by a scan of the directory under the same lock.
+    """
+
+    name = "file"
+    _HEADER = struct.Struct("<d")  # expiry as epoch seconds; 0 = never
+
+    def __init__(self, directory: str | Path, sweep_interval: float = 300.0) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock_path = self.directory / ".lock"
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.time() + sweep_interval
+        self._sweep_guard = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def _entry(self, key: str) -> Tuple[float, Optional[bytes]]:
+        path = self._path(key)
+        try:
+            raw = path.read_bytes()
+        except FileNotFoundError:
+            return 0.0, None
+        (expires,) = self._HEADER.unpack_from(raw)
+        if expires and expires <= time.time():
+            path.unlink(missing_ok=True)
+            return 0.0, None
+        return expires, raw[self._HEADER.size:]
+
+    def _read(self, key: str) -> Optional[bytes]:
+        return self._entry(key)[1]
+
+    def _write(self, key: str, value: bytes, ttl: Optional[float], expires: float | None = None) -> None:
+        path = self._path(key)
+        if expires is None:
+            expires = time.time() + ttl if ttl else 0.0
+        tmp = path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+        tmp.write_bytes(self._HEADER.pack(expires) + value)
+        os.replace(tmp, path)
+
+    async def _maybe_sweep(self) -> None:
+        if time.time() >= self._next_sweep:
+            await asyncio.to_thread(self._sweep_once)
+
+    def _sweep_once(self) -> None:
+        now = time.time()
+        if now < self._next_sweep or not self._sweep_guard.acquire(blocking=False):
+            return
+        try:
+            self._next_sweep = now + self.sweep_interval
+            self._locked(self._sweep)
+        finally:
+            self._sweep_guard.release()
+
+    def _sweep(self) -> None:
+        now, removed = time.time(), 0
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".") or entry.name.endswith(".tmp"):
+                continue
+            try:
+                with open(entry.path, "rb") as fh:
+                    header = fh.read(self._HEADER.size)
+                if len(header) == self._HEADER.size:
+                    (expires,) = self._HEADER.unpack(header)
+                    if expires and expires <= now:
+                        os.unlink(entry.path)
+                        removed += 1
+            except FileNotFoundError:
+                continue
+        if removed:
+            metrics.incr("shared_state_swept", removed)
+
+    def _locked(self, fn: Callable[[], Any]) -> Any:
+        with open(self._lock_path, "a+b") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                return fn()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _add(self, key: str, value: bytes, ttl: Optional[float]) -> bool:
+        if self._read(key) is not None:
+            return False
+        self._write(key, value, ttl)
+        return True
+
+    def _incr(self, key: str, amount: int, ttl: Optional[float]) -> int:
+        expires, current = self._entry(key)
+        if current is None:
+            self._write(key, str(amount).encode(), ttl)
+            return amount
+        value = int(current) + amount
+        self._write(key, str(value).encode(), ttl, expires=expires)  # keep the window's expiry
+        return value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._read, key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        await asyncio.to_thread(self._write, key, value, ttl)
+        await self._maybe_sweep()
+
+    async def add(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        created = await asyncio.to_thread(self._locked, lambda: self._add(key, value, ttl))
+        await self._maybe_sweep()
+        return created
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        value = await asyncio.to_thread(self._locked, lambda: self._incr(key, amount, ttl))
+        await self._maybe_sweep()
+        return value
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._path(key).unlink, True)
+
+
+class RedisState(SharedState):
+    """Any Redis-compatible server (Redis, Valkey, KeyDB, or `bench.fake_redis` locally)."""
+
+    name = "redis"
+
+    def __init__(self, url: str) -> None:
+        import redis.asyncio as redis  # optional dependency, only needed for this backend
+
+        self.client = redis.from_url(url)
+
+    @staticmethod
+    def _px(ttl: Optional[float]) -> Optional[int]:
+        return max(int(ttl * 1000), 1) if ttl else None
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        await self.client.set(key, value, px=self._px(ttl))
+
+    async def add(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        return bool(await self.client.set(key, value, px=self._px(ttl), nx=True))
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        value = await self.client.incrby(key, amount)
+        if ttl and value == amount:
+            await self.client.pexpire(key, self._px(ttl))
+        return value
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(key)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def make_shared_state(url: str) -> SharedState:
+    """Backend for `Settings.shared_state_url`."""
+    scheme = urlparse(url).scheme
+    if scheme in ("", "memory"):
+        return MemoryState()
+    if scheme == "file":
+        return FileState(urlparse(url).path)
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisState(url)
+    raise ValueError(f"Unknown shared state backend '{url}' (expected memory://, file:///path or redis://host:port)")
+
+
+# ───────────────────────────────────────────────────────────────
+# Built on SharedState
+# ───────────────────────────────────────────────────────────────
+class SharedCache:
+    """
+    Read-through cache with cluster-wide in-flight de-duplication.
+
+    A miss claims `<prefix>:inflight:<key>` with `add`; the claimant computes
+    and publishes the value, every other worker waiting on the same key polls
+    for it instead of repeating the work.  A claim left by a crashed worker
+    expires after *inflight_ttl*; a failed computation releases it at once.
+    Concurrent callers inside one process are coalesced by a `SingleFlight`
+    and never poll.
+    """
+
+    def __init__(
+        self,
+        state: SharedState,
+        prefix: str,
+        *,
+        ttl: Optional[float] = None,
+        inflight_ttl: float = 300.0,
+        poll_interval: float = 0.1,
+    ) -> None:
+        self.state = state
+        self.prefix = prefix
+        self.ttl = ttl
+        self.inflight_ttl = inflight_ttl
+        self.poll_interval = poll_interval
+        self.flight = SingleFlight(prefix)
+        self._owner = f"{os.getpid()}".encode()
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Tuple[Any, bool]]]) -> Any:
+        """*compute* returns `(value, cacheable)`; uncacheable values are returned but not stored."""
+        return await self.flight.do(key, lambda: self._resolve(key, compute))
+
+    async def _resolve(self, key: str, compute: Callable[[], Awaitable[Tuple[Any, bool]]]) -> Any:
+        value_key, claim_key = f"{self.prefix}:{key}", f"{self.prefix}:inflight:{key}"
+        waited = False
+        while True:
+            cached = await self.state.get_json(value_key)
+            if cached is not None:
+                metrics.incr(f"{self.prefix}_cache_{'shared_waits' if waited else 'hits'}")
+                return cached
+            if await self.state.add(claim_key, self._owner, ttl=self.inflight_ttl):
+                break
+            waited = True
+            await asyncio.sleep(self.poll_interval)
+
+        metrics.incr(f"{self.prefix}_cache_misses")
+        try:
+            value, cacheable = await compute()
+            if cacheable:
+                await self.state.set_json(value_key, value, ttl=self.ttl)
+            return value
+        finally:
+            try:
+                await self.state.delete(claim_key)
+            except Exception as e:
+                logger.warning(f"Could not release {claim_key}: {e}")
+
+
+class SharedRateLimiter:
+    """
+    Fixed-window limit of *limit* acquisitions per *window* seconds, counted
+    in shared state so it holds across every worker and node.  `acquire`
+    waits for the next window instead of failing.
+    """
+
+    def __init__(self, state: SharedState, name: str, limit: int, window: float = 60.0) -> None:
+        self.state = state
+        self.name = name
+        self.limit = limit
+        self.window = window
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.time()
+            window = int(now // self.window)
+            count = await self.state.incr(f"ratelimit:{self.name}:{window}", 1, ttl=self.window * 2)
+            if count <= self.limit:
+                return
+            metrics.incr(f"ratelimit_{self.name}_waits")
+            await asyncio.sleep((window + 1) * self.window - now)
@@ -0,0 +1,218 @@
+# api/similarity_index.py
+from __future__ import annotations
+
+import random
+import re
+import zlib
+from array import array
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from utils.fields import normalize_term, parse_drug_names, split_keywords
+
+_PRIME = (1 << 61) - 1
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+class MinHasher:
+    """
+    MinHash signatures: *num_perm* 32-bit minima of universal hashes
+    `(a·h + b) mod 2⁶¹-1` over the CRC32 of each feature, so signatures are
+    identical across processes and runs.  The fraction of equal positions
+    in two signatures estimates the Jaccard similarity of the feature sets.
+
+    Features recur across records (the same keywords and drugs), so their
+    hash rows are cached up to *cache_size* entries.
+    """
+
+    def __init__(self, num_perm: int = 64, seed: int = 1, cache_size: int = 200_000) -> None:
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+        self._rows: Dict[str, Tuple[int, ...]] = {}
+        self._cache_size = cache_size
+
+    def _row(self, feature: str) -> Tuple[int, ...]:
+        row = self._rows.get(feature)
+        if row is None:
+            if len(self._rows) >= self._cache_size:
+                self._rows.clear()
+            h = zlib.crc32(feature.encode("utf-8"))
+            row = self._rows[feature] = tuple((a * h + b) % _PRIME for a, b in self._perms)
+        return row
+
+    def signature(self, features: Iterable[str]) -> array:
+        rows = [self._row(f) for f in features]
+        if not rows:
+            raise ValueError("Cannot sign an empty feature set")
+        return array("I", (m & 0xFFFFFFFF for m in map(min, zip(*rows))))
+
+    def signature_large(self, features: Iterable[str]) -> array:
+        """`signature` for big one-off sets (text shingles): no per-feature caching."""
+        hashes = [zlib.crc32(f.encode("utf-8")) for f in features]
+        if not hashes:
+            raise ValueError("Cannot sign an empty feature set")
+        return array("I", (min([(a * h + b) % _PRIME for h in hashes]) & 0xFFFFFFFF for a, b in self._perms))
+
+
+def jaccard_estimate(a: array, b: array) -> float:
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+class LSHIndex:
+    """
+    Banded locality-sensitive hashing over MinHash signatures.
+
+    A signature is cut into *bands* of `num_perm // bands` values; records
+    sharing any whole band land in the same bucket and become candidates.
+    With 16 bands of 4, pairs at Jaccard 0.5 collide ~65 % of the time,
+    at 0.8 more than 99.9 %, at 0.2 ~2.5 %.
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 16) -> None:
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets: List[Dict[int, Set[str]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[str, array] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._signatures
+
+    def signature(self, key: str) -> Optional[array]:
+        return self._signatures.get(key)
+
+    def _band_hashes(self, signature: array) -> List[int]:
+        r = self.rows
+        return [hash(tuple(signature[i * r:(i + 1) * r])) for i in range(self.bands)]
+
+    def add(self, key: str, signature: array) -> None:
+        self.remove(key)
+        self._signatures[key] = signature
+        for band, h in zip(self._buckets, self._band_hashes(signature)):
+            band.setdefault(h, set()).add(key)
+
+    def remove(self, key: str) -> None:
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band, h in zip(self._buckets, self._band_hashes(signature)):
+            bucket = band[h]
+            bucket.discard(key)
+            if not bucket:
+                del band[h]
+
+    def candidates(self, signature: array) -> Set[str]:
+        found: Set[str] = set()
+        for band, h in zip(self._buckets, self._band_hashes(signature)):
+            found |= band.get(h, set())
+        return found
+
+    def query(self, signature: array, k: int = 10, exclude: str | None = None) -> List[Tuple[str, float]]:
+        """Up to *k* `(key, jaccard_estimate)` among the LSH candidates, most similar first."""
+        scored = [
+            (key, jaccard_estimate(signature, self._signatures[key]))
+            for key in self.candidates(signature) if key != exclude
+        ]
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:k]
+
+    def stats(self) -> Dict[str, int]:
+        return {"records": len(self._signatures), "buckets": sum(len(b) for b in self._buckets)}
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """Word *size*-grams of the normalized text (the whole text when shorter)."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class SimilarityIndex:
+    """
+    "Similar patients": MinHash/LSH over each record's normalized keywords
+    and prescribed drug names.
+
+    Kept current like the other in-memory indexes (change feed plus direct
+    upserts from the write handlers).  A lookup hashes nothing – the
+    patient's signature is stored – and scores only the LSH candidates.
+    *canonical* normalizes keywords (pass `MedicalVocabulary.canonical`, as
+    for `KeywordIndex`, so "HTN" and "hypertension" count as shared).
+    """
+
+    KINDS = ("keyword", "drug")
+
+    def __init__(
+        self,
+        canonical: Callable[[str], str] = normalize_term,
+        num_perm: int = 64,
+        bands: int = 16,
+    ) -> None:
+        self._key = canonical
+        self.hasher = MinHasher(num_perm)
+        self.lsh = LSHIndex(num_perm, bands)
+        self._features: Dict[str, Dict[str, FrozenSet[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.lsh)
+
+    # ───────────────────────────────────────────────────────────────
+    # Maintenance
+    # ───────────────────────────────────────────────────────────────
+    def upsert(self, patient_id: str, keywords: str | None = None, prescriptions: str | None = None) -> None:
+        """Re-sign a patient; a field passed as None keeps its current terms."""
+        current = self._features.get(patient_id, {})
+        features = {
+            "keyword": current.get("keyword", frozenset()) if keywords is None else frozenset(
+                t for t in (self._key(k) for k in split_keywords(keywords)) if t
+            ),
+            "drug": current.get("drug", frozenset()) if prescriptions is None else frozenset(
+                t for t in (normalize_term(d) for d in parse_drug_names(prescriptions)) if t
+            ),
+        }
+        if features == current:
+            return
+        prefixed = [f"{kind}:{term}" for kind in self.KINDS for term in features[kind]]
+        if not prefixed:
+            self.remove(patient_id)
+            return
+        self._features[patient_id] = features
+        self.lsh.add(patient_id, self.hasher.signature(prefixed))
+
+    def remove(self, patient_id: str) -> None:
+        self._features.pop(patient_id, None)
+        self.lsh.remove(patient_id)
+
+    def on_upsert(self, doc: Dict[str, Any]) -> None:
+        """Change-feed handler."""
+        self.upsert(doc["patient_id"], doc.get("keywords") or "", doc.get("prescriptions") or "")
+
+    # ───────────────────────────────────────────────────────────────
+    # Queries
+    # ───────────────────────────────────────────────────────────────
+    def similar(self, patient_id: str, k: int = 10) -> Optional[List[Dict[str, Any]]]:
+        """
+        Top *k* similar patients with their estimated Jaccard similarity and
+        the shared terms, or None when the patient has no indexed terms.
+        """
+        signature = self.lsh.signature(patient_id)
+        if signature is None:
+            return None
+        mine = self._features[patient_id]
+        results = []
+        for other, estimate in self.lsh.query(signature, k=k, exclude=patient_id):
+            theirs = self._features[other]
+            results.append({
+                "patient_id": other,
+                "similarity": round(estimate, 3),
+                "shared_keywords": sorted(mine["keyword"] & theirs["keyword"]),
+                "shared_drugs": sorted(mine["drug"] & theirs["drug"]),
+            })
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        return {"patients": len(self.lsh), **{k: v for k, v in self.lsh.stats().items() if k != "records"}}
@@ -0,0 +1,85 @@
+# api/static_assets.py
+from __future__ import annotations
+
+import json
+import mimetypes
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from utils.logger import logger
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"  # may be stored, but must be revalidated (ETag → 304)
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class StaticAssets:
+    """
+    Serves the frontend pages and `/static` files.
+
+    After `python frontend/build.py`, pages come from `frontend/dist` and
+    reference content-hashed asset names; those are sent precompressed
+    (brotli or gzip, by Accept-Encoding) with a one-year immutable
+    Cache-Control, so a repeat visit loads them from the browser cache
+    without even a revalidation request.  Pages themselves are revalidated
+    by ETag and answered with an empty 304 when unchanged.
+
+    Without a build the source files are served as-is, revalidated by ETag.
+    """
+
+    def __init__(self, frontend_dir: Path) -> None:
+        self.source_dir = frontend_dir
+        self.dist_dir = frontend_dir / "dist"
+        self._fingerprinted: Set[str] = set()
+        self._page_etags: Dict[str, str] = {}
+        manifest_path = self.dist_dir / "manifest.json"
+        if manifest_path.exists():
+            manifest = json.loads(manifest_path.read_text())
+            self._fingerprinted = set(manifest["assets"].values())
+            self._page_etags = manifest["pages"]
+            logger.info(f"Serving built frontend from {self.dist_dir} ({len(self._fingerprinted)} assets)")
+        else:
+            logger.info("No frontend build found; serving source files (run frontend/build.py for production)")
+
+    @property
+    def built(self) -> bool:
+        return bool(self._page_etags)
+
+    def page(self, name: str, request: Request) -> Response:
+        if name in self._page_etags:
+            return self._send(self.dist_dir / name, request, REVALIDATE, f'"{self._page_etags[name]}"')
+        return self._send(self.source_dir / name, request, REVALIDATE)
+
+    def asset(self, path: str, request: Request) -> Response:
+        if path in self._fingerprinted:
+            return self._send(self._resolve(self.dist_dir / "static", path), request, IMMUTABLE)
+        # Source names (old bookmarks, unbuilt dev mode) stay reachable but are revalidated
+        return self._send(self._resolve(self.source_dir / "static", path), request, REVALIDATE)
+
+    @staticmethod
+    def _resolve(root: Path, path: str) -> Path:
+        target = (root / path).resolve()
+        if not target.is_file() or not target.is_relative_to(root.resolve()):
+            raise HTTPException(status_code=404, detail="Not found")
+        return target
+
+    def _send(self, path: Path, request: Request, cache_control: str, etag: Optional[str] = None) -> Response:
+        stat = path.stat()
+        etag = etag or f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        headers = {"Cache-Control": cache_control, "ETag": etag, "Vary": "Accept-Encoding"}
+        if etag in _etags(request.headers.get("if-none-match", "")):
+            return Response(status_code=304, headers=headers)
+
+        accepted = request.headers.get("accept-encoding", "")
+        media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        for encoding, suffix in ENCODINGS:
+            variant = path.with_name(path.name + suffix)
+            if encoding in accepted and variant.exists():
+                return FileResponse(variant, media_type=media_type, headers={**headers, "Content-Encoding": encoding})
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+
+def _etags(header: str) -> Set[str]:
+    return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
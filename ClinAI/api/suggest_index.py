@@ -0,0 +1,135 @@
+# api/suggest_index.py
+from __future__ import annotations
+
+import bisect
+from typing import Any, Dict, Iterator, List, Set, Tuple
+
+from keyword_index import KeywordIndex
+from utils.fields import clean_name, normalize_term, parse_drug_names
+
+Entry = Tuple[str, str, str]  # (word suffix, kind, term)
+
+
+def _suffixes(kind: str, term: str) -> List[Entry]:
+    words = term.split(" ")
+    return [(" ".join(words[i:]), kind, term) for i in range(len(words))]
+
+
+class SuggestIndex:
+    """
+    Prefix index backing the search-box autocomplete.
+
+    Terms come from three inverted indexes – keywords (shared with
+    `KeywordIndex`), drug names parsed from `prescriptions`, and patient
+    names.  Suggestions are served from sorted arrays of
+    `(word_suffix, kind, term)` entries, so "mell" also finds
+    "type 2 diabetes mellitus".
+
+    The arrays are maintained incrementally on the write side: a new term's
+    entries are inserted into a small sorted delta, which is merged into the
+    main array once it outgrows a tenth of it; terms that lost their last
+    patient are skipped at query time and swept out the same way (a term
+    that comes back before the sweep reuses its entries).  A keystroke
+    only ever bisects.
+    """
+
+    KINDS = ("keyword", "drug", "name")
+
+    def __init__(self, keywords: KeywordIndex) -> None:
+        self.sources: Dict[str, KeywordIndex] = {
+            "keyword": keywords,
+            "drug": KeywordIndex(),
+            "name": KeywordIndex(),
+        }
+        self._entries: List[Entry] = sorted(
+            e for kind in self.KINDS for term, _ in self.sources[kind].term_counts() for e in _suffixes(kind, term)
+        )
+        self._delta: List[Entry] = []
+        self._stale = 0  # entries whose term has no patient left
+        for kind in self.KINDS:
+            self.sources[kind].watch_terms(lambda term, added, kind=kind: self._on_term(kind, term, added))
+
+    # ───────────────────────────────────────────────────────────────
+    # Maintenance (keywords are maintained by the shared KeywordIndex)
+    # ───────────────────────────────────────────────────────────────
+    def upsert(self, patient_id: str, prescriptions: str | None, name: str | None) -> None:
+        self.sources["drug"].upsert(patient_id, parse_drug_names(prescriptions))
+        cleaned = clean_name(name)
+        self.sources["name"].upsert(patient_id, [cleaned] if cleaned else [])
+
+    def on_upsert(self, doc: Dict[str, Any]) -> None:
+        """Change-feed handler."""
+        self.upsert(doc["patient_id"], doc.get("prescriptions"), doc.get("name"))
+
+    def remove(self, patient_id: str) -> None:
+        self.sources["drug"].remove(patient_id)
+        self.sources["name"].remove(patient_id)
+
+    def _on_term(self, kind: str, term: str, added: bool) -> None:
+        entries = _suffixes(kind, term)
+        if not added:
+            self._stale += len(entries)
+            if self._stale > max(1024, len(self._entries) // 10):
+                self._entries = [e for e in self._entries if e[2] in self.sources[e[1]]]
+                self._delta = [e for e in self._delta if e[2] in self.sources[e[1]]]
+                self._stale = 0
+            return
+        if self._present(entries[0]):
+            # Removed and re-added before a sweep: its entries are still there, live again
+            self._stale = max(self._stale - len(entries), 0)
+            return
+        for entry in entries:
+            bisect.insort(self._delta, entry)
+        if len(self._delta) > max(1024, len(self._entries) // 10):
+            # Two sorted runs – timsort merges them in O(n)
+            self._entries = sorted(self._entries + self._delta)
+            self._delta = []
+
+    def _present(self, entry: Entry) -> bool:
+        for entries in (self._entries, self._delta):
+            i = bisect.bisect_left(entries, entry)
+            if i < len(entries) and entries[i] == entry:
+                return True
+        return False
+
+    # ───────────────────────────────────────────────────────────────
+    # Queries
+    # ───────────────────────────────────────────────────────────────
+    @staticmethod
+    def _scan(entries: List[Entry], prefix: str) -> Iterator[Entry]:
+        i = bisect.bisect_left(entries, (prefix,))
+        while i < len(entries) and entries[i][0].startswith(prefix):
+            yield entries[i]
+            i += 1
+
+    def suggest(self, q: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Up to *limit* `{kind, term, count}` matches, whole-term prefixes first, then by count."""
+        prefix = normalize_term(q)
+        if not prefix:
+            return []
+
+        seen: Set[Tuple[str, str]] = set()
+        found: List[Tuple[bool, int, str, str]] = []
+        for entries in (self._entries, self._delta):
+            # Scan a bounded window so very short prefixes stay cheap.
+            window = 0
+            for _suffix, kind, term in self._scan(entries, prefix):
+                if window >= limit * 5:
+                    break
+                if (kind, term) in seen:
+                    continue
+                seen.add((kind, term))
+                count = self.sources[kind].count(term)
+                if count:
+                    window += 1
+                    found.append((not term.startswith(prefix), -count, kind, term))
+        found.sort()
+        return [{"kind": kind, "term": term, "count": -neg} for _, neg, kind, term in found[:limit]]
+
+    def patients(self, kind: str, term: str) -> Set[str]:
+        """Exact-match patient IDs for a picked suggestion."""
+        source = self.sources.get(kind)
+        return set(source.lookup(term)) if source is not None else set()
+
+    def stats(self) -> Dict[str, int]:
+        return {f"{kind}_terms": self.sources[kind].stats()["terms"] for kind in self.KINDS}
@@ -0,0 +1,286 @@
+# api/timeline_index.py
+from __future__ import annotations
+
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from utils.fields import split_timeline
+from vocabulary import MedicalVocabulary, tokens
+
+# Event types, detected from word stems; an event can have several ("other" if none)
+EVENT_TYPES: Dict[str, re.Pattern] = {name: re.compile(pattern, re.IGNORECASE) for name, pattern in {
+    "readmission": r"\bre-?(?:admi(?:t|ss)|hospitali[sz])",
+    "admission": r"\b(?:admi(?:t|ss)|hospitali[sz])|\b(?:emergency department|presented to (?:the )?(?:ed|er)\b)",
+    "discharge": r"\bdischarg",
+    "surgery": r"\b(?:surg|operat|repair|resect|excis|transplant|amputat|laparoscop|bypass|graft)"
+               r"|\w(?:ectomy|otomy|ostomy|plasty)\b",
+    "procedure": r"\b(?:biops|endoscop|colonoscop|catheter|intubat|dialys|transfus|drain|puncture|stent)",
+    "imaging": r"\b(?:ct|mri|x-?ray|pet)\b|\b(?:ultraso|imaging|scan|echocardiog|angiog|radiograph|mammog)",
+    "lab": r"\b(?:lab|blood (?:test|work)|bloodwork|culture|count|level|panel|troponin|hba1c|creatinine|wbc|cbc)",
+    "medication": r"\b(?:prescri|medicat|antibiotic|administ|dose|switched to|started on|discontinu)",
+    "diagnosis": r"\b(?:diagnos|found to have|confirmed|showed|revealed|detected)",
+    "symptom": r"\b(?:present|complain|report|pain|fever|bulge|swelling|cough|nausea|vomit|symptom|onset)",
+    "complication": r"\b(?:complicat|infect|sepsis|bleed|ha?emorrhag|recurr|leak|dehisc)",
+    "follow_up": r"\bfollow[- ]?up|\b(?:check-?up|clinic visit|reviewed in clinic)",
+    "death": r"\b(?:died|death|deceased|passed away)\b",
+}.items()}
+OTHER = "other"
+ANALYSIS_CACHE_SIZE = 100_000
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from had has have he her his in into is it of on or she the their "
+    "then to was were with without after before during due same day days week weeks month months".split()
+)
+
+
+def type_key(event_type: str) -> str:
+    return f"type:{event_type}"
+
+
+class TimelineIndex:
+    """
+    In-memory event store over the `timeline` field, for cross-patient
+    temporal questions ("surgery followed by readmission") without the LLM.
+
+    Each timeline is split into events at their ordinal positions; an event
+    is indexed under its types (`type:surgery`, see `EVENT_TYPES`), the
+    vocabulary concepts it mentions (canonical, so "MI" and "heart attack"
+    agree) and its remaining content words.  A posting maps patient_id →
+    bitmask of event positions, so matching a step (several keys in the same
+    event) is an AND of ints, and sequence / co-occurrence checks are shifts
+    and masks per candidate patient.
+
+    Maintained like `KeywordIndex`: change-feed bootstrap and updates, plus
+    direct upserts from the write handlers.
+    """
+
+    def __init__(self, vocabulary: MedicalVocabulary | None = None) -> None:
+        self._vocabulary = vocabulary or MedicalVocabulary({})
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._timelines: Dict[str, Tuple[str, ...]] = {}
+        self._keys: Dict[str, FrozenSet[str]] = {}
+        self._events = 0
+        self._analysis: Dict[str, Tuple[str, ...]] = {}  # event text → keys; events repeat across patients
+
+    def __len__(self) -> int:
+        return len(self._timelines)
+
+    # ───────────────────────────────────────────────────────────────
+    # Event analysis
+    # ───────────────────────────────────────────────────────────────
+    @staticmethod
+    def event_types(text: str) -> List[str]:
+        return [name for name, pattern in EVENT_TYPES.items() if pattern.search(text)] or [OTHER]
+
+    def terms(self, text: str) -> List[str]:
+        """Vocabulary concepts in *text*, then the content words outside them."""
+        words = tokens(text)
+        matches = self._vocabulary.scan(text)
+        covered = {i for m in matches for i in range(m.start, m.end)}
+        rest = (w for i, w in enumerate(words) if i not in covered and len(w) > 2 and w not in _STOPWORDS)
+        return list(dict.fromkeys([m.canonical for m in matches] + list(rest)))
+
+    def event_keys(self, text: str) -> Tuple[str, ...]:
+        keys = self._analysis.get(text)
+        if keys is None:
+            if len(self._analysis) >= ANALYSIS_CACHE_SIZE:
+                self._analysis.clear()
+            keys = self._analysis[text] = tuple(type_key(t) for t in self.event_types(text)) + tuple(self.terms(text))
+        return keys
+
+    # ───────────────────────────────────────────────────────────────
+    # Maintenance
+    # ───────────────────────────────────────────────────────────────
+    def upsert(self, patient_id: str, timeline: str | Iterable[str] | None) -> None:
+        events = tuple(split_timeline(timeline) if isinstance(timeline, str) or timeline is None else timeline)
+        if events == self._timelines.get(patient_id, ()):
+            return
+        self.remove(patient_id)
+        if not events:
+            return
+        masks: Dict[str, int] = {}
+        for position, text in enumerate(events):
+            for key in self.event_keys(text):
+                masks[key] = masks.get(key, 0) | (1 << position)
+        for key, mask in masks.items():
+            self._postings.setdefault(key, {})[patient_id] = mask
+        self._timelines[patient_id] = events
+        self._keys[patient_id] = frozenset(masks)
+        self._events += len(events)
+
+    def remove(self, patient_id: str) -> None:
+        events = self._timelines.pop(patient_id, None)
+        if events is None:
+            return
+        self._events -= len(events)
+        for key in self._keys.pop(patient_id):
+            postings = self._postings[key]
+            del postings[patient_id]
+            if not postings:
+                del self._postings[key]
+
+    def on_upsert(self, doc: Dict[str, Any]) -> None:
+        """Change-feed handler."""
+        self.upsert(doc["patient_id"], doc.get("timeline"))
+
+    # ───────────────────────────────────────────────────────────────
+    # Queries
+    # ───────────────────────────────────────────────────────────────
+    def step_keys(self, step: str | Sequence[str]) -> List[str]:
+        """
+        Index keys an event must all carry to match *step*: `type:<name>`
+        items as-is, anything else through the same term analysis as events
+        ("heart attack" → "myocardial infarction").  A list combines items.
+        """
+        keys: List[str] = []
+        for item in ([step] if isinstance(step, str) else step):
+            item = item.strip()
+            if item.lower().startswith("type:"):
+                keys.append(type_key(item[5:].strip().lower().replace(" ", "_").replace("-", "_")))
+            else:
+                keys.extend(self.terms(item))
+        if not keys:
+            raise ValueError(f"Step {step!r} has no searchable terms")
+        return keys
+
+    def step_masks(self, step: str | Sequence[str]) -> Dict[str, int]:
+        """patient_id → positions of events matching *step*, as a bitmask (do not mutate)."""
+        postings = sorted((self._postings.get(k, {}) for k in self.step_keys(step)), key=len)
+        masks = postings[0]
+        for other in postings[1:]:
+            masks = {pid: both for pid, m in masks.items() if pid in other and (both := m & other[pid])}
+        return masks
+
+    def _per_step(self, steps: Sequence[str | Sequence[str]]) -> Tuple[List[Dict[str, int]], Set[str]]:
+        if not steps:
+            raise ValueError("At least one step is required")
+        per_step = [self.step_masks(step) for step in steps]
+        ordered = sorted(per_step, key=len)
+        candidates = set(ordered[0])
+        for masks in ordered[1:]:
+            candidates &= masks.keys()
+        return per_step, candidates
+
+    def sequence(self, steps: Sequence[str | Sequence[str]], max_gap: Optional[int] = None) -> "TimelineMatches":
+        """
+        Patients with events matching *steps* in this order (strictly later
+        positions; at most *max_gap* positions apart when given).
+        """
+        per_step, candidates = self._per_step(steps)
+        if max_gap is None:
+            # Greedy: the earliest position (as a one-bit mask) each step can be reached at
+            reach = {pid: m & -m for pid in candidates for m in (per_step[0][pid],)}
+            for masks in per_step[1:]:
+                reach = {pid: n & -n for pid, r in reach.items() if (n := masks[pid] & -(r << 1))}
+        else:
+            # Every reachable position, shifted forward by 1..max_gap for the next step
+            reach = {pid: per_step[0][pid] for pid in candidates}
+            for masks in per_step[1:]:
+                reach = {pid: n for pid, r in reach.items() if (n := masks[pid] & _spread(r, max_gap))}
+        return TimelineMatches(self, set(reach), lambda pid: _chain([m[pid] for m in per_step], max_gap))
+
+    def cooccurrence(self, steps: Sequence[str | Sequence[str]], window: Optional[int] = None) -> "TimelineMatches":
+        """
+        Patients with events matching every step in any order – within
+        *window* consecutive events when given.
+        """
+        per_step, candidates = self._per_step(steps)
+        if window is None:
+            return TimelineMatches(self, candidates, lambda pid: tuple(_lowest(m[pid]) for m in per_step))
+
+        # Window starts from which each step is reachable, ANDed over the steps
+        starts = {pid: _window_starts(per_step[0][pid], window) for pid in candidates}
+        for masks in per_step[1:]:
+            starts = {pid: n for pid, a in starts.items() if (n := a & _window_starts(masks[pid], window))}
+
+        def locate(pid: str) -> Tuple[int, ...]:
+            span = ((1 << window) - 1) << _lowest(starts[pid])
+            return tuple(_lowest(m[pid] & span) for m in per_step)
+
+        return TimelineMatches(self, set(starts), locate)
+
+    def events(self, patient_id: str, positions: Iterable[int] | None = None) -> List[Dict[str, Any]]:
+        timeline = self._timelines.get(patient_id, ())
+        wanted = range(len(timeline)) if positions is None else positions
+        return [{"position": p, "text": timeline[p], "types": self.event_types(timeline[p])} for p in wanted]
+
+    def type_counts(self) -> List[Tuple[str, int]]:
+        """Patients with at least one event of each type, most common first."""
+        counts = Counter({t: len(self._postings.get(type_key(t), ())) for t in (*EVENT_TYPES, OTHER)})
+        return [(t, n) for t, n in counts.most_common() if n]
+
+    def stats(self) -> Dict[str, int]:
+        return {"patients": len(self._timelines), "events": self._events, "keys": len(self._postings)}
+
+
+class TimelineMatches:
+    """Result of a timeline query: the matching patients, and where each one matched (computed on request)."""
+
+    def __init__(
+        self,
+        index: TimelineIndex,
+        patient_ids: Set[str],
+        locate: Callable[[str], Optional[Tuple[int, ...]]],
+    ) -> None:
+        self.index = index
+        self.patient_ids = patient_ids
+        self._locate = locate
+
+    def __len__(self) -> int:
+        return len(self.patient_ids)
+
+    def positions(self, patient_id: str) -> Tuple[int, ...]:
+        """Event position matched by each step, for one of `patient_ids`."""
+        return self._locate(patient_id) or ()
+
+    def events(self, patient_id: str) -> List[Dict[str, Any]]:
+        return self.index.events(patient_id, self.positions(patient_id))
+
+
+def _lowest(mask: int) -> int:
+    return (mask & -mask).bit_length() - 1
+
+
+def _spread(mask: int, gap: int) -> int:
+    """Positions 1..*gap* after any position in *mask*."""
+    spread, width = mask << 1, 1
+    while width < gap:
+        step = min(width, gap - width)
+        spread |= spread << step
+        width += step
+    return spread
+
+
+def _window_starts(mask: int, window: int) -> int:
+    """Positions s such that *mask* has a position in s .. s + window - 1."""
+    starts, width = mask, 1
+    while width < window:
+        step = min(width, window - width)
+        starts |= starts >> step
+        width += step
+    return starts
+
+
+def _chain(masks: List[int], max_gap: Optional[int]) -> Optional[Tuple[int, ...]]:
+    """Positions p0 < p1 < … with p_k in masks[k] (and p_k - p_{k-1} ≤ max_gap), ending earliest."""
+    reach = [masks[0]]  # reach[k]: positions where a match of steps 0..k can end
+    for mask in masks[1:]:
+        prev = reach[-1]
+        if max_gap is None:
+            allowed = ~((prev & -prev) * 2 - 1)  # anything after the earliest reachable position
+        else:
+            allowed = 0
+            for gap in range(1, max_gap + 1):
+                allowed |= prev << gap
+        prev = mask & allowed
+        if not prev:
+            return None
+        reach.append(prev)
+    positions = [_lowest(reach[-1])]
+    for k in range(len(reach) - 2, -1, -1):
+        before = reach[k] & ((1 << positions[-1]) - 1)
+        if max_gap is not None:
+            before &= ~((1 << max(positions[-1] - max_gap, 0)) - 1)
+        positions.append(before.bit_length() - 1)  # latest compatible end of the shorter match
+    return tuple(reversed(positions))
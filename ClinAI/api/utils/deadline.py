@@ -0,0 +1,188 @@
+import asyncio
+import time
+from bisect import insort
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional
+
+from utils.metrics import metrics
+
+
+class DeadlineExceeded(TimeoutError):
+    """A stage ran out of time: the request's deadline or its own timeout."""
+
+
+class Deadline:
+    """A point in (monotonic) time by which a request must have answered."""
+
+    def __init__(self, seconds: float) -> None:
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.expires - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float | None) -> Iterator[Optional[Deadline]]:
+    """
+    Run the block – and every task it creates – under a deadline *seconds*
+    from now (none when *seconds* is falsy).  An enclosing, earlier
+    deadline still applies.
+    """
+    outer = _current.get()
+    current = Deadline(seconds) if seconds and seconds > 0 else None
+    if outer is not None and (current is None or outer.expires < current.expires):
+        current = outer
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def no_deadline() -> Iterator[None]:
+    """Detach the block (e.g. background work it starts) from the request's deadline."""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def time_left(cap: float | None = None, share: float = 1.0) -> Optional[float]:
+    """
+    Seconds a stage may take: *share* of what is left of the current
+    deadline, at most *cap*; None when neither bounds it.
+    """
+    current = _current.get()
+    limits = [limit for limit in (cap, current.remaining() * share if current else None) if limit is not None]
+    return min(limits) if limits else None
+
+
+class Hedger:
+    """
+    Hedged calls: when the first attempt has not answered within the
+    *percentile* of recent attempt latencies, one duplicate is sent and the
+    first successful answer wins; the loser is cancelled.  Hedging starts
+    once *min_samples* latencies are known, so a cold process sends no
+    duplicates, and is never earlier than *min_delay*.
+
+    `hedge_<name>_sent` and `hedge_<name>_won` count duplicates sent and
+    duplicates that answered first; `deadline_<name>_exceeded` counts runs
+    that hit their timeout.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        percentile: float = 95.0,
+        min_delay: float = 0.0,
+        *,
+        enabled: bool = True,
+        window: int = 256,
+        min_samples: int = 20,
+    ) -> None:
+        self.name = name
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.enabled = enabled
+        self.min_samples = min_samples
+        self.sent = 0
+        self.won = 0
+        self.timeouts = 0
+        self._recent: Deque[float] = deque(maxlen=window)
+        self._sorted: List[float] = []
+
+    def observe(self, seconds: float) -> None:
+        if len(self._recent) == self._recent.maxlen:
+            self._sorted.remove(self._recent[0])
+        self._recent.append(seconds)
+        insort(self._sorted, seconds)
+
+    def delay(self) -> Optional[float]:
+        """Seconds after which a duplicate is sent, or None (not hedging)."""
+        if not self.enabled or len(self._sorted) < self.min_samples:
+            return None
+        i = min(int(len(self._sorted) * self.percentile / 100.0), len(self._sorted) - 1)
+        return max(self._sorted[i], self.min_delay)
+
+    async def run(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        timeout: float | None = None,
+        can_hedge: Callable[[], bool] | None = None,
+    ) -> Any:
+        """
+        `await fn()`, hedged; raises `DeadlineExceeded` after *timeout*
+        seconds, or the last error when every attempt failed.  When
+        *can_hedge* returns False at the hedge point (e.g. no capacity left)
+        no duplicate is sent.
+        """
+        if timeout is not None and timeout <= 0:
+            self._timed_out()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        end = None if timeout is None else started + timeout
+        delay = self.delay()
+        hedge_at = None if delay is None else started + delay
+        attempts: Dict[asyncio.Future, float] = {asyncio.ensure_future(fn()): started}
+        error: Optional[BaseException] = None
+        try:
+            while attempts:
+                wake = min((t for t in (end, hedge_at) if t is not None), default=None)
+                done, _ = await asyncio.wait(
+                    attempts,
+                    timeout=None if wake is None else max(wake - loop.time(), 0.0),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for attempt in done:
+                    began = attempts.pop(attempt)
+                    if attempt.exception() is None:
+                        self.observe(loop.time() - began)
+                        if began > started:
+                            self.won += 1
+                            metrics.incr(f"hedge_{self.name}_won")
+                        return attempt.result()
+                    error = attempt.exception()
+                now = loop.time()
+                if end is not None and now >= end:
+                    self._timed_out()
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    # slow, not failed: a failure is not retried here
+                    if attempts and (can_hedge is None or can_hedge()):
+                        self.sent += 1
+                        metrics.incr(f"hedge_{self.name}_sent")
+                        attempts[asyncio.ensure_future(fn())] = now
+            raise error
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    def _timed_out(self) -> None:
+        self.timeouts += 1
+        metrics.incr(f"deadline_{self.name}_exceeded")
+        raise DeadlineExceeded(f"{self.name} ran out of time")
+
+    def stats(self) -> Dict[str, Any]:
+        delay = self.delay()
+        return {
+            "delay_ms": None if delay is None else round(delay * 1000, 1),
+            "samples": len(self._recent),
+            "hedges_sent": self.sent,
+            "hedges_won": self.won,
+            "timeouts": self.timeouts,
+        }
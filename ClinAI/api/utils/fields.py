@@ -0,0 +1,55 @@
+import ast
+import json
+import re
+from typing import List
+
+NO_KEYWORDS = "No main keywords found."
+MISSING = {"", "na", "n/a", "none", "unknown"}
+
+_PUNCT = re.compile(r"[^\w\s\-/+]")
+_SPACES = re.compile(r"\s+")
+_DRUG = re.compile(r"Drug:\s*([^,\n]+)", re.IGNORECASE)
+
+
+def normalize_term(term: str) -> str:
+    """Lower-case, drop punctuation and collapse whitespace: ' Type-2 Diabetes. ' → 'type-2 diabetes'."""
+    return _SPACES.sub(" ", _PUNCT.sub(" ", term.lower())).strip()
+
+
+def split_keywords(raw: str | None) -> List[str]:
+    """Split the comma-separated `keywords` field produced by `patient_keywords`."""
+    if not raw or raw.strip() == NO_KEYWORDS:
+        return []
+    return [k.strip() for k in raw.split(",") if k.strip()]
+
+
+def split_timeline(raw: str | None) -> List[str]:
+    """
+    Events of the `timeline` field: the "['event 1', 'event 2']" list written by
+    `patient_timeline`, the JSON list saved by the patient page, or one event per line.
+    """
+    if not raw or not raw.strip():
+        return []
+    for parse in (ast.literal_eval, json.loads):
+        try:
+            items = parse(raw.strip())
+        except (ValueError, SyntaxError, TypeError):
+            continue
+        if isinstance(items, (list, tuple)):
+            return [str(item).strip() for item in items if str(item).strip()]
+    return [line.strip(" -•*") for line in raw.splitlines() if line.strip(" -•*")]
+
+
+def parse_drug_names(prescriptions: str | None) -> List[str]:
+    """Drug names from the 'Drug: <name>, Dose: …' lines produced by `patient_prescriptions`."""
+    if not prescriptions:
+        return []
+    names = (m.group(1).strip() for m in _DRUG.finditer(prescriptions))
+    return [n for n in names if n.lower() not in MISSING]
+
+
+def clean_name(name: str | None) -> str | None:
+    """Patient name, or None when the extractor returned a placeholder like 'NA'."""
+    if not name or name.strip().lower() in MISSING:
+        return None
+    return name.strip()
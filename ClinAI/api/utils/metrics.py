@@ -0,0 +1,27 @@
+import threading
+from collections import defaultdict
+from typing import Any, Dict
+
+
+class Metrics:
+    """Process-local counters and gauges, exposed through `/api/metrics`."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, Any] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def set(self, name: str, value: Any) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"counters": dict(self._counters), "gauges": dict(self._gauges)}
+
+
+metrics = Metrics()
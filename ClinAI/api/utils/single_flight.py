@@ -0,0 +1,42 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from utils.metrics import metrics
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+
+    The first caller starts *fn* as a task; callers arriving while it runs
+    await the same task and receive its result (or exception).  The task is
+    shielded, so a caller that disconnects does not cancel the work for the
+    others.  Nothing is remembered once the call finishes – that is a cache's
+    job.  `singleflight_<name>_coalesced` counts the duplicate calls avoided.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.executed = 0
+        self.coalesced = 0
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            metrics.incr(f"singleflight_{self.name}_coalesced")
+        else:
+            self.executed += 1
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every caller went away
+
+    def stats(self) -> Dict[str, int]:
+        return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._calls)}
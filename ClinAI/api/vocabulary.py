@@ -0,0 +1,196 @@
+# api/vocabulary.py
+from __future__ import annotations
+
+import re
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from utils.fields import normalize_term
+from utils.logger import logger
+
+DEFAULT_VOCABULARY = Path(__file__).parent / "data" / "medical_vocabulary.tsv"
+
+_TOKEN = re.compile(r"[a-z0-9+/]+")
+_FEMALE = re.compile(r"\b(women|woman|female|females|girls?|ladies|lady)\b", re.IGNORECASE)
+_MALE = re.compile(r"\b(men|man|male|males|boys?|gentlemen)\b", re.IGNORECASE)
+_AGE_RANGE = re.compile(
+    r"\b(?:between|aged?|ages)\s*(\d{1,3})\s*(?:-|to|and)\s*(\d{1,3})\b"
+    r"|\b(\d{1,3})\s*(?:-|to)\s*(\d{1,3})\s*(?:years|yrs|y/?o)\b",
+    re.IGNORECASE,
+)
+_AGE_MIN = re.compile(r"\b(?:over|above|older than)\s*(\d{1,3})\b|\b(\d{1,3})\s*\+", re.IGNORECASE)
+_AGE_MAX = re.compile(r"\b(?:under|below|younger than)\s*(\d{1,3})\b", re.IGNORECASE)
+_ELDERLY = re.compile(r"\b(elderly|geriatric|older adults?|seniors?)\b", re.IGNORECASE)
+_CHILDREN = re.compile(r"\b(child|children|kids?|paediatric|pediatric)\b", re.IGNORECASE)
+
+
+def tokens(text: str) -> Tuple[str, ...]:
+    """Lower-case word tokens; hyphens and punctuation separate words ('A-Fib' → ('a', 'fib'))."""
+    return tuple(_TOKEN.findall(normalize_term(text)))
+
+
+class Match(NamedTuple):
+    canonical: str
+    surface: str
+    start: int  # token offsets into the scanned text
+    end: int
+
+
+class MedicalVocabulary:
+    """
+    Synonym and abbreviation dictionary: "sugar problems" and "diabetic"
+    normalize to "diabetes mellitus", "T2DM" to "type 2 diabetes mellitus".
+
+    Loaded once from a TSV file (`canonical<TAB>syn|syn|…`).  Whole-term
+    normalization is a dict hit; free text is scanned with an Aho-Corasick
+    automaton over word tokens, so every phrase in the vocabulary is found
+    in a single left-to-right pass regardless of vocabulary size.
+    """
+
+    def __init__(self, concepts: Dict[str, List[str]]) -> None:
+        self._synonyms: Dict[str, List[str]] = {}
+        self._canonical: Dict[Tuple[str, ...], str] = {}
+        for canonical, synonyms in concepts.items():
+            canonical = normalize_term(canonical)
+            self._synonyms[canonical] = [normalize_term(s) for s in synonyms]
+            for phrase in (canonical, *synonyms):
+                key = tokens(phrase)
+                if key:
+                    self._canonical.setdefault(key, canonical)
+        self._build_automaton()
+
+    @classmethod
+    def load(cls, path: str | Path = DEFAULT_VOCABULARY) -> "MedicalVocabulary":
+        concepts: Dict[str, List[str]] = {}
+        try:
+            lines = Path(path).read_text(encoding="utf-8").splitlines()
+        except OSError as e:
+            logger.warning(f"Medical vocabulary not loaded ({e}); search falls back to the LLM")
+            return cls({})
+        for line in lines:
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            canonical, _, synonyms = line.partition("\t")
+            concepts.setdefault(canonical.strip(), []).extend(s.strip() for s in synonyms.split("|") if s.strip())
+        vocabulary = cls(concepts)
+        logger.info(f"Medical vocabulary: {len(vocabulary)} concepts, {len(vocabulary._canonical)} phrases")
+        return vocabulary
+
+    def __len__(self) -> int:
+        return len(self._synonyms)
+
+    # ───────────────────────────────────────────────────────────────
+    # Aho-Corasick over word tokens
+    # ───────────────────────────────────────────────────────────────
+    def _build_automaton(self) -> None:
+        goto: List[Dict[str, int]] = [{}]
+        out: List[List[Tuple[int, str]]] = [[]]
+        for phrase, canonical in self._canonical.items():
+            state = 0
+            for token in phrase:
+                nxt = goto[state].get(token)
+                if nxt is None:
+                    nxt = goto[state][token] = len(goto)
+                    goto.append({})
+                    out.append([])
+                state = nxt
+            out[state].append((len(phrase), canonical))
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and token not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(token, 0) if goto[f].get(token) != nxt else 0
+                out[nxt] = out[nxt] + out[fail[nxt]]
+        self._goto, self._fail, self._out = goto, fail, out
+
+    def scan(self, text: str) -> List[Match]:
+        """Leftmost-longest, non-overlapping vocabulary phrases in *text*."""
+        words = tokens(text)
+        found: List[Tuple[int, int, str]] = []
+        state = 0
+        for i, token in enumerate(words):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for length, canonical in self._out[state]:
+                found.append((i + 1 - length, i + 1, canonical))
+        found.sort(key=lambda m: (m[0], m[0] - m[1]))
+        matches: List[Match] = []
+        covered = 0
+        for start, end, canonical in found:
+            if start >= covered:
+                matches.append(Match(canonical, " ".join(words[start:end]), start, end))
+                covered = end
+        return matches
+
+    # ───────────────────────────────────────────────────────────────
+    # Normalization and expansion
+    # ───────────────────────────────────────────────────────────────
+    def canonical(self, term: str) -> str:
+        """Canonical form of a whole term ('HTN' → 'hypertension'); unknown terms are just normalized."""
+        return self._canonical.get(tokens(term)) or normalize_term(term)
+
+    def synonyms(self, canonical: str) -> List[str]:
+        return self._synonyms.get(canonical, [])
+
+    def expand(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Search structure for *query* in the shape `extract_structured_search_terms`
+        returns, or None when no vocabulary term occurs in it.
+        """
+        concepts = list(dict.fromkeys(m.canonical for m in self.scan(query)))
+        if not concepts:
+            return None
+        synonyms = list(dict.fromkeys(s for c in concepts for s in self.synonyms(c) if len(s) > 2))
+        return {
+            "required_terms": concepts,
+            "optional_terms": [],
+            "medical_context": f"{query} ({', '.join(concepts)})",
+            "synonyms": synonyms,
+            "patterns": [term_pattern(t) for t in dict.fromkeys([*concepts, *synonyms])],
+            "implied_conditions": [],
+            "demographics": query_demographics(query),
+            "original_query": query,
+            "source": "vocabulary",
+        }
+
+    def stats(self) -> Dict[str, int]:
+        return {"concepts": len(self._synonyms), "phrases": len(self._canonical), "states": len(self._goto)}
+
+
+def term_pattern(term: str) -> str:
+    """
+    Regex matching *term* as whole words, with any punctuation or spacing
+    between its words ("a-fib" also finds "A fib"); safe to pass to `$regex`.
+    """
+    return r"\b" + r"\W+".join(re.escape(t) for t in tokens(term)) + r"\b"
+
+
+def query_demographics(query: str) -> Dict[str, str]:
+    """`{"gender", "age_range"}` stated in a search query ("women over 65", "elderly men")."""
+    demographics: Dict[str, str] = {}
+    female, male = _FEMALE.search(query), _MALE.search(query)
+    if female and not male:
+        demographics["gender"] = "female"
+    elif male and not female:
+        demographics["gender"] = "male"
+
+    if match := _AGE_RANGE.search(query):
+        low, high = (g for g in match.groups() if g)
+        demographics["age_range"] = f"{low}-{high}"
+    elif match := _AGE_MIN.search(query):
+        demographics["age_range"] = f"{match.group(1) or match.group(2)}+"
+    elif match := _AGE_MAX.search(query):
+        demographics["age_range"] = f"0-{match.group(1)}"
+    elif _ELDERLY.search(query):
+        demographics["age_range"] = "65+"
+    elif _CHILDREN.search(query):
+        demographics["age_range"] = "0-17"
+    return demographics
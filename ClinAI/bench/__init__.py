@@ -0,0 +1,9 @@
+"""
+Offline benchmark suite for the ClinAI API and MCP server.
+
+Everything in here runs against local stand-ins (fake Gemini, fake Whisper,
+mongomock or a local mongod) so numbers are reproducible without network
+access.  Run the scripts from the `ClinAI/` directory, e.g.
+
+    python -m bench.bench_api --concurrency 8 --requests 200
+"""
@@ -0,0 +1,337 @@
+"""
+End-to-end benchmark of the FastAPI app with every external dependency faked.
+
+The app is driven in-process through httpx's ASGI transport; its lifespan
+runs for real, so the MCP server subprocess is spawned exactly as in
+production (on top of the fake Gemini).  Mongo is mongomock-motor unless
+`--mongodb-uri` points at a local mongod.
+
+Usage examples
+--------------
+• Default run, all scenarios:
+    python -m bench.bench_api
+
+• Slower LLM with a 2 % stall tail, 16 concurrent clients:
+    python -m bench.bench_api --llm-latency-ms 400 --llm-tail-prob 0.02 \
+        --llm-tail-ms 5000 --concurrency 16 --requests 400
+
+• Tail latency with and without deadlines and hedged LLM calls (compare p99):
+    python -m bench.bench_api --scenarios search,save_record --llm-jitter-ms 50 \
+        --llm-tail-prob 0.02 --llm-tail-ms 5000 --no-hedging --search-deadline-ms 0 --save-deadline-ms 0
+    python -m bench.bench_api --scenarios search,save_record --llm-jitter-ms 50 \
+        --llm-tail-prob 0.02 --llm-tail-ms 5000 --requests 400
+
+• Streamed summary regeneration: time to the whole text vs. to the first token
+  (token-level streaming needs the in-process backend):
+    python -m bench.bench_api --scenarios regenerate,regenerate_ttft \
+        --extractor-backend inprocess --llm-ms-per-token 20
+
+• Temporal timeline queries over 100k patients (answered from memory):
+    python -m bench.bench_api --scenarios timeline --seed-patients 100000
+
+• Transcription of a 2-minute, 40 % speech recording with and without silence
+  compaction (the fake Whisper charges per KB uploaded):
+    python -m bench.bench_api --scenarios transcribe --recording-seconds 120 \
+        --whisper-ms-per-kb 1 --no-audio-preprocessing
+    python -m bench.bench_api --scenarios transcribe --recording-seconds 120 --whisper-ms-per-kb 1
+
+• Only reads, against a local mongod, results written as JSON:
+    python -m bench.bench_api --scenarios patient,details \
+        --mongodb-uri mongodb://localhost:27017 --json bench_output.json
+
+Prerequisites
+-------------
+• `pip install httpx mongomock-motor` on top of the API requirements
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from bench.fake_mcp_server import SERVER_SCRIPT, write_server_shim
+from bench.fakes import FakeLLMConfig, FakeWhisper, install_fake_genai, mongo_client_factory
+from bench.fixtures import CONVERSATION, KEYWORDS, NOTE, QUERIES, TIMELINE_QUERIES, long_conversation, make_patient, make_recording
+from bench.harness import RequestFn, ScenarioResult, print_report, run_scenario, write_json
+
+API_DIR = Path(__file__).resolve().parents[1] / "api"
+
+SCENARIOS = ["save_record", "save_prefetched", "save_dupe", "save_long", "save_batch", "search", "transcribe", "patient", "details", "keywords", "suggest", "regenerate", "regenerate_ttft", "timeline", "similar"]
+
+
+# ---------------------------------------------------------------------------
+# App bootstrap
+# ---------------------------------------------------------------------------
+def load_app(args: argparse.Namespace) -> Any:
+    """Import `api/main.py` with fakes wired in and return the module."""
+    llm_config = FakeLLMConfig(
+        latency_ms=args.llm_latency_ms,
+        jitter_ms=args.llm_jitter_ms,
+        tail_prob=args.llm_tail_prob,
+        tail_ms=args.llm_tail_ms,
+        ms_per_1k_chars=args.llm_ms_per_1k_chars,
+        ms_per_token=args.llm_ms_per_token,
+        seed=args.seed,
+        script=json.loads(Path(args.llm_script).read_text()) if args.llm_script else [],
+    )
+    install_fake_genai(llm_config)
+    os.environ.setdefault("GROQ_API_KEY", "bench")
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+    sys.path.insert(0, str(API_DIR))
+    import main as api  # noqa: E402  (needs the fake genai installed first)
+
+    api.settings.extractor_backend = args.extractor_backend
+    # In-process extractors run in this interpreter, which already has the fake Gemini
+    api.settings.server_script_path = (
+        str(SERVER_SCRIPT) if args.extractor_backend == "inprocess" else write_server_shim(llm_config)
+    )
+    api.settings.llm_hedging = not args.no_hedging
+    if args.search_deadline_ms is not None:
+        api.settings.search_deadline_seconds = args.search_deadline_ms / 1000.0
+    if args.save_deadline_ms is not None:
+        api.settings.save_deadline_seconds = args.save_deadline_ms / 1000.0
+    api.settings.mongodb_uri = args.mongodb_uri or "mongodb://bench"
+    api.settings.mongodb_db_name = args.db_name
+    api.AsyncIOMotorClient = mongo_client_factory(args.mongodb_uri)
+    api.settings.audio_preprocessing = not args.no_audio_preprocessing
+    api.requests = FakeWhisper(latency_ms=args.whisper_latency_ms, ms_per_kb=args.whisper_ms_per_kb)
+    return api
+
+
+async def seed(api: Any, n: int, inline_bodies: bool = False) -> List[str]:
+    """Insert *n* patients; *inline_bodies* keeps conversation/note in the patient documents (pre-migration layout)."""
+    repo = api.app.state.repo
+    await repo.delete_conversations({"patient_id": {"$regex": "^bench-"}})
+    docs = [make_patient(i) for i in range(n)]
+    for start in range(0, n, 1000):
+        if inline_bodies:
+            await repo.collection.insert_many(docs[start:start + 1000])
+        else:
+            await repo.upsert_many_conversations(docs[start:start + 1000])
+    return [d["patient_id"] for d in docs]
+
+
+# ---------------------------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------------------------
+def build_scenarios(
+    client: Any, patient_ids: List[str], rng: random.Random, review_s: float = 2.0, recording: bytes = b""
+) -> Dict[str, RequestFn]:
+    # Every save gets distinct content (warm-up included), so the extraction
+    # cache never answers and each request really runs the extractors
+    visit = itertools.count()
+
+    async def save_record(n: int) -> int:
+        resp = await client.post("/save_record", json={
+            "idx": f"bench-save-{n:06d}", "conversation": CONVERSATION, "notes": f"{NOTE} Visit {next(visit)}.",
+        })
+        return resp.status_code
+
+    async def save_prefetched(n: int) -> tuple:
+        # The create page prefetches when the review modal opens; only the
+        # save click that follows *review_s* later is timed
+        notes = f"{NOTE} Visit {next(visit)}."
+        await client.post("/api/enrich:prefetch", json={"conversation": CONVERSATION, "notes": notes})
+        await asyncio.sleep(review_s)
+        t0 = time.perf_counter()
+        resp = await client.post("/save_record", json={
+            "idx": f"bench-prefetched-{n:06d}", "conversation": CONVERSATION, "notes": notes,
+        })
+        return resp.status_code, (time.perf_counter() - t0) * 1000.0
+
+    async def save_dupe(n: int) -> int:
+        # Four submissions of each record in a row, as double-clicks and client
+        # retries produce; concurrent ones should coalesce onto one save
+        group = n // 4
+        resp = await client.post("/save_record", json={
+            "idx": f"bench-dupe-{group:06d}", "conversation": CONVERSATION, "notes": f"{NOTE} Submission {group}.",
+        })
+        return resp.status_code
+
+    long_transcript = long_conversation()
+
+    async def save_long(n: int) -> int:
+        resp = await client.post("/save_record", json={
+            "idx": f"bench-long-{n:06d}", "conversation": long_transcript, "notes": f"{NOTE} Visit {next(visit)}.",
+        })
+        return resp.status_code
+
+    async def save_batch(n: int) -> int:
+        # 20 encounters, half of them identical, as a clinic backfill would send
+        batch = next(visit)
+        records = [
+            {"idx": f"bench-batch-{n:04d}-{i:02d}", "conversation": CONVERSATION,
+             "notes": f"{NOTE} Visit {batch}." if i % 2 else f"{NOTE} Visit {batch}, follow-up {i}."}
+            for i in range(20)
+        ]
+        async with client.stream("POST", "/api/records:batch", json={"records": records}) as resp:
+            async for _line in resp.aiter_lines():
+                pass
+        return resp.status_code
+
+    async def search(n: int) -> int:
+        resp = await client.post("/api/search", json={"query": QUERIES[n % len(QUERIES)]})
+        return resp.status_code
+
+    async def transcribe(n: int) -> int:
+        resp = await client.post("/transcribe", files={"file": ("recording.wav", recording, "audio/wav")})
+        return resp.status_code
+
+    async def patient(n: int) -> int:
+        resp = await client.get(f"/api/patient/{rng.choice(patient_ids)}")
+        return resp.status_code
+
+    async def details(n: int) -> int:
+        resp = await client.get(f"/patient/{rng.choice(patient_ids)}/details")
+        return resp.status_code
+
+    async def keywords(n: int) -> int:
+        terms = ",".join(rng.sample(KEYWORDS, 2))
+        resp = await client.get("/api/keywords/lookup", params={"q": terms, "mode": "and"})
+        return resp.status_code
+
+    async def suggest(n: int) -> int:
+        term = rng.choice(KEYWORDS)
+        resp = await client.get("/api/suggest", params={"q": term[: rng.randint(2, 5)]})
+        return resp.status_code
+
+    async def timeline(n: int) -> int:
+        resp = await client.post("/api/timeline/query", json=TIMELINE_QUERIES[n % len(TIMELINE_QUERIES)])
+        return resp.status_code
+
+    async def similar(n: int) -> int:
+        resp = await client.get(f"/api/patient/{rng.choice(patient_ids)}/similar")
+        return resp.status_code
+
+    async def regenerate(n: int) -> int:
+        # Until the stream's `done` event, i.e. the regenerated summary is saved
+        async with client.stream("POST", f"/api/patient/{rng.choice(patient_ids)}/summary:regenerate") as resp:
+            async for line in resp.aiter_lines():
+                if line.startswith("event: error"):
+                    return 500
+        return resp.status_code
+
+    async def regenerate_ttft(n: int) -> tuple:
+        # Until the first `token` event – what the clinician perceives
+        t0 = time.perf_counter()
+        first = None
+        async with client.stream("POST", f"/api/patient/{rng.choice(patient_ids)}/summary:regenerate") as resp:
+            async for line in resp.aiter_lines():
+                if first is None and line.startswith("event: token"):
+                    first = (time.perf_counter() - t0) * 1000.0
+                if line.startswith("event: error"):
+                    return 500, (time.perf_counter() - t0) * 1000.0
+        return resp.status_code, first if first is not None else (time.perf_counter() - t0) * 1000.0
+
+    return {
+        "save_record": save_record,
+        "save_prefetched": save_prefetched,
+        "save_dupe": save_dupe,
+        "save_long": save_long,
+        "save_batch": save_batch,
+        "search": search,
+        "transcribe": transcribe,
+        "patient": patient,
+        "details": details,
+        "keywords": keywords,
+        "suggest": suggest,
+        "regenerate": regenerate,
+        "regenerate_ttft": regenerate_ttft,
+        "timeline": timeline,
+        "similar": similar,
+    }
+
+
+async def run(args: argparse.Namespace) -> List[ScenarioResult]:
+    import httpx
+
+    api = load_app(args)
+    rng = random.Random(args.seed)
+    results: List[ScenarioResult] = []
+
+    async with api.app.router.lifespan_context(api.app):
+        await api.app.state.startup  # scenarios measure a ready replica
+        patient_ids = await seed(api, args.seed_patients, inline_bodies=args.inline_bodies)
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            recording = make_recording(args.recording_seconds, seed=args.seed) if "transcribe" in args.scenarios else b""
+            scenarios = build_scenarios(client, patient_ids, rng, review_s=args.review_ms / 1000.0, recording=recording)
+            for name in args.scenarios:
+                if args.warmup:
+                    await run_scenario(name, scenarios[name], args.warmup, args.concurrency)
+                results.append(await run_scenario(name, scenarios[name], args.requests, args.concurrency))
+                print(f"[BENCH] {name}: done", file=sys.stderr)
+                if name == "transcribe":
+                    whisper = api.requests
+                    print(f"[BENCH] transcribe: {len(recording)} bytes recorded, "
+                          f"{whisper.bytes_received // max(whisper.calls, 1)} uploaded per call", file=sys.stderr)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Entrypoint
+# ---------------------------------------------------------------------------
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline ClinAI API benchmark")
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=SCENARIOS,
+                        help=f"Comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario (default: 100)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients (default: 8)")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured warm-up requests per scenario")
+    parser.add_argument("--seed-patients", type=int, default=1000, help="Patients seeded before the run")
+    parser.add_argument("--inline-bodies", action="store_true",
+                        help="Seed conversation/note inline (pre-migration layout) for before/after comparisons")
+    parser.add_argument("--seed", type=int, default=0, help="RNG seed for reproducible runs")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--llm-tail-prob", type=float, default=0.0)
+    parser.add_argument("--llm-tail-ms", type=float, default=0.0)
+    parser.add_argument("--llm-ms-per-1k-chars", type=float, default=0.0,
+                        help="Extra fake-LLM latency per 1000 prompt characters (makes long inputs slower)")
+    parser.add_argument("--llm-ms-per-token", type=float, default=0.0,
+                        help="Fake-LLM generation time per output word; streamed responses deliver words as generated")
+    parser.add_argument("--llm-script", help="JSON list of {match, response} overrides for the fake LLM")
+    parser.add_argument("--no-hedging", action="store_true", help="Never send hedged duplicate LLM calls")
+    parser.add_argument("--search-deadline-ms", type=float,
+                        help="Override the /api/search time budget (0 = none; default: the app setting)")
+    parser.add_argument("--save-deadline-ms", type=float,
+                        help="Override the /save_record time budget (0 = none; default: the app setting)")
+    parser.add_argument("--review-ms", type=float, default=2000.0,
+                        help="Time a clinician spends in the review modal before saving (save_prefetched)")
+    parser.add_argument("--whisper-latency-ms", type=float, default=500.0)
+    parser.add_argument("--whisper-ms-per-kb", type=float, default=0.0,
+                        help="Extra fake Whisper latency per KB uploaded (upload and decode time)")
+    parser.add_argument("--recording-seconds", type=float, default=60.0,
+                        help="Length of the recording sent by the transcribe scenario")
+    parser.add_argument("--no-audio-preprocessing", action="store_true",
+                        help="Upload recordings to Whisper as received")
+    parser.add_argument("--extractor-backend", choices=["mcp", "inprocess"], default="mcp")
+    parser.add_argument("--mongodb-uri", help="Use a real (local) mongod instead of mongomock")
+    parser.add_argument("--db-name", default="clinai_bench")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {sorted(unknown)}")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.json:
+        write_json(results, args.json, meta={k: v for k, v in vars(args).items() if k != "json"})
+
+
+if __name__ == "__main__":
+    main()
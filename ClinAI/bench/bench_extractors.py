@@ -0,0 +1,95 @@
+"""
+Per-call overhead of the extractor backends: MCP over stdio vs in-process.
+
+Both backends run the same extractor functions on the fake Gemini; with the
+default zero LLM latency, what is left is pure transport cost – JSON
+serialisation, the stdio pipe and the subprocess's scheduling for MCP,
+a thread-pool hop for in-process.
+
+Usage examples
+--------------
+• Default: 500 calls per backend, sequential and 16-way concurrent:
+    python -m bench.bench_extractors
+
+• With a realistic LLM delay, long transcripts, results as JSON:
+    python -m bench.bench_extractors --llm-latency-ms 300 --long --json extractors.json
+
+Prerequisites
+-------------
+• `pip install mcp python-dotenv`
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+from typing import Any, List
+
+from bench.fake_mcp_server import SERVER_SCRIPT, write_server_shim
+from bench.fakes import FakeLLMConfig, install_fake_genai
+from bench.fixtures import CONVERSATION, NOTE, long_conversation
+from bench.harness import ScenarioResult, print_report, run_scenario, write_json
+
+API_DIR = Path(__file__).resolve().parents[1] / "api"
+TOOLS = ["patient_summary", "patient_timeline", "patient_keywords", "patient_prescriptions",
+         "patient_name", "patient_age", "patient_gender"]
+
+
+async def bench_backend(backend: Any, payload: dict, args: argparse.Namespace) -> List[ScenarioResult]:
+    async def one_call(n: int) -> int:
+        text = await backend.call(TOOLS[n % len(TOOLS)], payload)
+        return 200 if text is not None else 500
+
+    await backend.start()
+    try:
+        await run_scenario("warmup", one_call, args.warmup, 1)
+        return [
+            await run_scenario(f"{backend.name}/c{concurrency}", one_call, args.calls, concurrency)
+            for concurrency in args.concurrency
+        ]
+    finally:
+        await backend.close()
+
+
+async def run(args: argparse.Namespace) -> List[ScenarioResult]:
+    config = FakeLLMConfig(latency_ms=args.llm_latency_ms, seed=args.seed)
+    install_fake_genai(config)
+    sys.path.insert(0, str(API_DIR))
+    from extractor_backends import make_backend  # noqa: E402
+
+    payload = {"data": {"note": NOTE, "conversation": long_conversation() if args.long else CONVERSATION}}
+    workers = max(args.concurrency)
+    results: List[ScenarioResult] = []
+    for kind in args.backends:
+        script = write_server_shim(config) if kind == "mcp" else str(SERVER_SCRIPT)
+        results += await bench_backend(make_backend(kind, script, workers), payload, args)
+        print(f"[BENCH] {kind}: done", file=sys.stderr)
+    return results
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare extractor backend per-call overhead")
+    parser.add_argument("--backends", type=lambda s: s.split(","), default=["mcp", "inprocess"])
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=lambda s: [int(x) for x in s.split(",")], default=[1, 16],
+                        help="Comma-separated concurrency levels")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--long", action="store_true", help="Use a long multi-visit transcript")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.json:
+        write_json(results, args.json, meta={k: v for k, v in vars(args).items() if k != "json"})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Horizontal-scaling benchmark: `/save_record` throughput with 1…N API workers.
+
+Each worker is a separate process running the real app under uvicorn on its
+own port, on top of the fakes (fake Gemini, mongomock), as N uvicorn workers
+or N pods would.  The parent spreads a closed-loop load round-robin over the
+workers – a stand-in for the load balancer – with the per-worker concurrency
+held constant, so ideal scaling is linear.  Workers share one state backend
+(a temp directory by default, or the in-process `bench.fake_redis`).
+
+Every request carries distinct content unless `--duplicate-ratio` is set;
+duplicates show the shared extraction cache answering across workers
+(`extract_cache_hits` / `extract_cache_shared_waits` in the summary).
+
+Usage examples
+--------------
+• 1, 2 and 4 workers, shared state in a temp directory:
+    python -m bench.bench_scaling --workers 1,2,4
+
+• Through the Redis protocol, with 30 % repeated encounters, in-process extractors:
+    python -m bench.bench_scaling --shared-state redis --duplicate-ratio 0.3 \
+        --extractor-backend inprocess --llm-latency-ms 100
+
+Prerequisites
+-------------
+• Same as `bench.bench_api`, plus `pip install uvicorn` (and `redis` for --shared-state redis)
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from bench.fixtures import CONVERSATION, NOTE
+from bench.harness import ScenarioResult, print_report, run_scenario, write_json
+
+BENCH_PARENT = Path(__file__).resolve().parents[1]
+
+
+# ---------------------------------------------------------------------------
+# Worker process
+# ---------------------------------------------------------------------------
+def child(argv: List[str]) -> None:
+    import uvicorn
+
+    from bench.bench_api import load_app, parse_args
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--shared-state-url", required=True)
+    parser.add_argument("--llm-max-concurrency", type=int, required=True)
+    args, passthrough = parser.parse_known_args(argv)
+
+    api = load_app(parse_args(["--seed-patients", "0", *passthrough]))
+    api.settings.shared_state_url = args.shared_state_url
+    api.settings.llm_max_concurrency = args.llm_max_concurrency
+    uvicorn.run(api.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _wait_ready(client: Any, url: str, proc: subprocess.Popen, log: Path, timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"worker exited: {log.read_text().strip().splitlines()[-1:]}")
+        try:
+            if (await client.get(f"{url}/readyz")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.1)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+# ---------------------------------------------------------------------------
+# One measurement
+# ---------------------------------------------------------------------------
+async def measure(workers: int, shared_state_url: str, args: argparse.Namespace, passthrough: List[str]) -> Dict[str, Any]:
+    import httpx
+
+    logs = Path(tempfile.mkdtemp(prefix="clinai-scaling-"))
+    ports = [_free_port() for _ in range(workers)]
+    procs = [
+        subprocess.Popen(
+            [sys.executable, "-m", "bench.bench_scaling", "--child", "--port", str(port),
+             "--shared-state-url", shared_state_url,
+             "--llm-max-concurrency", str(args.llm_max_concurrency), *passthrough],
+            cwd=BENCH_PARENT, stdout=subprocess.DEVNULL, stderr=(logs / f"worker-{port}.log").open("w"),
+        )
+        for port in ports
+    ]
+    urls = [f"http://127.0.0.1:{port}" for port in ports]
+    rng = random.Random(args.seed)
+    unique = itertools.count()
+    try:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+            await asyncio.gather(*(
+                _wait_ready(client, url, proc, logs / f"worker-{port}.log")
+                for url, proc, port in zip(urls, procs, ports)
+            ))
+
+            async def save_record(n: int) -> int:
+                if rng.random() < args.duplicate_ratio:
+                    notes = f"{NOTE} Repeat visit {rng.randrange(args.duplicate_pool)}."
+                else:
+                    notes = f"{NOTE} Visit {workers}-{next(unique)}."
+                resp = await client.post(f"{urls[n % workers]}/save_record", json={
+                    "idx": f"bench-scale-{workers}-{n:06d}", "conversation": CONVERSATION, "notes": notes,
+                })
+                return resp.status_code
+
+            result = await run_scenario(
+                f"workers={workers}", save_record, args.requests_per_worker * workers, args.concurrency_per_worker * workers,
+            )
+            counters: Dict[str, float] = {}
+            for url in urls:
+                for name, value in (await client.get(f"{url}/api/metrics")).json()["counters"].items():
+                    if name.startswith("extract_cache"):
+                        counters[name] = counters.get(name, 0) + value
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return {"result": result, "cache": counters}
+
+
+async def run(args: argparse.Namespace, passthrough: List[str]) -> List[Dict[str, Any]]:
+    fake_redis = None
+    if args.shared_state == "redis":
+        from bench.fake_redis import start_fake_redis
+
+        fake_redis = await start_fake_redis(port=0)
+    runs = []
+    try:
+        for workers in args.workers:
+            if fake_redis is not None:
+                # Fresh logical database per run, so no run reuses another's cache
+                url = f"redis://127.0.0.1:{fake_redis.sockets[0].getsockname()[1]}/{workers}"
+            elif args.shared_state == "file":
+                url = f"file://{tempfile.mkdtemp(prefix='clinai-shared-')}"
+            else:
+                url = "memory://"
+            runs.append(await measure(workers, url, args, passthrough))
+            print(f"[BENCH] {workers} workers: done", file=sys.stderr)
+    finally:
+        if fake_redis is not None:
+            fake_redis.close()
+    return runs
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+def main() -> None:
+    if "--child" in sys.argv:
+        child([a for a in sys.argv[1:] if a != "--child"])
+        return
+
+    parser = argparse.ArgumentParser(description="Measure /save_record throughput scaling over API workers")
+    parser.add_argument("--workers", type=lambda s: [int(x) for x in s.split(",")], default=[1, 2, 4])
+    parser.add_argument("--requests-per-worker", type=int, default=40)
+    parser.add_argument("--concurrency-per-worker", type=int, default=8)
+    parser.add_argument("--llm-max-concurrency", type=int, default=4,
+                        help="Per-worker LLM budget; it bounds single-worker throughput")
+    parser.add_argument("--shared-state", choices=["file", "redis", "memory"], default="file",
+                        help="memory:// gives each worker a private cache (no sharing)")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0,
+                        help="Fraction of requests that repeat one of --duplicate-pool encounters")
+    parser.add_argument("--duplicate-pool", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args, passthrough = parser.parse_known_args()  # the rest goes to bench.bench_api in each worker
+
+    runs = asyncio.run(run(args, passthrough))
+    results: List[ScenarioResult] = [r["result"] for r in runs]
+    print_report(results)
+
+    base = results[0].throughput / args.workers[0] if results and results[0].throughput else 0.0
+    print("\nScaling (throughput per worker relative to the first run):")
+    for workers, entry in zip(args.workers, runs):
+        efficiency = entry["result"].throughput / (base * workers) if base else 0.0
+        print(f"  {workers:>3} workers  {entry['result'].throughput:8.2f} rps  efficiency {efficiency:5.1%}  {entry['cache']}")
+
+    if args.json:
+        write_json(results, args.json, meta={
+            **{k: v for k, v in vars(args).items() if k != "json"},
+            "passthrough": passthrough,
+            "cache": [entry["cache"] for entry in runs],
+        })
+
+
+if __name__ == "__main__":
+    main()
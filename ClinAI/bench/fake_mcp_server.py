@@ -0,0 +1,45 @@
+"""
+Run the real `ClinAI_server/main.py` MCP server on top of the fake Gemini.
+
+`MCPClient.connect_to_server` spawns `python <script>` with a scrubbed
+environment, so configuration cannot travel through env vars.  Instead
+`write_server_shim` writes a tiny launcher script with the bench package
+path, the fake-LLM config and the real server path baked in.
+"""
+
+from __future__ import annotations
+
+import runpy
+import sys
+import tempfile
+from pathlib import Path
+
+from bench.fakes import FakeLLMConfig, install_fake_genai
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+SERVER_SCRIPT = REPO_ROOT / "ClinAI_server" / "main.py"
+
+_SHIM = """\
+import sys
+sys.path.insert(0, {bench_parent!r})
+from bench.fake_mcp_server import run
+run({config!r}, {server!r})
+"""
+
+
+def run(config_json: str, server_script: str) -> None:
+    install_fake_genai(FakeLLMConfig.from_json(config_json))
+    sys.path.insert(0, str(Path(server_script).resolve().parent))  # as `python main.py` would
+    runpy.run_path(server_script, run_name="__main__")
+
+
+def write_server_shim(config: FakeLLMConfig, server_script: Path = SERVER_SCRIPT) -> str:
+    """Write a launcher script and return its path (usable as SERVER_SCRIPT_PATH)."""
+    shim_dir = Path(tempfile.mkdtemp(prefix="clinai-bench-"))
+    shim = shim_dir / "fake_mcp_server.py"
+    shim.write_text(_SHIM.format(
+        bench_parent=str(Path(__file__).resolve().parents[1]),
+        config=config.to_json(),
+        server=str(server_script),
+    ))
+    return str(shim)
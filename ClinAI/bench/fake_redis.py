@@ -0,0 +1,147 @@
+"""
+Minimal Redis-compatible server for exercising `RedisState` without Redis.
+
+Speaks RESP2 over TCP and implements just the commands the API uses
+(GET, SET with EX/PX/NX, INCR/INCRBY, EXPIRE/PEXPIRE, DEL) plus the PING,
+SELECT and CLIENT handshakes that redis-py sends.  Single-threaded asyncio,
+so every command is atomic, like the real thing.
+
+Usage examples
+--------------
+• Stand-alone, then point the API at it:
+    python -m bench.fake_redis --port 6390
+    SHARED_STATE_URL=redis://127.0.0.1:6390/0 uvicorn main:app --workers 4
+
+• In-process from another benchmark:
+    server = await start_fake_redis(port=0); port = server.sockets[0].getsockname()[1]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class FakeRedis:
+    """One logical database; the server keeps one per SELECTed index."""
+
+    def __init__(self) -> None:
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        item = self.data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return item[0]
+
+    def execute(self, args: List[bytes]) -> object:
+        cmd = args[0].upper()
+        if cmd in (b"PING",):
+            return "PONG"
+        if cmd in (b"CLIENT", b"HELLO"):
+            return "OK"
+        if cmd == b"GET":
+            return self._get(args[1])
+        if cmd == b"SET":
+            key, value, expires, nx = args[1], args[2], None, False
+            options = [a.upper() for a in args[3:]]
+            for i, opt in enumerate(options):
+                if opt == b"EX":
+                    expires = time.monotonic() + int(args[4 + i])
+                elif opt == b"PX":
+                    expires = time.monotonic() + int(args[4 + i]) / 1000
+                elif opt == b"NX":
+                    nx = True
+            if nx and self._get(key) is not None:
+                return None
+            self.data[key] = (value, expires)
+            return "OK"
+        if cmd in (b"INCR", b"INCRBY"):
+            key = args[1]
+            amount = int(args[2]) if cmd == b"INCRBY" else 1
+            current = self._get(key)
+            value = (int(current) if current is not None else 0) + amount
+            self.data[key] = (str(value).encode(), self.data[key][1] if current is not None else None)
+            return value
+        if cmd in (b"EXPIRE", b"PEXPIRE"):
+            key, current = args[1], self._get(args[1])
+            if current is None:
+                return 0
+            seconds = int(args[2]) / (1000 if cmd == b"PEXPIRE" else 1)
+            self.data[key] = (current, time.monotonic() + seconds)
+            return 1
+        if cmd == b"DEL":
+            return sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+        return RuntimeError(f"ERR unknown command '{cmd.decode()}'")
+
+
+def _encode(value: object) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, RuntimeError):
+        return f"-{value}\r\n".encode()
+    if isinstance(value, str):
+        return f"+{value}\r\n".encode()
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):  # inline command
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        size = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+async def start_fake_redis(host: str = "127.0.0.1", port: int = 6390) -> asyncio.base_events.Server:
+    databases: Dict[int, FakeRedis] = {}
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        db = 0
+        try:
+            while (args := await _read_command(reader)) is not None:
+                if not args:
+                    continue
+                if args[0].upper() == b"SELECT":
+                    db, reply = int(args[1]), "OK"
+                else:
+                    reply = databases.setdefault(db, FakeRedis()).execute(args)
+                writer.write(_encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Minimal Redis-compatible server for local testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    async def serve() -> None:
+        server = await start_fake_redis(args.host, args.port)
+        print(f"[FAKE REDIS] listening on {args.host}:{args.port}")
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
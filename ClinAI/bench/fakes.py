@@ -0,0 +1,256 @@
+"""
+Local stand-ins for the external services ClinAI talks to.
+
+• `install_fake_genai`  – replaces `google.generativeai` in `sys.modules` with a
+  scripted model whose latency is configurable.  The real SDK is blocking,
+  so the fake blocks too (`time.sleep`) to reproduce event-loop stalls.
+  `generate_content(..., stream=True)` yields the response word by word.
+• `FakeWhisper`         – drop-in for the `requests` module used by
+  `/transcribe`; returns a canned transcription after a delay that grows
+  with the size of the upload.
+• `mongo_client_factory` – mongomock-motor client, or a real Motor client when
+  a local mongod URI is given.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import re
+import sys
+import time
+import types
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from bench.fixtures import CONVERSATION, pick_keywords
+
+Responder = Union[str, Callable[[str], str]]
+
+
+# ---------------------------------------------------------------------------
+# Fake LLM
+# ---------------------------------------------------------------------------
+@dataclass
+class FakeLLMConfig:
+    """Latency model and scripted responses for the fake Gemini."""
+
+    latency_ms: float = 200.0
+    jitter_ms: float = 0.0
+    tail_prob: float = 0.0          # probability of a stalled call …
+    tail_ms: float = 0.0            # … and how long the stall lasts
+    ms_per_1k_chars: float = 0.0    # extra latency per 1000 prompt characters
+    ms_per_token: float = 0.0       # generation time per output word (streamed as it is produced)
+    seed: Optional[int] = None
+    script: List[Dict[str, str]] = field(default_factory=list)  # [{"match": regex, "response": text}]
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, raw: str) -> "FakeLLMConfig":
+        return cls(**json.loads(raw))
+
+
+def _label_conversation(prompt: str) -> str:
+    body = prompt.split("### CONVERSATION", 1)[-1].split("###", 1)[0]
+    sentences = [s.strip() for s in re.split(r"(?<=[.?!])\s+", body) if s.strip()]
+    roles = ("Doctor", "Patient")
+    return "\n".join(f"{roles[i % 2]}: {s}" for i, s in enumerate(sentences))
+
+
+def _search_structure(prompt: str) -> str:
+    match = re.search(r'Query: "(.*)"', prompt)
+    query = match.group(1) if match else ""
+    terms = [w for w in re.findall(r"[a-zA-Z]+", query.lower()) if len(w) > 3]
+    return json.dumps({
+        "required_terms": terms[:2],
+        "optional_terms": terms[2:],
+        "medical_context": query,
+        "synonyms": [],
+        "implied_conditions": [],
+        "demographics": {},
+    })
+
+
+def _ranking(prompt: str) -> str:
+    n = len(re.findall(r"^Patient \d+:", prompt, flags=re.M))
+    return json.dumps([
+        {"patient_index": i, "relevance_score": max(95 - 3 * i, 60), "reason": "Fake ranking"}
+        for i in range(n)
+    ])
+
+
+DEFAULT_RESPONDERS: List[Tuple[str, Responder]] = [
+    (r"Label the following conversation", _label_conversation),
+    (r"clinical search expert", _search_structure),
+    (r"medical search expert", _ranking),
+    (r"^Summarize the provided clinical note",
+     "An 88-year-old man with a recurrent right inguinal hernia containing the appendix "
+     "underwent repair with incidental appendectomy and recovered without complications."),
+    (r"^Extract all major clinical events",
+     "['Right groin bulge for 6 weeks', 'CT showed inguinal hernia containing appendix', "
+     "'Hernia repair with incidental appendectomy', 'Discharged same day', "
+     "'No recurrence at 2-week follow-up']"),
+    (r"^Extract all prescription medications",
+     "Drug: Cefazolin, Dose: 2 g, Route: IV, Status: active"),
+    (r"^Extract all main medical keywords",
+     lambda prompt: ", ".join(pick_keywords(prompt))),
+    (r"^Extract only the patient's name", "NA"),
+    (r"^Extract only the patient's age", "88"),
+    (r"^Extract only the patient's gender", "Male"),
+]
+
+
+class _FakeGenerationConfig:
+    def __init__(self, **kwargs: Any) -> None:
+        self.__dict__.update(kwargs)
+
+
+class _FakeResponse:
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+
+class _FakeChat:
+    def __init__(self, model: "_FakeGenerativeModel") -> None:
+        self._model = model
+
+    def send_message(self, prompt: str, **kwargs: Any) -> _FakeResponse:
+        return self._model.generate_content(prompt, **kwargs)
+
+
+class FakeLLM:
+    """Scripted, latency-shaped text generator shared by every fake model."""
+
+    def __init__(self, config: FakeLLMConfig) -> None:
+        self.config = config
+        self.calls = 0
+        self._rng = random.Random(config.seed)
+        self._responders: List[Tuple[re.Pattern, Responder]] = [
+            (re.compile(item["match"], re.S), item["response"]) for item in config.script
+        ] + [(re.compile(p, re.S), r) for p, r in DEFAULT_RESPONDERS]
+
+    def delay_s(self, prompt: str = "") -> float:
+        cfg = self.config
+        delay = cfg.latency_ms + cfg.ms_per_1k_chars * len(prompt) / 1000.0
+        delay += self._rng.uniform(-cfg.jitter_ms, cfg.jitter_ms) if cfg.jitter_ms else 0.0
+        if cfg.tail_prob and self._rng.random() < cfg.tail_prob:
+            delay += cfg.tail_ms
+        return max(delay, 0.0) / 1000.0
+
+    def respond(self, prompt: str) -> str:
+        for pattern, responder in self._responders:
+            if pattern.search(prompt.lstrip()):
+                return responder(prompt) if callable(responder) else responder
+        return "OK"
+
+    def generate(self, prompt: str) -> str:
+        self.calls += 1
+        text = self.respond(prompt)
+        time.sleep(self.delay_s(prompt) + len(_words(text)) * self.config.ms_per_token / 1000.0)
+        return text
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """Same total time as `generate`, but each word is yielded once "generated"."""
+        self.calls += 1
+        time.sleep(self.delay_s(prompt))
+        for word in _words(self.respond(prompt)):
+            time.sleep(self.config.ms_per_token / 1000.0)
+            yield word
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"\s*\S+", text)
+
+
+class _FakeGenerativeModel:
+    llm: FakeLLM  # set by install_fake_genai
+
+    def __init__(self, model_name: str = "", **kwargs: Any) -> None:
+        self.model_name = model_name
+
+    def generate_content(self, prompt: Any, generation_config: Any = None, stream: bool = False, **kwargs: Any) -> Any:
+        if stream:
+            return (_FakeResponse(word) for word in self.llm.generate_stream(str(prompt)))
+        return _FakeResponse(self.llm.generate(str(prompt)))
+
+    def start_chat(self, **kwargs: Any) -> _FakeChat:
+        return _FakeChat(self)
+
+
+def install_fake_genai(config: FakeLLMConfig | None = None) -> FakeLLM:
+    """Register a fake `google.generativeai` module and return its LLM."""
+    llm = FakeLLM(config or FakeLLMConfig())
+    model_cls = type("GenerativeModel", (_FakeGenerativeModel,), {"llm": llm})
+
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = lambda **kwargs: None
+    genai.GenerativeModel = model_cls
+    genai.GenerationConfig = _FakeGenerationConfig
+    genai.fake_llm = llm
+
+    google = sys.modules.get("google")
+    if google is None:
+        google = types.ModuleType("google")
+        google.__path__ = []  # namespace-like so other google.* imports still fail loudly
+        sys.modules["google"] = google
+    google.generativeai = genai
+    sys.modules["google.generativeai"] = genai
+    return llm
+
+
+# ---------------------------------------------------------------------------
+# Fake Whisper (Groq transcription endpoint)
+# ---------------------------------------------------------------------------
+class _FakeHTTPResponse:
+    def __init__(self, status_code: int, payload: Dict[str, Any]) -> None:
+        self.status_code = status_code
+        self._payload = payload
+        self.text = json.dumps(payload)
+
+    def json(self) -> Dict[str, Any]:
+        return self._payload
+
+
+class FakeWhisper:
+    """Stands in for the `requests` module inside `api/main.py`."""
+
+    def __init__(self, latency_ms: float = 500.0, transcription: str = CONVERSATION, ms_per_kb: float = 0.0) -> None:
+        self.latency_ms = latency_ms
+        self.ms_per_kb = ms_per_kb
+        self.transcription = transcription
+        self.calls = 0
+        self.bytes_received = 0
+
+    def post(self, url: str, headers: Any = None, files: Any = None, data: Any = None, **kwargs: Any) -> _FakeHTTPResponse:
+        self.calls += 1
+        size = len(files["file"][1]) if files and "file" in files else 0
+        self.bytes_received += size
+        time.sleep((self.latency_ms + self.ms_per_kb * size / 1024.0) / 1000.0)
+        payload: Dict[str, Any] = {"text": self.transcription}
+        if data and data.get("response_format") == "verbose_json":
+            payload["segments"] = [{"start": 0.0, "end": 1.0, "text": self.transcription}]
+        return _FakeHTTPResponse(200, payload)
+
+
+# ---------------------------------------------------------------------------
+# Mongo
+# ---------------------------------------------------------------------------
+def mongo_client_factory(mongodb_uri: str | None) -> Callable[..., Any]:
+    """
+    Return a callable with the `AsyncIOMotorClient(uri)` signature.
+
+    Without a URI the in-memory mongomock-motor client is used; with one, a
+    real Motor client pointed at (ideally local) mongod.
+    """
+    if mongodb_uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        return lambda *_args, **kwargs: AsyncIOMotorClient(mongodb_uri, **kwargs)
+
+    from mongomock_motor import AsyncMongoMockClient
+
+    client = AsyncMongoMockClient()
+    client.close = lambda: None  # lifespan closes it; keep data for the next phase
+    return lambda *_args, **_kwargs: client
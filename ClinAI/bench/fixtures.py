@@ -0,0 +1,145 @@
+"""
+Sample inputs shared by the benchmark scripts.
+
+The note/conversation pair is the hernia case used by `api/test.py`; the
+keyword and query vocabularies are small on purpose so seeded collections
+have realistic overlap between patients.
+"""
+
+from __future__ import annotations
+
+import io
+import math
+import random
+import wave
+from array import array
+from typing import Any, Dict, List
+
+CONVERSATION = """Doctor: Good morning, sir. How are you feeling today?
+Patient: I'm okay, doctor. Just a little bit worried about this bulge in my right groin.
+Doctor: Can you tell me more about your chief complaint?
+Patient: Yes, doctor. I've had this bulge in my right groin for about 6 weeks now. At first, it was very painful, but it's been asymptomatic ever since.
+Doctor: Have you had any hernia repair in the past?
+Patient: Yes, doctor. I had a hernia repair in 1977. I don't think they used any mesh.
+Doctor: (after the scan) The imaging showed that you have a right inguinal hernia and your appendix is inside the sac.
+Patient: Is that bad, doctor?
+Doctor: No, it's not necessarily bad. But we need to perform a surgical intervention to repair the hernia.
+Doctor: (after the surgery) The surgery was successful. We'll monitor you closely for the next few days.
+Patient: Thank you, doctor."""
+
+NOTE = """An 88-year-old male presented in the outpatient surgical setting with a chief complaint of a right groin bulge that had been present for 6 weeks. He was concerned that a previously repaired right inguinal hernia had recurred from its original tissue repair in 1977. A computed tomography scan of the abdomen and pelvis showed a right inguinal hernia with the appendix present within the sac. Preoperative laboratory testing revealed a white blood cell count of 4.7 × 109/L. An incidental appendectomy was performed and the indirect hernia defect was closed with a lightweight mesh plug. The patient was discharged the same day and at his 2-week follow-up he had no recurrence."""
+
+KEYWORDS = [
+    "hypertension", "type 2 diabetes mellitus", "asthma", "chronic kidney disease",
+    "atrial fibrillation", "myocardial infarction", "heart failure", "pneumonia",
+    "sepsis", "inguinal hernia", "appendectomy", "appendicitis", "stroke",
+    "copd", "anemia", "hypothyroidism", "migraine", "epilepsy", "depression",
+    "osteoarthritis", "rheumatoid arthritis", "breast cancer", "lung cancer",
+    "ct scan", "mri", "echocardiogram", "metformin", "insulin", "lisinopril",
+    "atorvastatin", "warfarin", "amoxicillin", "prednisone", "fever", "chest pain",
+    "shortness of breath", "abdominal pain", "headache", "fatigue", "readmission",
+]
+
+DRUGS = ["Metformin", "Insulin glargine", "Lisinopril", "Atorvastatin", "Warfarin",
+         "Amoxicillin", "Prednisone", "Cefazolin", "Levothyroxine", "Albuterol"]
+
+# Timeline events by stage, with the share of patients who reach the stage
+TIMELINE_STAGES = [
+    (1.0, ["Presented with chest pain", "Presented with abdominal pain", "Presented with a right groin bulge",
+           "Complained of shortness of breath", "Reported fever and cough"]),
+    (0.7, ["CT scan performed", "Chest X-ray performed", "Blood tests showed raised WBC", "Echocardiogram performed"]),
+    (0.8, ["Diagnosed with pneumonia", "Diagnosed with appendicitis", "Diagnosed with heart failure",
+           "Found to have an inguinal hernia", "Diagnosed with myocardial infarction"]),
+    (0.5, ["Admitted to hospital"]),
+    (0.3, ["Appendectomy performed", "Hernia repair with mesh", "Coronary artery bypass graft"]),
+    (0.4, ["Started on antibiotics", "Started on metformin", "Started on lisinopril"]),
+    (0.6, ["Discharged home"]),
+    (0.08, ["Readmitted with wound infection", "Readmitted with chest pain"]),
+    (0.5, ["Follow-up at 2 weeks with no recurrence", "Follow-up in clinic"]),
+]
+
+QUERIES = [
+    "patients with diabetes on metformin",
+    "elderly men with inguinal hernia",
+    "sugar problems and kidney issues",
+    "heart attack follow up",
+    "women with breast cancer",
+    "chest pain and shortness of breath",
+    "asthma in children",
+    "stroke with atrial fibrillation",
+]
+
+TIMELINE_QUERIES = [
+    {"pattern": "sequence", "steps": ["type:surgery", "type:readmission"]},
+    {"pattern": "sequence", "steps": ["type:admission", "antibiotics", "type:discharge"], "max_gap": 2},
+    {"pattern": "sequence", "steps": ["heart attack", "type:surgery"]},
+    {"pattern": "cooccurrence", "steps": ["type:imaging", "pneumonia"], "window": 2},
+    {"pattern": "cooccurrence", "steps": ["hernia", ["type:follow_up", "recurrence"]]},
+]
+
+
+def pick_keywords(seed: str, k: int = 5) -> List[str]:
+    """Deterministic keyword subset for *seed* (same input → same keywords)."""
+    rng = random.Random(seed)
+    return rng.sample(KEYWORDS, k)
+
+
+def long_conversation(visits: int = 40) -> str:
+    """A multi-visit transcript, *visits* × CONVERSATION, long enough to need chunking."""
+    return "\n".join(f"Doctor: (visit {v + 1})\n{CONVERSATION}" for v in range(visits))
+
+
+def make_timeline(seed: str) -> str:
+    """A plausible, deterministic event list in the `patient_timeline` format."""
+    rng = random.Random(f"{seed}:timeline")
+    events = [rng.choice(options) for share, options in TIMELINE_STAGES if rng.random() < share]
+    return str(events)
+
+
+def make_patient(i: int) -> Dict[str, Any]:
+    """A fully enriched patient document, as `/save_record` would store it."""
+    pid = f"bench-{i:06d}"
+    rng = random.Random(pid)
+    drugs = rng.sample(DRUGS, rng.randint(0, 3))
+    prescriptions = "\n".join(
+        f"Drug: {d}, Dose: NA, Route: oral, Status: active" for d in drugs
+    ) or "No prescriptions found."
+    return {
+        "patient_id": pid,
+        "conversation": CONVERSATION,
+        "note": NOTE,
+        "summary": "An elderly patient presented with a groin bulge and underwent repair.",
+        "timeline": make_timeline(pid),
+        "keywords": ", ".join(pick_keywords(pid)),
+        "prescriptions": prescriptions,
+        "name": "NA",
+        "age": str(rng.randint(18, 95)),
+        "gender": rng.choice(["Male", "Female"]),
+    }
+
+
+def make_recording(seconds: float = 60.0, speech_ratio: float = 0.4, seed: int = 0) -> bytes:
+    """
+    A 16 kHz mono WAV standing in for a consultation recording: bursts of
+    modulated tone ("speech") between stretches of faint noise (the doctor
+    examining the patient), *speech_ratio* of the time speaking.
+    """
+    rng = random.Random(seed)
+    rate = 16000
+    samples = array("h")
+    while len(samples) < seconds * rate:
+        talk = rng.uniform(2.0, 8.0)
+        pause = talk * (1.0 - speech_ratio) / max(speech_ratio, 0.01)
+        pitch = rng.uniform(120.0, 240.0)
+        samples.extend(
+            int(8000 * math.sin(2 * math.pi * pitch * t / rate) * (0.6 + 0.4 * math.sin(2 * math.pi * 4 * t / rate)))
+            for t in range(int(talk * rate))
+        )
+        samples.extend(int(rng.gauss(0.0, 60.0)) for _ in range(int(pause * rate)))
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(samples[: int(seconds * rate)].tobytes())
+    return buf.getvalue()
@@ -0,0 +1,93 @@
+"""
+Closed-loop load driver and latency statistics for the benchmark scripts.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Sequence, Tuple, Union
+
+# request number → HTTP status, or (status, latency_ms) when the request
+# times itself, e.g. to leave out simulated user think time
+RequestFn = Callable[[int], Awaitable[Union[int, Tuple[int, float]]]]
+
+
+def percentile(samples: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile; *samples* need not be sorted."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(int(math.ceil(pct / 100.0 * len(ordered))) - 1, 0)
+    return ordered[rank]
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    requests: int
+    concurrency: int
+    errors: int
+    wall_s: float
+    latencies_ms: List[float] = field(default_factory=list, repr=False)
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.wall_s if self.wall_s else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        lat = self.latencies_ms
+        return {
+            "name": self.name,
+            "requests": self.requests,
+            "concurrency": self.concurrency,
+            "errors": self.errors,
+            "throughput_rps": round(self.throughput, 2),
+            "p50_ms": round(percentile(lat, 50), 2),
+            "p95_ms": round(percentile(lat, 95), 2),
+            "p99_ms": round(percentile(lat, 99), 2),
+            "max_ms": round(max(lat), 2) if lat else 0.0,
+        }
+
+
+async def run_scenario(name: str, request_fn: RequestFn, requests: int, concurrency: int) -> ScenarioResult:
+    """Issue *requests* calls through *concurrency* workers and time each one."""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for n in counter:
+            t0 = time.perf_counter()
+            try:
+                status = await request_fn(n)
+            except Exception:
+                status = 599
+            elapsed_ms = (time.perf_counter() - t0) * 1000.0
+            if isinstance(status, tuple):
+                status, elapsed_ms = status
+            latencies.append(elapsed_ms)
+            if status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+    return ScenarioResult(name, requests, concurrency, errors, time.perf_counter() - started, latencies)
+
+
+def print_report(results: Sequence[ScenarioResult]) -> None:
+    cols = ["name", "requests", "concurrency", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    rows = [r.summary() for r in results]
+    widths = {c: max(len(c), *(len(str(row[c])) for row in rows)) for c in cols} if rows else {}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(widths[c]) for c in cols))
+
+
+def write_json(results: Sequence[ScenarioResult], path: str, meta: Dict[str, object] | None = None) -> None:
+    with open(path, "w") as fh:
+        json.dump({"meta": meta or {}, "results": [r.summary() for r in results]}, fh, indent=2)
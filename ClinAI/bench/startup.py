@@ -0,0 +1,160 @@
+"""
+Cold-start benchmark: import-time profile and time-to-first-request.
+
+Each run starts a fresh interpreter (as an autoscaled replica would), builds
+the app on top of the fakes, enters its lifespan and records when it can
+answer liveness, when `/readyz` turns 200 and when the first real request
+completes.  The parent measures wall time from spawn, so interpreter start
+and imports are included.
+
+Usage examples
+--------------
+• Five cold starts plus the 15 slowest imports of `api/main.py`:
+    python -m bench.startup --runs 5 --top 15
+
+• Same, with a 300 ms Mongo/MCP handshake and results as JSON:
+    python -m bench.startup --llm-latency-ms 300 --json startup.json
+
+Prerequisites
+-------------
+• Same as `bench.bench_api`
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+BENCH_PARENT = Path(__file__).resolve().parents[1]
+API_DIR = BENCH_PARENT / "api"
+SERVER_DIR = BENCH_PARENT.parent / "ClinAI_server"
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+# ---------------------------------------------------------------------------
+# Import-time profile
+# ---------------------------------------------------------------------------
+def import_profile(cwd: Path, module: str, top: int = 15) -> Dict[str, Any]:
+    """Run `python -X importtime -c 'import <module>'` and rank its direct imports by cumulative time."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    # Children are printed before their parent; indent is 1 space at the top
+    # level plus 2 per nesting level.  Keep the direct imports of *module*.
+    rows: List[Tuple[str, int]] = []
+    pending: List[Tuple[str, int]] = []
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if not match:
+            continue
+        _self_us, cumulative_us, indent, name = match.groups()
+        if len(indent) == 3:
+            pending.append((name, int(cumulative_us)))
+        elif len(indent) == 1:
+            if name == module:
+                rows, total_us = pending, int(cumulative_us)
+            pending = []
+    rows.sort(key=lambda r: r[1], reverse=True)
+    return {
+        "module": module,
+        "ok": proc.returncode == 0,
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else None,
+        "total_ms": round(total_us / 1000, 1),
+        "slowest": [{"import": n, "cumulative_ms": round(c / 1000, 1)} for n, c in rows[:top]],
+    }
+
+
+# ---------------------------------------------------------------------------
+# Time to first request (child process)
+# ---------------------------------------------------------------------------
+async def _child(argv: List[str]) -> Dict[str, float]:
+    import httpx
+
+    from bench.bench_api import load_app, parse_args
+
+    started = time.perf_counter()
+    api = load_app(parse_args(argv))
+    marks = {"import_s": time.perf_counter() - started}
+
+    async with api.app.router.lifespan_context(api.app):
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.get("/healthz")
+            marks["live_s"] = time.perf_counter() - started
+            while (await client.get("/readyz")).status_code != 200:
+                await asyncio.sleep(0.01)
+            marks["ready_s"] = time.perf_counter() - started
+            await client.get("/api/suggest", params={"q": "dia"})
+            marks["first_request_s"] = time.perf_counter() - started
+    return {k: round(v, 3) for k, v in marks.items()}
+
+
+def time_to_first_request(argv: List[str]) -> Dict[str, float]:
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-m", "bench.startup", "--child", *argv],
+        cwd=BENCH_PARENT, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "child failed")
+    marks = json.loads(proc.stdout.strip().splitlines()[-1])
+    # Includes interpreter start-up, which the child cannot see
+    marks["process_wall_s"] = round(wall, 3)
+    return marks
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+def main() -> None:
+    if "--child" in sys.argv:
+        argv = [a for a in sys.argv[1:] if a != "--child"]
+        print(json.dumps(asyncio.run(_child(argv))))
+        return
+
+    parser = argparse.ArgumentParser(description="Measure ClinAI API cold start")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args, passthrough = parser.parse_known_args()
+    # Keep seeding out of the way; the child only needs a running app
+    passthrough = ["--seed-patients", "0", *passthrough]
+
+    report: Dict[str, Any] = {
+        "imports": {
+            "api": import_profile(API_DIR, "main", args.top),
+            "mcp_server": import_profile(SERVER_DIR, "main", args.top),
+        },
+        "runs": [time_to_first_request(passthrough) for _ in range(args.runs)],
+    }
+    report["median"] = {
+        key: round(statistics.median(run[key] for run in report["runs"]), 3) for key in report["runs"][0]
+    }
+
+    for name, profile in report["imports"].items():
+        status = "" if profile["ok"] else f"  (import failed: {profile['error']})"
+        print(f"\n{name}: {profile['total_ms']} ms to import{status}")
+        for row in profile["slowest"]:
+            print(f"  {row['cumulative_ms']:>9.1f} ms  {row['import']}")
+    print(f"\nCold start over {args.runs} runs (median seconds):")
+    for key, value in report["median"].items():
+        print(f"  {key:<18} {value:.3f}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
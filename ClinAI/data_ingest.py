@@ -1,35 +1,65 @@
 """
 Temporary ingestion script for the AGBonnet/augmented-clinical-notes dataset.
-This script downloads the dataset and stores **both** the `conversation` and
+This script streams the dataset and stores **both** the `conversation` and
 corresponding clinician `note` in MongoDB.
 
+Records are read lazily (Hugging Face streaming, or a local Parquet/JSONL
+export for offline runs) and handed to a few writer threads through a
+bounded queue, so memory stays flat regardless of dataset size.  Each batch
+is written with one `bulk_write` of `patient_id`-keyed upserts, which makes
+re-running the script idempotent.
+
 You can optionally cap the number of records to ingest with `--max-records`.
 
+Near-duplicate records (the same encounter exported twice, templated notes)
+can be caught with MinHash/LSH over word shingles of each note +
+conversation (needs `numpy`; off by default): `--near-duplicates flag` logs
+them and still writes them, `skip` leaves them out, and
+`--duplicates-report` writes the pairs to a JSONL file.  Records are only
+compared against the last `--duplicate-window` records seen, which bounds
+the memory the check needs.
+
 Usage examples
 --------------
-• Ingest only the first 2 000 rows (default):
-    python ingest_dataset.py               
+• Ingest only the first 2 000 rows (default):
+    python data_ingest.py
 
 • Ingest at most 500 rows:
-    python ingest_dataset.py --max-records 500
+    python data_ingest.py --max-records 500
+
+• Ingest the full dataset with larger batches and 8 writers:
+    python data_ingest.py --batch-size 500 --workers 8 --max-records -1
+
+• Offline run from a local export:
+    python data_ingest.py --source ./augmented-clinical-notes.parquet --max-records -1
 
-• Ingest the full dataset but use larger batch writes:
-    python ingest_dataset.py --batch-size 500 --max-records -1
+• Drop records ≥ 95 % similar to a recent one, and list the pairs:
+    python data_ingest.py --near-duplicates skip --duplicate-threshold 0.95 \
+        --duplicates-report duplicates.jsonl
 
 Prerequisites
 -------------
 • .env file with ATLAS_URI (and optionally MONGODB_PASSWORD)
-• `pip install datasets pymongo python-dotenv tqdm`
+• `pip install datasets pymongo python-dotenv tqdm` (`pyarrow` for Parquet,
+  `numpy` for the near-duplicate check)
 """
 
 from __future__ import annotations
 
 import argparse
+import itertools
+import json
 import logging
-from typing import Dict, List
+import queue
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
 
 from dotenv import load_dotenv
-from datasets import load_dataset
 from tqdm import tqdm
 
 from helper_mongo import MongoDBHelper
@@ -45,60 +75,282 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+DEFAULT_SOURCE = "AGBonnet/augmented-clinical-notes"
+NEAR_DUPLICATE_MODES = ("off", "flag", "skip")
+
+
+# ---------------------------------------------------------------------------
+# Record sources (all lazy)
+# ---------------------------------------------------------------------------
+
+def _iter_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    with path.open("r", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _iter_parquet(path: Path, batch_size: int) -> Iterator[Dict[str, Any]]:
+    import pyarrow.parquet as pq
+
+    pf = pq.ParquetFile(path)
+    for batch in pf.iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+
+def iter_records(source: str, max_records: int, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """Yield raw dataset rows from *source* without materialising the split."""
+    path = Path(source)
+    if path.suffix in {".jsonl", ".json"} and path.exists():
+        rows: Iterable[Dict[str, Any]] = _iter_jsonl(path)
+    elif path.suffix == ".parquet" and path.exists():
+        rows = _iter_parquet(path, batch_size)
+    else:
+        from datasets import load_dataset
+
+        rows = load_dataset(source, split="train", streaming=True)
+
+    return iter(rows) if max_records < 0 else itertools.islice(rows, max_records)
+
+
+def to_doc(rec: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    conversation = rec.get("conversation")
+    note = rec.get("note") or rec.get("notes")
+    idx = rec.get("idx")
+    if conversation is None or note is None or idx is None:
+        return None  # skip incomplete rows
+    return {"patient_id": str(idx), "conversation": conversation, "note": note}
+
+
+def iter_batches(records: Iterable[Dict[str, Any]], batch_size: int) -> Iterator[List[Dict[str, str]]]:
+    batch: List[Dict[str, str]] = []
+    for rec in records:
+        doc = to_doc(rec)
+        if doc is None:
+            continue
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ---------------------------------------------------------------------------
+# Near-duplicate detection
+# ---------------------------------------------------------------------------
+
+_WORD = re.compile(r"[a-z0-9]+")
+_PRIME = (1 << 31) - 1  # keeps a·h + b below 2⁶³ for 32-bit CRCs
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """Word *size*-grams of the normalized text (the whole text when shorter)."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class NearDuplicates:
+    """
+    Flags records whose note + conversation shingles are at least
+    *threshold* similar (estimated Jaccard) to one of the last *window*
+    records seen in the run.
+
+    Signatures are *num_perm* MinHash values computed with NumPy over the
+    CRC32 of each shingle; banded LSH (*bands* bands) picks the candidates.
+    Only the *window* most recent signatures are kept, so memory is bounded
+    (about 0.5 KB per record) however large the dataset.  Thread-safe:
+    writers sign their own batches and only the lookup is serialized.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        report: Optional[TextIO] = None,
+        window: int = 100_000,
+        num_perm: int = 64,
+        bands: int = 16,
+        seed: int = 1,
+    ) -> None:
+        try:
+            import numpy as np
+        except ImportError:
+            raise ValueError("The near-duplicate check needs numpy (pip install numpy)") from None
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.np = np
+        self.threshold = threshold
+        self.report = report
+        self.window = window
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._signatures: "OrderedDict[str, Any]" = OrderedDict()
+        self._buckets: List[Dict[bytes, Set[str]]] = [{} for _ in range(bands)]
+        self._lock = threading.Lock()
+        self.found = 0
+
+    def signature(self, features: Iterable[str]) -> Any:
+        np = self.np
+        hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint64)
+        if not hashes.size:
+            raise ValueError("Cannot sign an empty feature set")
+        return ((self._a * hashes + self._b) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: Any) -> List[bytes]:
+        r = self.rows
+        return [signature[i * r:(i + 1) * r].tobytes() for i in range(self.bands)]
+
+    def _add(self, key: str, signature: Any, bands: List[bytes]) -> None:
+        self._remove(key)
+        self._signatures[key] = signature
+        for band, h in zip(self._buckets, bands):
+            band.setdefault(h, set()).add(key)
+        while len(self._signatures) > self.window:
+            self._remove(next(iter(self._signatures)))
+
+    def _remove(self, key: str) -> None:
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band, h in zip(self._buckets, self._band_keys(signature)):
+            bucket = band[h]
+            bucket.discard(key)
+            if not bucket:
+                del band[h]
+
+    def check(self, doc: Dict[str, str]) -> Optional[Tuple[str, float]]:
+        """`(patient_id, similarity)` of the closest recent record over the threshold, else None."""
+        features = shingles(f"{doc['note']} {doc['conversation']}")
+        if not features:
+            return None
+        key = doc["patient_id"]
+        signature = self.signature(features)
+        bands = self._band_keys(signature)
+        with self._lock:
+            candidates: Set[str] = set()
+            for band, h in zip(self._buckets, bands):
+                candidates |= band.get(h, set())
+            candidates.discard(key)
+            best: Optional[Tuple[str, float]] = None
+            for other in candidates:
+                similarity = float(self.np.count_nonzero(self._signatures[other] == signature)) / len(signature)
+                if best is None or (similarity, other) > (best[1], best[0]):
+                    best = (other, similarity)
+            self._add(key, signature, bands)
+            if best is None or best[1] < self.threshold:
+                return None
+            self.found += 1
+            if self.report is not None:
+                self.report.write(json.dumps({"patient_id": key, "duplicate_of": best[0], "similarity": best[1]}) + "\n")
+        logger.warning("Record %s is a near-duplicate of %s (similarity %.2f)", key, best[0], best[1])
+        return best
+
 
 # ---------------------------------------------------------------------------
 # Ingestion logic
 # ---------------------------------------------------------------------------
 
-def ingest(batch_size: int, max_records: int) -> None:
-    """Stream (up to) *max_records* examples into MongoDB."""
+class _Stats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.written = 0
+        self.upserted = 0
+        self.modified = 0
+        self.failed_batches = 0
+
+    def add(self, n_docs: int, counts: Dict[str, int]) -> None:
+        with self.lock:
+            self.written += n_docs
+            self.upserted += counts.get("upserted", 0)
+            self.modified += counts.get("modified", 0)
+
+
+def ingest(
+    batch_size: int,
+    max_records: int,
+    source: str = DEFAULT_SOURCE,
+    workers: int = 4,
+    near_duplicates: str = "off",
+    duplicate_threshold: float = 0.9,
+    duplicates_report: Optional[str] = None,
+    duplicate_window: int = 100_000,
+) -> None:
+    """Stream (up to) *max_records* examples into MongoDB with *workers* writers."""
+    if near_duplicates not in NEAR_DUPLICATE_MODES:
+        raise ValueError(f"Unknown near-duplicate mode '{near_duplicates}' (expected one of {NEAR_DUPLICATE_MODES})")
+
+    report = open(duplicates_report, "w", encoding="utf-8") if duplicates_report else None
+    detector = (
+        NearDuplicates(duplicate_threshold, report, window=duplicate_window)
+        if near_duplicates != "off" else None
+    )
 
     # 1) Connect to MongoDB -------------------------------------------------
     mongo_helper = MongoDBHelper()
+    stats = _Stats()
+    # At most two batches waiting per writer → bounded memory.
+    batches: "queue.Queue[Optional[List[Dict[str, str]]]]" = queue.Queue(maxsize=max(workers, 1) * 2)
+    progress = tqdm(total=None if max_records < 0 else max_records, desc="Ingesting", unit="doc")
 
-    try:
-        # 2) Load dataset ---------------------------------------------------
-        split_arg = "train" if max_records < 0 else f"train[:{max_records}]"
-        logger.info("Loading split '%s' from dataset …", split_arg)
-        ds = load_dataset("AGBonnet/augmented-clinical-notes", split=split_arg)
-        total = len(ds)
-        logger.info("Loaded %d records", total)
-
-        # 3) Iterate & batch-insert ----------------------------------------
-        batch: List[Dict[str, str]] = []
-        inserted_total = 0
-
-        for i, rec in enumerate(tqdm(ds, total=total, desc="Processing")):
-            conversation = rec.get("conversation")
-            note = rec.get("note") or rec.get("notes")
-            idx = rec.get("idx")
-
-            if conversation is None or note is None or idx is None:
-                continue  # skip incomplete rows
-
-            batch.append(
-                {
-                    "patient_id": str(idx),
-                    "conversation": conversation,
-                    "note": note,
-                }
-            )
-
-            flush = len(batch) >= batch_size or i == total - 1
-            if flush:
-                try:
-                    n_inserted = mongo_helper.add_many_conversations(batch)
-                    inserted_total += n_inserted
-                    logger.info("Batch inserted %d / %d docs", n_inserted, len(batch))
-                except Exception as exc:
-                    logger.error("Batch insert failed: %s", exc)
-                finally:
-                    batch = []
-
-        logger.info("Ingestion complete → %d documents inserted", inserted_total)
+    def writer() -> None:
+        while True:
+            batch = batches.get()
+            if batch is None:
+                return
+            n_read = len(batch)
+            try:
+                if detector is not None:
+                    unique = [doc for doc in batch if detector.check(doc) is None]
+                    if near_duplicates == "skip":
+                        batch = unique
+                if batch:
+                    counts = mongo_helper.upsert_many_conversations(batch)
+                    stats.add(len(batch), counts)
+            except Exception as exc:
+                logger.error("Batch upsert failed: %s", exc)
+                with stats.lock:
+                    stats.failed_batches += 1
+            finally:
+                progress.update(n_read)
 
+    threads = [threading.Thread(target=writer, name=f"ingest-writer-{i}", daemon=True) for i in range(max(workers, 1))]
+    for t in threads:
+        t.start()
+
+    started = time.perf_counter()
+    try:
+        # 2) Stream dataset → bounded queue → writers (near-duplicate check) -
+        logger.info("Streaming records from '%s' …", source)
+        for batch in iter_batches(iter_records(source, max_records, batch_size), batch_size):
+            batches.put(batch)
     finally:
+        for _ in threads:
+            batches.put(None)
+        for t in threads:
+            t.join()
+        progress.close()
         mongo_helper.close()
+        if report is not None:
+            report.close()
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        "Ingestion complete → %d documents written (%d new, %d updated, %d failed batches) "
+        "in %.1fs — %.0f docs/sec",
+        stats.written, stats.upserted, stats.modified, stats.failed_batches,
+        elapsed, stats.written / elapsed if elapsed else 0.0,
+    )
+    if detector is not None:
+        logger.info(
+            "%d near-duplicate records %s (threshold %.2f)",
+            detector.found, "skipped" if near_duplicates == "skip" else "flagged", duplicate_threshold,
+        )
 
 
 # ---------------------------------------------------------------------------
@@ -113,7 +365,7 @@ def main() -> None:
         "--batch-size",
         type=int,
         default=100,
-        help="Number of documents per bulk insert (default: 100)",
+        help="Number of documents per bulk upsert (default: 100)",
     )
     parser.add_argument(
         "--max-records",
@@ -121,9 +373,54 @@ def main() -> None:
         default=2000,
         help="Maximum number of rows to ingest (default: 2000, -1 for all)",
     )
+    parser.add_argument(
+        "--source",
+        default=DEFAULT_SOURCE,
+        help="Hugging Face dataset name or local .parquet/.jsonl file "
+             f"(default: {DEFAULT_SOURCE})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Concurrent Mongo writer threads (default: 4)",
+    )
+    parser.add_argument(
+        "--near-duplicates",
+        choices=NEAR_DUPLICATE_MODES,
+        default="off",
+        help="Log near-duplicate records (flag), leave them out (skip) or skip the check (off); "
+             "needs numpy (default: off)",
+    )
+    parser.add_argument(
+        "--duplicate-threshold",
+        type=float,
+        default=0.9,
+        help="Estimated Jaccard similarity of note + conversation shingles at which a record "
+             "counts as a near-duplicate (default: 0.9)",
+    )
+    parser.add_argument(
+        "--duplicates-report",
+        help="Write the near-duplicate pairs to this JSONL file",
+    )
+    parser.add_argument(
+        "--duplicate-window",
+        type=int,
+        default=100_000,
+        help="Compare each record against this many of the most recent ones (default: 100000)",
+    )
     args = parser.parse_args()
 
-    ingest(batch_size=args.batch_size, max_records=args.max_records)
+    ingest(
+        batch_size=args.batch_size,
+        max_records=args.max_records,
+        source=args.source,
+        workers=args.workers,
+        near_duplicates=args.near_duplicates,
+        duplicate_threshold=args.duplicate_threshold,
+        duplicates_report=args.duplicates_report,
+        duplicate_window=args.duplicate_window,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,230 @@
+"""
+Build the frontend for production: minify, fingerprint and precompress.
+
+For every file under `static/`:
+  • JS and CSS are minified (comments and indentation dropped; line breaks
+    are kept so automatic semicolon insertion behaves as before),
+  • the output is named after its content – `js/patient.3f2a91c0.js` – so it
+    can be cached forever and a change always produces a new URL,
+  • `.gz` (and `.br` when `brotli` is installed) siblings are written next
+    to it, so the server never compresses per request.
+
+The HTML pages are copied with their `/static/...` references rewritten to
+the fingerprinted names (and precompressed too).  `dist/manifest.json` maps
+each source path to its output; `api/static_assets.py` serves from it.
+
+Usage examples
+--------------
+• Build into frontend/dist (run after every frontend change / at deploy):
+    python frontend/build.py
+
+• Just print the size report of what would be built:
+    python frontend/build.py --dry-run
+
+Prerequisites
+-------------
+• None (`pip install brotli` adds .br variants)
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import re
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional
+
+FRONTEND_DIR = Path(__file__).resolve().parent
+COMPRESSIBLE = {".js", ".css", ".html", ".svg", ".json", ".txt", ".map"}
+MIN_COMPRESS_BYTES = 256
+_STATIC_REF = re.compile(r"""(["'(])/static/([^"'()?#\s]+)""")
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+# ───────────────────────────────────────────────────────────────
+# Minifiers
+# ───────────────────────────────────────────────────────────────
+_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^") | {""}
+
+
+def minify_js(source: str) -> str:
+    """
+    Drop comments, indentation and repeated blanks outside string, template
+    and regex literals (which are kept byte for byte); empty lines disappear,
+    other line breaks stay.
+    """
+    out: List[str] = []
+    literals: List[str] = []
+    i, n = 0, len(source)
+    last = ""          # last significant character (regex-vs-division heuristic)
+    templates = []     # brace depth per open `${` inside template literals
+
+    def literal(text: str) -> None:
+        nonlocal last
+        out.append(f"\x00{len(literals)}\x00")
+        literals.append(text)
+        last = "a"  # a value: a following "/" divides
+
+    while i < n:
+        ch = source[i]
+        nxt = source[i + 1] if i + 1 < n else ""
+        if ch in "'\"":
+            j = i + 1
+            while j < n and source[j] != ch and source[j] != "\n":
+                j += 2 if source[j] == "\\" else 1
+            literal(source[i:j + 1])
+            i = j + 1
+        elif ch == "`" or (ch == "}" and templates and templates[-1] == 0):
+            if ch == "}":
+                templates.pop()
+            j = i + 1
+            while j < n and source[j] != "`" and source[j:j + 2] != "${":
+                j += 2 if source[j] == "\\" else 1
+            if source[j:j + 2] == "${":
+                templates.append(0)
+                j += 1
+            literal(source[i:j + 1])
+            i = j + 1
+        elif ch == "/" and nxt == "/":
+            while i < n and source[i] != "\n":
+                i += 1
+        elif ch == "/" and nxt == "*":
+            end = source.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            out.append(" ")
+        elif ch == "/" and (last in _REGEX_PRECEDERS or re.search(r"\breturn\s*$", "".join(out[-8:]))):
+            j, in_class = i + 1, False
+            while j < n and source[j] != "\n" and (in_class or source[j] != "/"):
+                if source[j] == "\\":
+                    j += 1
+                elif source[j] == "[":
+                    in_class = True
+                elif source[j] == "]":
+                    in_class = False
+                j += 1
+            j += 1
+            while j < n and source[j].isalpha():  # flags
+                j += 1
+            literal(source[i:j])
+            i = j
+        else:
+            if templates and ch == "{":
+                templates[-1] += 1
+            elif templates and ch == "}":
+                templates[-1] -= 1
+            out.append(ch)
+            if not ch.isspace():
+                last = ch
+            i += 1
+
+    lines = (re.sub(r"[ \t]+", " ", line.strip()) for line in "".join(out).split("\n"))
+    code = "\n".join(line for line in lines if line) + "\n"
+    return re.sub(r"\x00(\d+)\x00", lambda m: literals[int(m.group(1))], code)
+
+
+def minify_css(source: str) -> str:
+    source = re.sub(r"/\*.*?\*/", "", source, flags=re.S)
+    source = re.sub(r"\s+", " ", source)
+    source = re.sub(r"\s*([{};,>])\s*", r"\1", source)
+    source = re.sub(r":\s+", ":", source)  # "color: red" – but keep "a :hover" distinct from "a:hover"
+    return source.replace(";}", "}").strip() + "\n"
+
+
+MINIFIERS = {".js": minify_js, ".css": minify_css}
+
+
+# ───────────────────────────────────────────────────────────────
+# Build
+# ───────────────────────────────────────────────────────────────
+def fingerprint(rel: Path, data: bytes) -> Path:
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    return rel.with_name(f"{rel.stem}.{digest}{rel.suffix}")
+
+
+def write_variants(path: Path, data: bytes, dry_run: bool) -> Dict[str, int]:
+    """Write *data* to *path* plus .gz/.br siblings; return the byte size of each."""
+    sizes = {"raw": len(data)}
+    variants = {}
+    if path.suffix in COMPRESSIBLE and len(data) >= MIN_COMPRESS_BYTES:
+        variants[".gz"] = gzip.compress(data, compresslevel=9, mtime=0)
+        brotli = _brotli()
+        if brotli is not None:
+            variants[".br"] = brotli.compress(data, quality=11)
+    for suffix, blob in variants.items():
+        sizes[suffix.lstrip(".")] = len(blob)
+    if not dry_run:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        for suffix, blob in variants.items():
+            path.with_name(path.name + suffix).write_bytes(blob)
+    return sizes
+
+
+def rewrite_html(html: str, assets: Dict[str, str]) -> str:
+    def replace(match: re.Match) -> str:
+        target = assets.get(match.group(2))
+        return f"{match.group(1)}/static/{target}" if target else match.group(0)
+    return _STATIC_REF.sub(replace, html)
+
+
+def build(src: Path = FRONTEND_DIR, out: Optional[Path] = None, dry_run: bool = False) -> Dict[str, object]:
+    out = out or src / "dist"
+    if not dry_run and out.exists():
+        shutil.rmtree(out)
+
+    assets: Dict[str, str] = {}
+    report: List[Dict[str, object]] = []
+    for path in sorted((src / "static").rglob("*")):
+        if not path.is_file():
+            continue
+        rel = path.relative_to(src / "static")
+        data = path.read_bytes()
+        minify = MINIFIERS.get(path.suffix)
+        built = minify(data.decode("utf-8")).encode("utf-8") if minify else data
+        target = fingerprint(rel, built)
+        assets[rel.as_posix()] = target.as_posix()
+        sizes = write_variants(out / "static" / target, built, dry_run)
+        report.append({"file": f"static/{rel.as_posix()}", "source": len(data), **sizes})
+
+    pages: Dict[str, str] = {}
+    for path in sorted(src.glob("*.html")):
+        html = rewrite_html(path.read_text(encoding="utf-8"), assets).encode("utf-8")
+        pages[path.name] = hashlib.sha256(html).hexdigest()[:16]  # ETag
+        sizes = write_variants(out / path.name, html, dry_run)
+        report.append({"file": path.name, "source": path.stat().st_size, **sizes})
+
+    manifest = {"assets": assets, "pages": pages}
+    if not dry_run:
+        (out / "manifest.json").write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return {"manifest": manifest, "report": report}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Minify, fingerprint and precompress the ClinAI frontend")
+    parser.add_argument("--src", type=Path, default=FRONTEND_DIR)
+    parser.add_argument("--out", type=Path, help="Output directory (default: <src>/dist)")
+    parser.add_argument("--dry-run", action="store_true", help="Report sizes without writing anything")
+    args = parser.parse_args()
+
+    result = build(args.src, args.out, args.dry_run)
+    if _brotli() is None:
+        print("brotli not installed; writing .gz variants only")
+    print(f"{'file':<36} {'source':>8} {'min':>8} {'gzip':>8} {'brotli':>8}")
+    for row in result["report"]:
+        print(f"{row['file']:<36} {row['source']:>8} {row['raw']:>8} {row.get('gz', '-'):>8} {row.get('br', '-'):>8}")
+    if not args.dry_run:
+        print(f"\nWrote {args.out or args.src / 'dist'}")
+
+
+if __name__ == "__main__":
+    main()
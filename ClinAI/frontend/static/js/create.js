@@ -16,6 +16,29 @@ const backBtn = document.getElementById('backBtn');
 const discardConfirmModal = new bootstrap.Modal(document.getElementById('discardConfirmModal'));
 const confirmDiscardBtn = document.getElementById('confirmDiscardBtn');
 
+// Start extraction while the clinician reviews the transcript; /save_record
+// reuses the results when the text is saved unchanged.  The form id lets the
+// server cancel this form's previous prefetch once the text has changed.
+const prefetchForm = Math.random().toString(36).slice(2) + Date.now().toString(36);
+let lastPrefetched = null;
+
+function prefetchEnrichment() {
+  const conversation = conversationText.value.trim();
+  const notes = editedNotes.value.trim();
+  if (!conversation && !notes) return;
+  const key = `${notes}\u0000${conversation}`;
+  if (key === lastPrefetched) return;
+  lastPrefetched = key;
+  fetch('/api/enrich:prefetch', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ conversation, notes, form: prefetchForm })
+  }).catch(err => console.warn("[ClinAI] prefetch failed", err));
+}
+
+conversationText?.addEventListener('change', prefetchEnrichment);
+editedNotes?.addEventListener('change', prefetchEnrichment);
+
 function generateRandomId() {
   return Math.floor(Math.random() * 1e6).toString().padStart(6, '0');
 }
@@ -62,6 +85,7 @@ startBtn?.addEventListener('click', async () => {
       editedNotes.value = notesInput.value;
       modalPatientId.value = patientIdInput.value;
       modal.show();
+      prefetchEnrichment();
     };
 
     mediaRecorder.start();
@@ -125,23 +149,34 @@ document.getElementById('continueRecording')?.addEventListener('click', () => {
   modal.hide();
 });
 
+// Double-clicks and retries of an unchanged record reuse one Idempotency-Key,
+// so the server saves it once and replays the response
+let saveAttempt = { body: null, key: null };
+
 document.getElementById('saveRecord')?.addEventListener('click', async () => {
   const payload = {
     idx: modalPatientId.value,
     conversation: conversationText.value,
     notes: editedNotes.value
   };
+  const body = JSON.stringify(payload);
+  if (saveAttempt.body !== body) {
+    saveAttempt = { body, key: crypto.randomUUID() };
+  }
 
   try {
     const response = await fetch('/save_record', {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(payload)
+      headers: { 'Content-Type': 'application/json', 'Idempotency-Key': saveAttempt.key },
+      body
     });
 
     const result = await response.json();
     if (response.ok) {
-      alert(result.message || 'Record saved successfully!');
+      const pending = result.pending_fields && result.pending_fields.length
+        ? `\nStill processing: ${result.pending_fields.join(', ')} (they will appear on the patient page shortly).`
+        : '';
+      alert((result.message || 'Record saved successfully!') + pending);
       modal.hide();
     } else {
       alert(result.error || 'Failed to save record.');
@@ -168,6 +203,7 @@ document.getElementById('manualCreateBtn')?.addEventListener('click', async () =
     editedNotes.value = notesInput.value;
     modalPatientId.value = patientIdInput.value;
     modal.show();
+    prefetchEnrichment();
   }
 });
 
@@ -1,6 +1,46 @@
 // Get patient ID from URL
 const patientId = window.location.pathname.split('/').pop();
 
+// Regenerate a field server-side, calling onToken with each piece of text as
+// it is generated (Server-Sent Events over a POST); resolves to the final,
+// persisted text.
+async function streamRegeneration(field, onToken) {
+  const response = await fetch(`/api/patient/${patientId}/${field}:regenerate`, { method: 'POST' });
+  if (!response.ok || !response.body) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      const event = (block.match(/^event: (.*)$/m) || [])[1];
+      const payload = JSON.parse((block.match(/^data: (.*)$/m) || [])[1] || '{}');
+      if (event === 'token') onToken(payload.text);
+      else if (event === 'done') return payload.text;
+      else if (event === 'error') throw new Error(payload.error);
+    }
+  }
+  throw new Error('Stream ended before the text was saved');
+}
+
+function parseTimeline(timeline) {
+  if (!timeline || timeline === "[]") return [];
+  try {
+    // Parse the string representation of the list
+    return JSON.parse(timeline.replace(/'/g, '"'));
+  } catch (e) {
+    // If parsing fails, treat as single event
+    return [timeline];
+  }
+}
+
 async function fetchPatientData() {
   try {
     const response = await fetch(`/api/patient/${patientId}`);
@@ -17,14 +57,28 @@ async function fetchPatientData() {
     document.getElementById('patientAge').textContent = data.age || 'N/A';
     document.getElementById('patientGender').textContent = data.gender || 'N/A';
 
+    // Fields the save could not finish in time are still being extracted
+    const pendingNotice = document.getElementById('pendingNotice');
+    if (data.pending_fields && data.pending_fields.length) {
+      pendingNotice.textContent = `Still processing: ${data.pending_fields.join(', ')}. Reload the page in a moment to see them.`;
+      pendingNotice.style.display = '';
+    } else {
+      pendingNotice.style.display = 'none';
+    }
+
     // Summary - make it editable
     const summaryContainer = document.getElementById('summaryContent').parentElement;
     summaryContainer.innerHTML = `
       <div class="summary-header d-flex justify-content-between align-items-center mb-3">
         <h6 class="mb-0">Summary</h6>
-        <button class="btn btn-sm btn-outline-primary" id="editSummaryBtn">
-          <i class="bi bi-pencil"></i> Edit
-        </button>
+        <div>
+          <button class="btn btn-sm btn-outline-secondary" id="regenerateSummaryBtn">
+            <i class="bi bi-arrow-repeat"></i> Regenerate
+          </button>
+          <button class="btn btn-sm btn-outline-primary" id="editSummaryBtn">
+            <i class="bi bi-pencil"></i> Edit
+          </button>
+        </div>
       </div>
       <div id="summaryDisplay" class="summary-display">
         ${data.summary || 'No summary available.'}
@@ -81,6 +135,23 @@ async function fetchPatientData() {
       }
     });
 
+    document.getElementById('regenerateSummaryBtn').addEventListener('click', async () => {
+      const button = document.getElementById('regenerateSummaryBtn');
+      const display = document.getElementById('summaryDisplay');
+      button.disabled = true;
+      display.textContent = '';
+      try {
+        data.summary = await streamRegeneration('summary', text => { display.textContent += text; });
+        display.textContent = data.summary;
+        document.getElementById('summaryTextarea').value = data.summary;
+      } catch (error) {
+        display.textContent = data.summary || 'No summary available.';
+        alert('Error regenerating summary: ' + error.message);
+      } finally {
+        button.disabled = false;
+      }
+    });
+
     // Prescriptions - make it editable with add/delete functionality
     const prescriptionsTable = document.getElementById('prescriptionsTable');
     prescriptionsTable.innerHTML = '';
@@ -259,16 +330,7 @@ async function fetchPatientData() {
     const timelineContent = document.getElementById('timelineContent');
     timelineContent.innerHTML = '';
     
-    let timelineEvents = [];
-    if (data.timeline && data.timeline !== "[]") {
-      try {
-        // Parse the string representation of the list
-        timelineEvents = JSON.parse(data.timeline.replace(/'/g, '"'));
-      } catch (e) {
-        // If parsing fails, treat as single event
-        timelineEvents = [data.timeline];
-      }
-    }
+    let timelineEvents = parseTimeline(data.timeline);
 
     // Timeline editing state
     let editingIndex = -1;
@@ -281,6 +343,9 @@ async function fetchPatientData() {
             <button class="btn btn-primary mt-2" onclick="addTimelineEvent(0)">
               <i class="bi bi-plus-circle"></i> Add First Event
             </button>
+            <button class="btn btn-outline-secondary mt-2" onclick="regenerateTimeline()">
+              <i class="bi bi-arrow-repeat"></i> Regenerate
+            </button>
           </div>
         `;
         return;
@@ -328,6 +393,9 @@ async function fetchPatientData() {
           <button class="btn btn-secondary btn-sm" onclick="cancelAllTimelineChanges()">
             <i class="bi bi-x-circle"></i> Cancel Changes
           </button>
+          <button class="btn btn-outline-secondary btn-sm" onclick="regenerateTimeline()">
+            <i class="bi bi-arrow-repeat"></i> Regenerate
+          </button>
         </div>
         <div class="timeline-scroll-container">
           <div class="timeline-add-start">
@@ -582,6 +650,19 @@ async function fetchPatientData() {
       }
     };
 
+    window.regenerateTimeline = async function() {
+      // The raw list text streams in first; it becomes cards once it is saved
+      timelineContent.innerHTML = '<div class="timeline-empty"><pre id="timelineStream" style="white-space: pre-wrap;"></pre></div>';
+      const stream = document.getElementById('timelineStream');
+      try {
+        timelineEvents = parseTimeline(await streamRegeneration('timeline', text => { stream.textContent += text; }));
+      } catch (error) {
+        alert('Error regenerating timeline: ' + error.message);
+      }
+      editingIndex = -1;
+      renderTimeline();
+    };
+
     window.cancelAllTimelineChanges = function() {
       if (confirm('Are you sure you want to cancel all changes? This will reload the page.')) {
         location.reload();
@@ -624,5 +705,39 @@ document.getElementById('saveKeywordsBtn')?.addEventListener('click', async () =
   }
 });
 
+// Similar patients (by shared keywords and drugs), loaded when the tab is first opened
+async function fetchSimilarPatients() {
+  const table = document.getElementById('similarTable');
+  try {
+    const response = await fetch(`/api/patient/${patientId}/similar`);
+    if (response.status === 404) {
+      table.innerHTML = '<tr><td colspan="4">No keywords or prescriptions to compare yet.</td></tr>';
+      return;
+    }
+    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+    const { results } = await response.json();
+    if (!results.length) {
+      table.innerHTML = '<tr><td colspan="4">No similar patients found.</td></tr>';
+      return;
+    }
+    table.innerHTML = '';
+    results.forEach(patient => {
+      const row = table.insertRow();
+      const link = document.createElement('a');
+      link.href = `/patient/${patient.patient_id}`;
+      link.textContent = patient.name ? `${patient.name} (${patient.patient_id})` : patient.patient_id;
+      row.insertCell().appendChild(link);
+      row.insertCell().textContent = `${Math.round(patient.similarity * 100)}%`;
+      row.insertCell().textContent = patient.shared_keywords.join(', ');
+      row.insertCell().textContent = patient.shared_drugs.join(', ');
+    });
+  } catch (error) {
+    console.error('Error fetching similar patients:', error);
+    table.innerHTML = '<tr><td colspan="4">Failed to load similar patients.</td></tr>';
+  }
+}
+
+document.getElementById('similar-tab')?.addEventListener('shown.bs.tab', fetchSimilarPatients, { once: true });
+
 // Fetch data on load
 fetchPatientData();
\ No newline at end of file
@@ -4,25 +4,39 @@ const searchBtn = document.getElementById('searchBtn');
 const resultsContainer = document.getElementById('resultsContainer');
 const searchResults = document.getElementById('searchResults');
 const loadingSpinner = document.getElementById('loadingSpinner');
+const suggestionsBox = document.getElementById('suggestions');
+
+// Autocomplete state
+let suggestions = [];
+let activeSuggestion = -1;
+let suggestTimer = null;
+let suggestSeq = 0;
 
 // Search functionality
-async function performSearch(query) {
+// `suggestion` ({kind, term}) runs an exact indexed match and skips the AI pipeline.
+async function performSearch(query, suggestion = null) {
     if (!query.trim()) {
         alert('Please enter a search query');
         return;
     }
 
+    hideSuggestions();
+
     // Show loading
     loadingSpinner.style.display = 'block';
     resultsContainer.style.display = 'none';
 
     try {
+        const body = { query: query.trim() };
+        if (suggestion) {
+            body.suggestion = { kind: suggestion.kind, term: suggestion.term };
+        }
         const response = await fetch('/api/search', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ query: query.trim() })
+            body: JSON.stringify(body)
         });
 
         if (!response.ok) {
@@ -116,6 +130,50 @@ function truncateText(text, maxLength) {
     return text.substr(0, maxLength) + '...';
 }
 
+// Autocomplete
+async function fetchSuggestions(q) {
+    const seq = ++suggestSeq;
+    try {
+        const response = await fetch(`/api/suggest?q=${encodeURIComponent(q)}&limit=8`);
+        if (!response.ok) return;
+        const data = await response.json();
+        if (seq !== suggestSeq) return; // a newer keystroke already went out
+        suggestions = data.suggestions || [];
+        activeSuggestion = -1;
+        renderSuggestions();
+    } catch (error) {
+        console.error('Suggest error:', error);
+    }
+}
+
+function renderSuggestions() {
+    if (suggestions.length === 0) {
+        hideSuggestions();
+        return;
+    }
+    suggestionsBox.innerHTML = suggestions.map((s, i) => `
+        <button type="button" class="list-group-item list-group-item-action suggest-item ${i === activeSuggestion ? 'active' : ''}" data-index="${i}">
+            <span>${s.term}<span class="suggest-kind">${s.kind}</span></span>
+            <span class="suggest-count">${s.count}</span>
+        </button>
+    `).join('');
+    suggestionsBox.style.display = 'block';
+}
+
+function hideSuggestions() {
+    suggestions = [];
+    activeSuggestion = -1;
+    suggestionsBox.style.display = 'none';
+    suggestionsBox.innerHTML = '';
+}
+
+function pickSuggestion(index) {
+    const suggestion = suggestions[index];
+    if (!suggestion) return;
+    searchInput.value = suggestion.term;
+    performSearch(suggestion.term, suggestion);
+}
+
 // Example search function
 function searchExample(query) {
     searchInput.value = query;
@@ -127,10 +185,47 @@ searchBtn.addEventListener('click', () => {
     performSearch(searchInput.value);
 });
 
-searchInput.addEventListener('keypress', (e) => {
-    if (e.key === 'Enter') {
-        performSearch(searchInput.value);
+searchInput.addEventListener('input', () => {
+    clearTimeout(suggestTimer);
+    const q = searchInput.value.trim();
+    if (q.length < 2) {
+        suggestSeq++;
+        hideSuggestions();
+        return;
     }
+    suggestTimer = setTimeout(() => fetchSuggestions(q), 80);
+});
+
+searchInput.addEventListener('keydown', (e) => {
+    if (e.key === 'ArrowDown' && suggestions.length) {
+        e.preventDefault();
+        activeSuggestion = (activeSuggestion + 1) % suggestions.length;
+        renderSuggestions();
+    } else if (e.key === 'ArrowUp' && suggestions.length) {
+        e.preventDefault();
+        activeSuggestion = (activeSuggestion - 1 + suggestions.length) % suggestions.length;
+        renderSuggestions();
+    } else if (e.key === 'Escape') {
+        hideSuggestions();
+    } else if (e.key === 'Enter') {
+        if (activeSuggestion >= 0) {
+            pickSuggestion(activeSuggestion);
+        } else {
+            performSearch(searchInput.value);
+        }
+    }
+});
+
+suggestionsBox.addEventListener('mousedown', (e) => {
+    const item = e.target.closest('.suggest-item');
+    if (item) {
+        e.preventDefault();
+        pickSuggestion(Number(item.dataset.index));
+    }
+});
+
+searchInput.addEventListener('blur', () => {
+    setTimeout(hideSuggestions, 150);
 });
 
 // Focus search input on page load
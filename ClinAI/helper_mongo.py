@@ -1,11 +1,15 @@
 """
 MongoDB helper functions for storing clinical conversations **and notes**.
 This module provides CRUD helpers for patient‑specific clinical data.
-Each document now *must* contain three required keys:
+Each record now *must* contain three required keys:
     - `patient_id`  : unique identifier (taken from the dataset's `idx`)
     - `conversation`: raw dialogue transcript
     - `note`        : associated clinician note
 
+As in the API's repository, `conversation` and `note` are stored compressed
+in a side collection (`api/bodies.py`); patient documents hold only the
+derived fields.
+
 Environment variables expected (see .env):
     ATLAS_URI          : full MongoDB Atlas connection string
     MONGODB_PASSWORD   : optional, only needed if ATLAS_URI contains the
@@ -16,11 +20,14 @@ from __future__ import annotations
 
 import logging
 import os
-from typing import Any, Dict, List, Optional
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
 
 import pymongo
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+
+from api.bodies import BODY_FIELDS, decode_body, encode_body, resolve_codec, split_record
 
 # ---------------------------------------------------------------------------
 # Environment & logging setup
@@ -45,6 +52,9 @@ class MongoDBHelper:
         connection_string: str | None = None,
         database_name: str = "clinical_data",
         collection_name: str = "patient_records",
+        ensure_indexes: bool = True,
+        bodies_collection_name: str = "patient_bodies",
+        body_codec: str = "zstd",
     ) -> None:
         # Resolve connection string  --------------------------------------
         if connection_string is None:
@@ -73,14 +83,24 @@ class MongoDBHelper:
             self.client: MongoClient = MongoClient(connection_string)
             self.db = self.client[database_name]
             self.collection = self.db[collection_name]
+            self.bodies = self.db[bodies_collection_name]
+            self.body_codec = resolve_codec(body_codec)
             logger.info(f"Connected to MongoDB: {database_name}.{collection_name}")
 
-            # Unique index on patient_id for O(1) look‑ups ----------------
-            self.collection.create_index("patient_id", unique=True)
+            # Long-lived processes create indexes once at startup and pass
+            # ensure_indexes=False to every later helper --------------------
+            if ensure_indexes:
+                self.ensure_indexes()
         except pymongo.errors.ConnectionFailure as exc:
             logger.error("Could not connect to MongoDB", exc_info=exc)
             raise
 
+    def ensure_indexes(self) -> None:
+        # Unique index on patient_id for O(1) look‑ups ----------------------
+        self.collection.create_index("patient_id", unique=True)
+        self.collection.create_index("updated_at")
+        self.bodies.create_index("patient_id", unique=True)
+
     # ---------------------------------------------------------------------
     # Insertion helpers
     # ---------------------------------------------------------------------
@@ -91,37 +111,108 @@ class MongoDBHelper:
         if missing:
             raise ValueError(f"Document missing required fields: {missing}")
 
+    def _write_bodies(self, items: List[Tuple[str, Dict[str, str]]]) -> None:
+        """Store (patient_id, body) pairs; bodies are written before the patient documents."""
+        if items:
+            self.bodies.bulk_write(
+                [
+                    UpdateOne(
+                        {"patient_id": pid},
+                        {"$set": encode_body(pid, body["conversation"], body["note"], self.body_codec)},
+                        upsert=True,
+                    )
+                    for pid, body in items
+                ],
+                ordered=False,
+            )
+
     def add_conversation(self, conversation_data: Dict[str, Any]) -> str:
         """Insert a single patient record."""
         self._validate_doc(conversation_data)
+        derived, body = split_record(conversation_data)
+        derived.setdefault("updated_at", datetime.now(timezone.utc))
         try:
-            result = self.collection.insert_one(conversation_data)
-            logger.info("Added record for patient ID %s", conversation_data["patient_id"])
-            return str(result.inserted_id)
+            result = self.collection.insert_one(derived)
         except pymongo.errors.DuplicateKeyError as exc:
-            logger.error("Duplicate patient_id %s", conversation_data["patient_id"])
+            logger.error("Duplicate patient_id %s", derived["patient_id"])
             raise exc
+        self._write_bodies([(derived["patient_id"], body)])
+        logger.info("Added record for patient ID %s", derived["patient_id"])
+        return str(result.inserted_id)
 
     def add_many_conversations(self, conversations: List[Dict[str, Any]]) -> int:
         """Bulk‑insert multiple patient records."""
+        now = datetime.now(timezone.utc)
         for conv in conversations:
             self._validate_doc(conv)
+        split = [split_record(conv) for conv in conversations]
+        derived = [{**d, "updated_at": d.get("updated_at", now)} for d, _ in split]
         try:
-            result = self.collection.insert_many(conversations, ordered=False)
-            logger.info("Inserted %d records", len(result.inserted_ids))
-            return len(result.inserted_ids)
+            result = self.collection.insert_many(derived, ordered=False)
+            inserted = len(result.inserted_ids)
+            logger.info("Inserted %d records", inserted)
         except pymongo.errors.BulkWriteError as exc:
             logger.warning("Bulk insert completed with errors: %s", exc.details)
-            return exc.details.get("nInserted", 0)
+            inserted = exc.details.get("nInserted", 0)
+            failed = {err["index"] for err in exc.details.get("writeErrors", [])}
+            split = [pair for i, pair in enumerate(split) if i not in failed]
+        # Bodies only for the records actually inserted, so a duplicate never
+        # overwrites the existing patient's text
+        self._write_bodies([(d["patient_id"], body) for d, body in split])
+        return inserted
+
+    def upsert_many_conversations(self, conversations: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Idempotent bulk write: one `$set` upsert per record, keyed on patient_id."""
+        now = datetime.now(timezone.utc)
+        for conv in conversations:
+            self._validate_doc(conv)
+        split = [split_record(conv) for conv in conversations]
+        unset = {f: "" for f in BODY_FIELDS}
+        ops = [
+            UpdateOne({"patient_id": d["patient_id"]}, {"$set": {**d, "updated_at": now}, "$unset": unset}, upsert=True)
+            for d, _ in split
+        ]
+        if not ops:
+            return {"upserted": 0, "modified": 0, "matched": 0}
+        self._write_bodies([(d["patient_id"], body) for d, body in split])
+        try:
+            result = self.collection.bulk_write(ops, ordered=False)
+            counts = {
+                "upserted": result.upserted_count,
+                "modified": result.modified_count,
+                "matched": result.matched_count,
+            }
+        except pymongo.errors.BulkWriteError as exc:
+            logger.warning("Bulk upsert completed with errors: %s", exc.details.get("writeErrors"))
+            counts = {
+                "upserted": exc.details.get("nUpserted", 0),
+                "modified": exc.details.get("nModified", 0),
+                "matched": exc.details.get("nMatched", 0),
+            }
+        logger.info("Upserted %(upserted)d, modified %(modified)d records", counts)
+        return counts
 
     # ---------------------------------------------------------------------
     # Retrieval helpers
     # ---------------------------------------------------------------------
     def get_conversation(self, patient_id: str) -> Optional[Dict[str, Any]]:
+        """The full record: derived fields plus the conversation and note."""
         doc = self.collection.find_one({"patient_id": patient_id}, {"_id": 0})
         logger.info("%sfound record for patient ID %s", "" if doc else "No ", patient_id)
+        if doc is not None:
+            doc.update(self.get_body(patient_id) or {})
         return doc
 
+    def get_body(self, patient_id: str) -> Optional[Dict[str, str]]:
+        """The raw conversation and note; inline ones for documents not yet migrated."""
+        doc = self.bodies.find_one({"patient_id": patient_id}, {"_id": 0})
+        if doc is not None:
+            return decode_body(doc)
+        legacy = self.collection.find_one({"patient_id": patient_id}, {"_id": 0, **{f: 1 for f in BODY_FIELDS}})
+        if legacy is None:
+            return None
+        return {f: legacy.get(f, "") for f in BODY_FIELDS}
+
     def get_conversations(
         self,
         query: Dict[str, Any] | None = None,
@@ -151,17 +242,30 @@ class MongoDBHelper:
         if not updates:
             logger.info("No updatable fields provided for patient %s", patient_id)
             return False
-        res = self.collection.update_one({"patient_id": patient_id}, {"$set": updates})
+        derived, _ = split_record(updates)
+        body_changed = any(f in updates for f in BODY_FIELDS)
+        if body_changed:
+            body = self.get_body(patient_id) or {f: "" for f in BODY_FIELDS}
+            body.update({f: updates[f] for f in BODY_FIELDS if f in updates})
+            self._write_bodies([(patient_id, body)])
+        derived["updated_at"] = datetime.now(timezone.utc)
+        change: Dict[str, Any] = {"$set": derived}
+        if body_changed:
+            change["$unset"] = {f: "" for f in BODY_FIELDS}
+        res = self.collection.update_one({"patient_id": patient_id}, change)
         logger.info("Updated %d record(s) for patient %s", res.modified_count, patient_id)
         return res.modified_count > 0
 
     def delete_conversation(self, patient_id: str) -> bool:
         res = self.collection.delete_one({"patient_id": patient_id})
+        self.bodies.delete_one({"patient_id": patient_id})
         logger.info("Deleted %d record(s) for patient %s", res.deleted_count, patient_id)
         return res.deleted_count > 0
 
     def delete_conversations(self, query: Dict[str, Any]) -> int:
+        patient_ids = self.collection.distinct("patient_id", query)
         res = self.collection.delete_many(query)
+        self.bodies.delete_many({"patient_id": {"$in": patient_ids}})
         logger.info("Deleted %d records", res.deleted_count)
         return res.deleted_count
 
@@ -180,8 +284,10 @@ class MongoDBHelper:
         fields: List[str] | None = None,
         limit: int = 10,
     ) -> List[Dict[str, Any]]:
+        # conversation/note are compressed out of the patient documents, so
+        # the searchable text is the derived fields
         if fields is None:
-            fields = ["conversation", "note"]
+            fields = ["summary", "keywords", "timeline"]
         or_clauses = [{field: {"$regex": text_query, "$options": "i"}} for field in fields]
         results = list(self.collection.find({"$or": or_clauses}, {"_id": 0}).limit(limit))
         logger.info("Search returned %d records for query '%s'", len(results), text_query)
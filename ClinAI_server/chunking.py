@@ -0,0 +1,199 @@
+"""
+Token-budgeted prompt construction for the extractor tools.
+
+Short encounters go to Gemini in one prompt, exactly as before.  When note +
+conversation exceed the per-call input budget, the transcript is split on
+speaker-turn boundaries into overlapping chunks, every chunk is extracted in
+parallel (map) and the partial answers are merged with de-duplication
+(reduce).  Wall-clock time is then roughly one chunk call plus the merge,
+instead of one call whose latency and truncation grow with the input.
+
+Budgets are approximate token counts (~4 characters per token for Gemini on
+English clinical text) and can be tuned with env vars:
+    CLINAI_CHUNK_TOKENS     input tokens per call       (default 4000)
+    CLINAI_CHUNK_OVERLAP    tokens repeated across cuts (default 200)
+    CLINAI_CHUNK_WORKERS    parallel chunk calls        (default 8)
+"""
+
+from __future__ import annotations
+
+import ast
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+CHUNK_TOKENS = int(os.getenv("CLINAI_CHUNK_TOKENS", "4000"))
+CHUNK_OVERLAP = int(os.getenv("CLINAI_CHUNK_OVERLAP", "200"))
+CHUNK_WORKERS = int(os.getenv("CLINAI_CHUNK_WORKERS", "8"))
+
+NO_PRESCRIPTIONS = "No prescriptions found."
+NO_KEYWORDS = "No main keywords found."
+MISSING = {"", "na", "n/a", "none", "unknown"}
+
+_executor = ThreadPoolExecutor(max_workers=CHUNK_WORKERS, thread_name_prefix="chunk")
+_TURN = re.compile(r"\n(?=\s*(?:Doctor|Patient|Dr\.?|Nurse)\s*:)", re.IGNORECASE)
+_SENTENCE = re.compile(r"(?<=[.?!])\s+")
+
+PromptBuilder = Callable[[str, str], str]
+
+
+# ───── Measuring ─────
+
+def estimate_tokens(text: str) -> int:
+    """Cheap, slightly pessimistic token estimate (no network round-trip)."""
+    if not text:
+        return 0
+    return max(len(text) // 4, len(text.split()))
+
+
+def prompt_tokens(build: PromptBuilder, note: str, conv: str) -> int:
+    return estimate_tokens(build(note, conv))
+
+
+# ───── Splitting ─────
+
+def _pieces(text: str, max_tokens: int) -> List[str]:
+    """Speaker turns; turns over budget are split on sentences, then hard-cut."""
+    out: List[str] = []
+    for turn in _TURN.split(text):
+        if estimate_tokens(turn) <= max_tokens:
+            out.append(turn)
+            continue
+        for sentence in _SENTENCE.split(turn):
+            while estimate_tokens(sentence) > max_tokens:
+                cut = max_tokens * 4
+                out.append(sentence[:cut])
+                sentence = sentence[cut:]
+            out.append(sentence)
+    return [p for p in out if p.strip()]
+
+
+def split_text(text: str, max_tokens: int, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Greedy pack of whole turns into chunks of ≤ *max_tokens*, repeating ~*overlap* tokens at each cut."""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for piece in _pieces(text, max_tokens):
+        tokens = estimate_tokens(piece)
+        if current and size + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            # carry the tail of the previous chunk so events spanning the cut survive
+            carried: List[str] = []
+            carried_size = 0
+            for prev in reversed(current):
+                t = estimate_tokens(prev)
+                if carried_size + t > overlap or carried_size + t + tokens > max_tokens:
+                    break
+                carried.insert(0, prev)
+                carried_size += t
+            current, size = carried, carried_size
+        current.append(piece)
+        size += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def plan_chunks(build: PromptBuilder, note: str, conv: str, budget: int = CHUNK_TOKENS) -> List[Tuple[str, str]]:
+    """(note, conversation) pairs whose prompts each fit *budget*; one pair when everything fits."""
+    if prompt_tokens(build, note, conv) <= budget:
+        return [(note, conv)]
+    room = max(budget - prompt_tokens(build, "", ""), 256)
+    note_tokens = estimate_tokens(note)
+    if note_tokens <= room // 2:
+        # A short note rides along with every transcript chunk for context
+        return [(note, part) for part in split_text(conv, room - note_tokens) if part.strip()]
+    # Empty parts would send prompts with nothing to extract from (and invite made-up items)
+    return (
+        [(part, "") for part in split_text(note, room) if part.strip()]
+        + [("", part) for part in split_text(conv, room) if part.strip()]
+    )
+
+
+def map_chunks(
+    build: PromptBuilder,
+    note: str,
+    conv: str,
+    call: Callable[[str], str],
+    budget: int = CHUNK_TOKENS,
+) -> List[str]:
+    """Run *call* on every chunk prompt in parallel; results keep chunk order."""
+    chunks = plan_chunks(build, note, conv, budget)
+    if len(chunks) == 1:
+        return [call(build(note, conv))]
+    print(f"[CHUNKING] {prompt_tokens(build, note, conv)} tokens → {len(chunks)} chunks")
+    return list(_executor.map(lambda pair: call(build(*pair)), chunks))
+
+
+# ───── Merging ─────
+
+def _norm(text: str) -> str:
+    return re.sub(r"\W+", " ", text.casefold()).strip()
+
+
+def merge_timeline(parts: List[str]) -> str:
+    """Concatenate per-chunk event lists in order, dropping repeats from chunk overlap."""
+    events: List[str] = []
+    seen = set()
+    for part in parts:
+        try:
+            items = ast.literal_eval(part.strip())
+            if not isinstance(items, (list, tuple)):
+                raise ValueError
+        except (ValueError, SyntaxError):
+            items = [line.strip(" -•*") for line in part.splitlines()]
+        for item in items:
+            item = str(item).strip()
+            if item and _norm(item) not in seen:
+                seen.add(_norm(item))
+                events.append(item)
+    return str(events)
+
+
+_RX_FIELD = re.compile(r"(Drug|Dose|Route|Status)\s*:\s*([^,\n]*)", re.IGNORECASE)
+
+
+def merge_prescriptions(parts: List[str]) -> str:
+    """One line per drug; later chunks win on status, known values beat 'NA'."""
+    drugs: Dict[str, Dict[str, str]] = {}
+    for part in parts:
+        for line in part.splitlines():
+            fields = {k.capitalize(): v.strip() for k, v in _RX_FIELD.findall(line)}
+            name = fields.get("Drug", "")
+            if name.lower() in MISSING:
+                continue
+            entry = drugs.setdefault(_norm(name), {"Drug": name, "Dose": "NA", "Route": "NA", "Status": "NA"})
+            for key in ("Dose", "Route", "Status"):
+                value = fields.get(key, "")
+                if value.lower() not in MISSING and (key == "Status" or entry[key] == "NA"):
+                    entry[key] = value
+    if not drugs:
+        return NO_PRESCRIPTIONS
+    return "\n".join(
+        f"Drug: {e['Drug']}, Dose: {e['Dose']}, Route: {e['Route']}, Status: {e['Status']}" for e in drugs.values()
+    )
+
+
+def merge_keywords(parts: List[str]) -> str:
+    keywords: List[str] = []
+    seen = set()
+    for part in parts:
+        if part.strip() == NO_KEYWORDS:
+            continue
+        for keyword in part.split(","):
+            keyword = keyword.strip().strip(".")
+            if keyword and _norm(keyword) not in seen:
+                seen.add(_norm(keyword))
+                keywords.append(keyword)
+    return ", ".join(keywords) if keywords else NO_KEYWORDS
+
+
+def first_known(parts: List[str]) -> str:
+    """Demographics: the earliest chunk that states the value."""
+    for part in parts:
+        if part.strip() and part.strip().lower() not in MISSING:
+            return part.strip()
+    return "NA"
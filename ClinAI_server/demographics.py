@@ -0,0 +1,145 @@
+"""
+Rule-based name / age / gender extraction that runs before the LLM.
+
+Case notes usually state demographics literally ("An 88-year-old male
+presented…"), so compiled regexes and gendered-term counts answer most
+encounters in microseconds.  Every rule returns `(value, confident)`; the
+extractors only spend a Gemini call when `confident` is False.  Per-field
+hit rates are kept in `STATS` and served by the `extractor_stats` tool.
+
+Set CLINAI_RULE_DEMOGRAPHICS=0 to always use the LLM.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+from typing import Callable, Dict, Tuple
+
+ENABLED = os.getenv("CLINAI_RULE_DEMOGRAPHICS", "1") != "0"
+
+Result = Tuple[str, bool]
+
+# ───── Age ─────
+
+_AGE_PATTERNS = [
+    re.compile(r"\b(\d{1,3})\s*-?\s*(?:year|yr)s?\s*-?\s*old\b", re.IGNORECASE),
+    re.compile(r"\b(\d{1,3})\s*(?:y/o|yo|y\.o\.)(?=\W|$)", re.IGNORECASE),
+    re.compile(r"\bage[d:]?\s*:?\s*(\d{1,3})\b", re.IGNORECASE),
+]
+# A bare "I'm 45" is left to the LLM ("I am 5 minutes late"); with "years
+# old" after it the first pattern already matches
+_INFANT = re.compile(r"\b\d{1,2}\s*-?\s*(?:day|week|month)s?\s*-?\s*old\b", re.IGNORECASE)
+
+
+def rule_age(note: str, conv: str) -> Result:
+    """Confident when every literal age mention agrees; ages in months/weeks go to the LLM."""
+    text = f"{note}\n{conv}"
+    if _INFANT.search(text):
+        return "NA", False
+    ages = {int(m.group(1)) for p in _AGE_PATTERNS for m in p.finditer(text)}
+    ages = {a for a in ages if 0 < a <= 120}
+    if len(ages) == 1:
+        return str(ages.pop()), True
+    return "NA", False
+
+
+# ───── Gender ─────
+
+_MALE = re.compile(r"\b(male|man|gentleman|boy|husband|father|son)\b", re.IGNORECASE)
+_FEMALE = re.compile(r"\b(female|woman|lady|girl|wife|mother|daughter|pregnant)\b", re.IGNORECASE)
+# Titles only count before a capitalised surname, and case-sensitively:
+# "MR" and "MS" are mitral regurgitation and multiple sclerosis
+_MALE_TITLE = re.compile(r"\bMr\.?\s+[A-Z]")
+_FEMALE_TITLE = re.compile(r"\bM(?:rs|s|iss)\.?\s+[A-Z]")
+_HE = re.compile(r"\b(he|him|his|himself)\b", re.IGNORECASE)
+_SHE = re.compile(r"\b(she|her|hers|herself)\b", re.IGNORECASE)
+_SIR = re.compile(r"\bsir\b", re.IGNORECASE)
+_MAAM = re.compile(r"\b(ma'?am|madam)\b", re.IGNORECASE)
+
+
+def _first_sentence(text: str) -> str:
+    # Not after a title: "Mr. Smith presented…" is one sentence
+    return re.split(r"(?<=[.?!])(?<!\b[MD]r\.)(?<!\bMrs\.)(?<!\bMs\.)\s", text.strip(), maxsplit=1)[0]
+
+
+def rule_gender(note: str, conv: str) -> Result:
+    """
+    Weighted term counts.  The note's opening sentence ("An 88-year-old
+    male…") weighs most; note pronouns describe the patient; in the
+    conversation only forms of address ("sir", "ma'am") are trusted,
+    because pronouns there often refer to relatives.
+    """
+    opening = _first_sentence(note)
+    male = (5 * (len(_MALE.findall(opening)) + len(_MALE_TITLE.findall(opening)))
+            + len(_HE.findall(note)) + 2 * len(_SIR.findall(conv)))
+    female = (5 * (len(_FEMALE.findall(opening)) + len(_FEMALE_TITLE.findall(opening)))
+              + len(_SHE.findall(note)) + 2 * len(_MAAM.findall(conv)))
+    total = male + female
+    if total >= 3 and max(male, female) / total >= 0.8:
+        return ("Male" if male > female else "Female"), True
+    return "NA", False
+
+
+# ───── Name ─────
+
+# Only the patient's name label: "Drug name: Metformin" is not a patient
+# Up to three capitalised words on one line; only the cue before it ignores case.
+_NAME = r"([A-Z][\w'\-]+(?:[ \t]+(?!(?:And|But|Or|So|Nor|Then)\b)[A-Z][\w'\-]+){0,2})"
+_NAME_LABEL = re.compile(r"\b(?i:patient(?:'s)? name)\s*:\s*" + _NAME)
+_MY_NAME = re.compile(r"\b(?i:my name is)\s+" + _NAME)
+_TITLED = re.compile(r"\b(?:Mr|Mrs|Ms|Miss)\.?\s+([A-Z][\w'\-]+)")
+_NAME_CUES = re.compile(r"\b(name|called|mr|mrs|ms|miss)\b", re.IGNORECASE)
+_INTRODUCTION = re.compile(r"\bI(?:'m| am)\s+[A-Z][a-z]+\b")  # case-sensitive: "I'm John", not "I'm okay"
+
+
+def rule_name(note: str, conv: str) -> Result:
+    """
+    An explicit label or self-introduction is confident.  So is "NA" when
+    the text has no naming cue at all – de-identified notes, the common case.
+    Anything in between (titles, "I'm John") goes to the LLM.
+    """
+    text = f"{note}\n{conv}"
+    for pattern in (_NAME_LABEL, _MY_NAME):
+        match = pattern.search(text)
+        if match:
+            return match.group(1).strip(), True
+    if not any(p.search(text) for p in (_NAME_CUES, _TITLED, _INTRODUCTION)):
+        return "NA", True
+    return "NA", False
+
+
+# ───── Hit-rate bookkeeping ─────
+
+RULES: Dict[str, Callable[[str, str], Result]] = {"name": rule_name, "age": rule_age, "gender": rule_gender}
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counts: Dict[str, Dict[str, int]] = {f: {"rule": 0, "llm": 0} for f in RULES}
+
+    def record(self, field: str, by_rule: bool) -> None:
+        with self._lock:
+            self.counts[field]["rule" if by_rule else "llm"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            out = {}
+            for field, c in self.counts.items():
+                total = c["rule"] + c["llm"]
+                out[field] = {**c, "hit_rate": round(c["rule"] / total, 3) if total else 0.0}
+            return out
+
+
+STATS = _Stats()
+
+
+def pre_extract(field: str, note: str, conv: str) -> Result:
+    """Run the rule for *field* and record whether the LLM is still needed."""
+    if not ENABLED:
+        return "NA", False
+    value, confident = RULES[field](note or "", conv or "")
+    STATS.record(field, confident)
+    return value, confident
@@ -0,0 +1,339 @@
+"""
+Clinical extractors shared by the MCP server (`main.py`) and the API's
+in-process extractor backend: prompt templates, the Gemini call and one
+`get_*` function per extracted field.
+
+Importing this module is cheap – the Gemini SDK is imported on first use.
+
+A failed Gemini call raises `ExtractionError` rather than returning an empty
+answer, so callers can tell "the LLM found nothing" from "the LLM was not
+reached" and never cache the latter.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, Iterator
+
+from dotenv import load_dotenv
+
+from chunking import (
+    estimate_tokens,
+    first_known,
+    map_chunks,
+    merge_keywords,
+    merge_prescriptions,
+    merge_timeline,
+    plan_chunks,
+)
+from demographics import STATS as DEMOGRAPHICS_STATS
+from demographics import pre_extract
+from routing import PROFILE, ROUTES, route, valid_output
+
+load_dotenv()
+_GEMINI_MODEL = route("default").model
+# Upper bound on one Gemini request, so a stuck call cannot hold a tool (or
+# an in-process extractor thread) indefinitely
+_GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))
+
+# ───── LLM Call Helper ─────
+
+class ExtractionError(RuntimeError):
+    """A Gemini call behind an extractor failed (error, timeout, blocked response)."""
+
+_genai: Any = None
+_genai_lock = threading.Lock()
+
+def gemini() -> Any:
+    """`google.generativeai`, imported on first use so the MCP handshake is not held up by it."""
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+            _genai = genai
+    return _genai
+
+def _profile(tool: str, model: str, max_output_tokens: int, prompt: str, text: str, resp: Any, started: float) -> None:
+    """Record one call with the profiler; token counts come from the response, else are estimated."""
+    latency_ms = (time.perf_counter() - started) * 1000.0
+    usage = getattr(resp, "usage_metadata", None)
+    output_tokens = getattr(usage, "candidates_token_count", None) or estimate_tokens(text)
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or estimate_tokens(prompt)
+    candidates = getattr(resp, "candidates", None) or []
+    reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+    if reason is not None:
+        truncated = getattr(reason, "name", str(reason)) == "MAX_TOKENS"
+    else:
+        truncated = output_tokens >= max_output_tokens
+    valid = not truncated and valid_output(tool, text)
+    PROFILE.record(tool, model, latency_ms, prompt_tokens, output_tokens, max_output_tokens, truncated, valid)
+
+def call_gemini_text(
+    prompt: str,
+    temperature: float = 0.0,
+    max_output_tokens: int = 1024,
+    model: str = _GEMINI_MODEL,
+    tool: str = "default",
+) -> str:
+    try:
+        genai = gemini()
+        started = time.perf_counter()
+        resp = genai.GenerativeModel(model).generate_content(
+            prompt,
+            generation_config=genai.GenerationConfig(
+                temperature=temperature,
+                max_output_tokens=max_output_tokens
+            ),
+            request_options={"timeout": _GEMINI_TIMEOUT},
+        )
+        result = resp.text.strip()
+        if PROFILE is not None:
+            _profile(tool, model, max_output_tokens, prompt, result, resp, started)
+        return result
+    except Exception as e:
+        print(f"[GEMINI TEXT ERROR] {e}")
+        traceback.print_exc()
+        raise ExtractionError(f"Gemini call for {tool} failed: {e}") from e
+
+def stream_gemini_text(
+    prompt: str,
+    temperature: float = 0.0,
+    max_output_tokens: int = 1024,
+    model: str = _GEMINI_MODEL,
+    tool: str = "default",
+) -> Iterator[str]:
+    """`call_gemini_text`, yielding text as Gemini generates it.  Errors propagate to the consumer."""
+    genai = gemini()
+    started = time.perf_counter()
+    resp = genai.GenerativeModel(model).generate_content(
+        prompt,
+        generation_config=genai.GenerationConfig(
+            temperature=temperature,
+            max_output_tokens=max_output_tokens
+        ),
+        stream=True,
+        request_options={"timeout": _GEMINI_TIMEOUT},
+    )
+    pieces = []
+    for chunk in resp:
+        if chunk.text:
+            pieces.append(chunk.text)
+            yield chunk.text
+    if PROFILE is not None:
+        _profile(tool, model, max_output_tokens, prompt, "".join(pieces).strip(), resp, started)
+
+def routed(tool: str) -> Callable[[str], str]:
+    """`call_gemini_text` with *tool*'s route: its model, output token cap and temperature."""
+    r = route(tool)
+    return lambda prompt: call_gemini_text(prompt, r.temperature, r.max_output_tokens, model=r.model, tool=tool)
+
+def stream_routed(tool: str, prompt: str) -> Iterator[str]:
+    r = route(tool)
+    return stream_gemini_text(prompt, r.temperature, r.max_output_tokens, model=r.model, tool=tool)
+
+# ───── Prompt Templates ─────
+
+def summary_prompt(note: str, conv: str) -> str:
+    return (
+        "Summarize the provided clinical note and conversation in one concise paragraph (no more than 4 sentences). "
+        "Include the overall clinical situation, main events, and outcome if stated. Only use the input provided.\n\n"
+        f"Clinical Note: {note}\n"
+        f"Conversation: {conv}"
+    )
+
+def summary_merge_prompt(partials: list) -> str:
+    joined = "\n".join(f"Part {i + 1}: {p}" for i, p in enumerate(partials))
+    return (
+        "The following are summaries of consecutive parts of one clinical encounter, in order. "
+        "Combine them into one concise paragraph (no more than 4 sentences) covering the overall clinical situation, "
+        "main events, and outcome if stated. Only use the input provided.\n\n"
+        f"{joined}"
+    )
+
+def timeline_prompt(note: str, conv: str) -> str:
+    return (
+        "Extract all major clinical events from the note and conversation, in clear chronological order. "
+        "Return the result as a single Python-style string list, like ['event 1', 'event 2', ...]. "
+        "Do not return as JSON, a paragraph, or a bulleted list. "
+        "Only use the information provided.\n\n"
+        f"Clinical Note: {note}\n"
+        f"Conversation: {conv}"
+    )
+
+def prescriptions_prompt(note: str, conv: str) -> str:
+    return (
+        "Extract all prescription medications mentioned in the clinical note or conversation. "
+        "For each medication, return a line in the format: "
+        "'Drug: <drug name>, Dose: <dose>, Route: <route>, Status: <status>'. "
+        "Possible status values: 'active' (doctor prescribed), 'stopped' (doctor told to stop), 'continuing' (doctor said to continue or did not specify). "
+        "If a field is missing or not specified, use 'NA'. Return a plain list of lines, not JSON. "
+        "If no medications, return 'No prescriptions found.'\n\n"
+        f"Clinical Note: {note}\n"
+        f"Conversation: {conv}\n"
+    )
+
+def keywords_prompt(note: str, conv: str) -> str:
+    return (
+        "Extract all main medical keywords, including primary problems, diseases, symptoms, medicines, and diagnostic tests "
+        "from the clinical note and conversation. Return the keywords as a plain, comma-separated list. "
+        "Do not return as JSON or a list object—just a readable comma-separated string. "
+        "If nothing found, return 'No main keywords found.'\n\n"
+        f"Clinical Note: {note}\n"
+        f"Conversation: {conv}\n"
+    )
+
+def name_prompt(note: str, conv: str) -> str:
+    return (
+        "Extract only the patient's name from the clinical note and conversation. "
+        "Return just the name, nothing else. If not found, return 'NA'.\n\n"
+        f"Clinical Note: {note}\n"
+        f"Conversation: {conv}\n"
+    )
+
+def age_prompt(note: str, conv: str) -> str:
+    return (
+        "Extract only the patient's age from the clinical note and conversation. "
+        "Return just the age number, nothing else. If not found, return 'NA'.\n\n"
+        f"Clinical Note: {note}\n"
+        f"Conversation: {conv}\n"
+    )
+
+def gender_prompt(note: str, conv: str) -> str:
+    return (
+        "Extract only the patient's gender from the clinical note and conversation. "
+        "Return just the gender (Male/Female/M/F), nothing else. If not found, return 'NA'.\n\n"
+        f"Clinical Note: {note}\n"
+        f"Conversation: {conv}\n"
+    )
+
+# ───── Extractor Functions ─────
+# Errors are logged and re-raised: the fallback value for a failed field is
+# the caller's decision (and must not be mistaken for an extracted one).
+
+def get_summary(n: str, c: str) -> str:
+    try:
+        # Long encounters: summarise each chunk in parallel, then one merge call
+        parts = [p for p in map_chunks(summary_prompt, n, c, routed("patient_summary")) if p.strip()]
+        if len(parts) <= 1:
+            return parts[0].strip() if parts else ""
+        return routed("patient_summary")(summary_merge_prompt(parts)).strip()
+    except Exception as e:
+        print(f"[SUMMARY ERROR] Exception: {e}")
+        traceback.print_exc()
+        raise
+
+def get_timeline(n: str, c: str) -> str:
+    try:
+        parts = map_chunks(timeline_prompt, n, c, routed("patient_timeline"))
+        return parts[0].strip() if len(parts) == 1 else merge_timeline(parts)
+    except Exception as e:
+        print(f"[TIMELINE ERROR] Exception: {e}")
+        traceback.print_exc()
+        raise
+
+def get_keywords(n: str, c: str) -> str:
+    try:
+        parts = map_chunks(keywords_prompt, n, c, routed("patient_keywords"))
+        return parts[0].strip() if len(parts) == 1 else merge_keywords(parts)
+    except Exception as e:
+        print(f"[KEYWORDS ERROR] Exception: {e}")
+        traceback.print_exc()
+        raise
+
+def get_prescriptions(n: str, c: str) -> str:
+    try:
+        parts = map_chunks(prescriptions_prompt, n, c, routed("patient_prescriptions"))
+        return parts[0].strip() if len(parts) == 1 else merge_prescriptions(parts)
+    except Exception as e:
+        print(f"[PRESCRIPTIONS ERROR] Exception: {e}")
+        traceback.print_exc()
+        raise
+
+def get_name(n: str, c: str) -> str:
+    value, confident = pre_extract("name", n, c)
+    if confident:
+        return value
+    try:
+        return first_known(map_chunks(name_prompt, n, c, routed("patient_name")))
+    except Exception as e:
+        print(f"[NAME ERROR] Exception: {e}")
+        traceback.print_exc()
+        raise
+
+def get_age(n: str, c: str) -> str:
+    value, confident = pre_extract("age", n, c)
+    if confident:
+        return value
+    try:
+        return first_known(map_chunks(age_prompt, n, c, routed("patient_age")))
+    except Exception as e:
+        print(f"[AGE ERROR] Exception: {e}")
+        traceback.print_exc()
+        raise
+
+def get_gender(n: str, c: str) -> str:
+    value, confident = pre_extract("gender", n, c)
+    if confident:
+        return value
+    try:
+        return first_known(map_chunks(gender_prompt, n, c, routed("patient_gender")))
+    except Exception as e:
+        print(f"[GENDER ERROR] Exception: {e}")
+        traceback.print_exc()
+        raise
+
+# ───── Streaming Extractors ─────
+# Same output as get_summary / get_timeline, produced incrementally.  Long
+# encounters still map their chunks first; only the final generation streams.
+
+def stream_summary(n: str, c: str) -> Iterator[str]:
+    if len(plan_chunks(summary_prompt, n, c)) == 1:
+        yield from stream_routed("patient_summary", summary_prompt(n, c))
+        return
+    parts = [p for p in map_chunks(summary_prompt, n, c, routed("patient_summary")) if p.strip()]
+    if len(parts) <= 1:
+        yield parts[0].strip() if parts else ""
+        return
+    yield from stream_routed("patient_summary", summary_merge_prompt(parts))
+
+def stream_timeline(n: str, c: str) -> Iterator[str]:
+    if len(plan_chunks(timeline_prompt, n, c)) == 1:
+        yield from stream_routed("patient_timeline", timeline_prompt(n, c))
+        return
+    yield merge_timeline(map_chunks(timeline_prompt, n, c, routed("patient_timeline")))
+
+
+# MCP tool name → extractor, for callers that dispatch by tool name
+TOOL_FUNCTIONS: Dict[str, Callable[[str, str], str]] = {
+    "patient_summary": get_summary,
+    "patient_timeline": get_timeline,
+    "patient_keywords": get_keywords,
+    "patient_prescriptions": get_prescriptions,
+    "patient_name": get_name,
+    "patient_age": get_age,
+    "patient_gender": get_gender,
+}
+
+# MCP tool name → streaming extractor (the fields worth watching being written)
+STREAM_FUNCTIONS: Dict[str, Callable[[str, str], Iterator[str]]] = {
+    "patient_summary": stream_summary,
+    "patient_timeline": stream_timeline,
+}
+
+
+def extractor_stats() -> Dict[str, Any]:
+    """
+    How often the local demographic rules answered without Gemini, per
+    field; the tool routes; and, when profiling, per tool and model call stats.
+    """
+    stats: Dict[str, Any] = {
+        "demographics": DEMOGRAPHICS_STATS.snapshot(),
+        "routes": {tool: r._asdict() for tool, r in ROUTES.items()},
+    }
+    if PROFILE is not None:
+        stats["profile"] = PROFILE.snapshot()
+    return stats
@@ -0,0 +1,126 @@
+"""
+Profile the extractor tools against candidate Gemini models and propose
+per-tool routes (`tool_routes.json`).
+
+Every tool is run on sample encounters once per model, with the demographic
+rules switched off so name/age/gender really reach the LLM.  Per tool and
+model the report shows latency (p50/p95), prompt and output tokens, how
+often the output was cut off by the token cap and how often it had the
+expected shape.  The proposed route for a tool is the fastest model whose
+outputs were valid at least `--min-valid-rate` of the time and never
+truncated, with an output cap of 1.5× the longest answer seen.
+
+Usage examples
+--------------
+• Compare the default and the lite model on 20 encounters:
+    python profile_routes.py --samples encounters.jsonl
+
+• Size the caps with a generous limit, and write the proposal:
+    python profile_routes.py --samples encounters.jsonl --max-output-tokens 2048 \\
+        --write-routes tool_routes.proposed.json
+
+Samples are JSONL records with `note` (or `notes`) and `conversation`, e.g.
+an export of the ingestion dataset.  Needs GEMINI_API_KEY.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_MODELS = "models/gemini-2.0-flash,models/gemini-2.0-flash-lite"
+
+
+def load_samples(path: str, limit: int) -> List[Tuple[str, str]]:
+    samples = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                rec = json.loads(line)
+                samples.append((rec.get("note") or rec.get("notes") or "", rec.get("conversation") or ""))
+    return samples[:limit] if limit > 0 else samples
+
+
+def _run(fn: Any, sample: Tuple[str, str]) -> bool:
+    """Run one extractor on one sample; a failed call is reported, not fatal to the profile."""
+    try:
+        fn(*sample)
+        return True
+    except Exception:
+        return False
+
+
+def propose(profile: Dict[str, Dict[str, Dict[str, Any]]], routes: Dict[str, Any], min_valid_rate: float) -> Dict[str, Any]:
+    """Fastest valid, untruncated model per tool, with a cap of 1.5× the longest answer seen."""
+    proposal: Dict[str, Any] = {"default": routes["default"]._asdict()}
+    for tool, per_model in profile.items():
+        eligible = [
+            (stats["p50_ms"], model, stats) for model, stats in per_model.items()
+            if stats["valid_rate"] >= min_valid_rate and not stats["truncated"]
+        ]
+        if not eligible:
+            print(f"[PROFILE] {tool}: no model met the bar; keeping its current route")
+            proposal[tool] = routes.get(tool, routes["default"])._asdict()
+            continue
+        _, model, stats = min(eligible)
+        cap = max(8, int(math.ceil(stats["max_output_tokens_seen"] * 1.5 / 8.0)) * 8)
+        proposal[tool] = {"model": model, "max_output_tokens": cap}
+    return proposal
+
+
+def print_report(profile: Dict[str, Dict[str, Dict[str, Any]]]) -> None:
+    cols = ["calls", "p50_ms", "p95_ms", "avg_prompt_tokens", "avg_output_tokens",
+            "max_output_tokens_seen", "truncated", "valid_rate"]
+    print(f"{'tool':<24}{'model':<32}" + "".join(f"{c:>24}" for c in cols))
+    for tool, per_model in profile.items():
+        for model, stats in per_model.items():
+            print(f"{tool:<24}{model:<32}" + "".join(f"{stats[c]:>24}" for c in cols))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Profile extractor tools per model and propose tool routes")
+    parser.add_argument("--samples", required=True, help="JSONL file of {note, conversation} records")
+    parser.add_argument("--limit", type=int, default=20, help="Encounters to use (default: 20, -1 for all)")
+    parser.add_argument("--models", default=DEFAULT_MODELS, help=f"Comma-separated models (default: {DEFAULT_MODELS})")
+    parser.add_argument("--tools", help="Comma-separated subset of tools (default: all)")
+    parser.add_argument("--max-output-tokens", type=int,
+                        help="Cap for every call instead of each tool's configured cap (to size new caps)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Encounters extracted in parallel (default: 4)")
+    parser.add_argument("--min-valid-rate", type=float, default=0.95)
+    parser.add_argument("--log", help="Also append every call to this JSONL file")
+    parser.add_argument("--write-routes", help="Write the proposed routes to this JSON file")
+    args = parser.parse_args(argv)
+
+    # Set before the extractors are imported: they read both at import time
+    os.environ["CLINAI_RULE_DEMOGRAPHICS"] = "0"
+    os.environ["CLINAI_PROFILE"] = args.log or "1"
+    import extractors
+    import routing
+
+    samples = load_samples(args.samples, args.limit)
+    tools = args.tools.split(",") if args.tools else list(extractors.TOOL_FUNCTIONS)
+    configured = dict(routing.ROUTES)
+    with ThreadPoolExecutor(max_workers=max(args.concurrency, 1)) as pool:
+        for model, tool in itertools.product(args.models.split(","), tools):
+            base = configured.get(tool, configured["default"])
+            routing.ROUTES[tool] = base._replace(model=model, max_output_tokens=args.max_output_tokens or base.max_output_tokens)
+            results = list(pool.map(lambda s: _run(extractors.TOOL_FUNCTIONS[tool], s), samples))
+            print(f"[PROFILE] {tool} on {model}: {len(samples)} encounters, {results.count(False)} failed")
+
+    profile = routing.PROFILE.snapshot()
+    print_report(profile)
+    proposal = propose(profile, configured, args.min_valid_rate)
+    print(json.dumps(proposal, indent=2))
+    if args.write_routes:
+        Path(args.write_routes).write_text(json.dumps(proposal, indent=2) + "\n")
+        print(f"[PROFILE] Proposed routes written to {args.write_routes}")
+
+
+if __name__ == "__main__":
+    main()
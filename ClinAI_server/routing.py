@@ -0,0 +1,166 @@
+"""
+Per-tool model routing and profiling for the extractor tools.
+
+Every Gemini call an extractor makes uses its tool's route: model, output
+token cap and temperature.  Routes are read from `tool_routes.json` next to
+this file (or the file named by CLINAI_TOOL_ROUTES); a tool without an entry
+uses the "default" route.  Caps are sized to the expected answer – an age is
+a few tokens, not 1024 – which bounds generation time and cuts a runaway
+answer short, and short-answer fields can go to a cheaper, faster model.
+
+Profiling (CLINAI_PROFILE=1, or CLINAI_PROFILE=<path>.jsonl to also log every
+call) records latency, token usage, truncation and whether the output has
+the expected shape, per tool and model; `extractor_stats` serves the
+aggregate.  `profile_routes.py` runs the tools on sample encounters against
+candidate models and proposes routes from the measurements.
+"""
+
+from __future__ import annotations
+
+import ast
+import json
+import os
+import re
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, NamedTuple, Optional
+
+DEFAULT_ROUTES_PATH = Path(__file__).parent / "tool_routes.json"
+DEFAULT_MODEL = "models/gemini-2.0-flash"
+
+
+class Route(NamedTuple):
+    model: str = DEFAULT_MODEL
+    max_output_tokens: int = 1024
+    temperature: float = 0.0
+
+
+def load_routes(path: str | Path) -> Dict[str, Route]:
+    """`{tool: Route}` from a JSON file of `{"default": {...}, "<tool>": {...}}`; missing keys inherit from default."""
+    raw = json.loads(Path(path).read_text())
+    default = Route()._replace(**raw.get("default", {}))
+    routes = {"default": default}
+    for tool, spec in raw.items():
+        if tool != "default" and not tool.startswith("_"):
+            routes[tool] = default._replace(**spec)
+    return routes
+
+
+ROUTES: Dict[str, Route] = load_routes(os.getenv("CLINAI_TOOL_ROUTES", DEFAULT_ROUTES_PATH))
+
+
+def route(tool: str) -> Route:
+    return ROUTES.get(tool, ROUTES["default"])
+
+
+# ───── Output validity ─────
+# Cheap shape checks on what one call returned; a truncated answer is never valid.
+
+_AGE = re.compile(r"^(\d{1,3}|NA)$")
+_GENDER = re.compile(r"^(male|female|m|f|na)$", re.IGNORECASE)
+_RX_LINE = re.compile(r"^\s*Drug\s*:", re.IGNORECASE)
+
+
+def _is_list(text: str) -> bool:
+    try:
+        return isinstance(ast.literal_eval(text), (list, tuple))
+    except (ValueError, SyntaxError, TypeError):
+        return False
+
+
+VALIDATORS: Dict[str, Callable[[str], bool]] = {
+    "patient_age": lambda t: bool(_AGE.match(t)),
+    "patient_gender": lambda t: bool(_GENDER.match(t)),
+    "patient_name": lambda t: "\n" not in t and 0 < len(t.split()) <= 6,
+    "patient_summary": lambda t: bool(t) and not t.startswith(("[", "{")),
+    "patient_timeline": _is_list,
+    "patient_prescriptions": lambda t: t == "No prescriptions found." or all(
+        _RX_LINE.match(line) for line in t.splitlines() if line.strip()
+    ),
+    "patient_keywords": lambda t: bool(t) and not t.startswith(("[", "{")) and "\n" not in t.strip(),
+}
+
+
+def valid_output(tool: str, text: str) -> bool:
+    check = VALIDATORS.get(tool)
+    return bool(text.strip()) if check is None else check(text.strip())
+
+
+# ───── Profiling ─────
+
+def _percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100.0), len(ordered) - 1)] if ordered else 0.0
+
+
+class Profiler:
+    """Per (tool, model) call measurements; thread-safe, optionally logged to a JSONL file."""
+
+    def __init__(self, log_path: Optional[str] = None, window: int = 1000) -> None:
+        self._lock = threading.Lock()
+        self._window = window
+        self._log = open(log_path, "a", encoding="utf-8") if log_path else None
+        self._stats: Dict[tuple, Dict[str, Any]] = {}
+
+    def record(
+        self,
+        tool: str,
+        model: str,
+        latency_ms: float,
+        prompt_tokens: int,
+        output_tokens: int,
+        max_output_tokens: int,
+        truncated: bool,
+        valid: bool,
+    ) -> None:
+        with self._lock:
+            s = self._stats.get((tool, model))
+            if s is None:
+                s = self._stats[(tool, model)] = {
+                    "calls": 0, "valid": 0, "truncated": 0, "prompt_tokens": 0, "output_tokens": 0,
+                    "max_output_tokens_seen": 0, "latencies": deque(maxlen=self._window),
+                }
+            s["calls"] += 1
+            s["valid"] += valid
+            s["truncated"] += truncated
+            s["prompt_tokens"] += prompt_tokens
+            s["output_tokens"] += output_tokens
+            s["max_output_tokens_seen"] = max(s["max_output_tokens_seen"], output_tokens)
+            s["latencies"].append(latency_ms)
+            if self._log is not None:
+                self._log.write(json.dumps({
+                    "tool": tool, "model": model, "latency_ms": round(latency_ms, 1),
+                    "prompt_tokens": prompt_tokens, "output_tokens": output_tokens,
+                    "max_output_tokens": max_output_tokens, "truncated": truncated, "valid": valid,
+                }) + "\n")
+                self._log.flush()
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """`{tool: {model: {calls, p50_ms, p95_ms, avg tokens, valid_rate, …}}}`."""
+        with self._lock:
+            out: Dict[str, Dict[str, Dict[str, Any]]] = {}
+            for (tool, model), s in sorted(self._stats.items()):
+                lat: Deque[float] = s["latencies"]
+                out.setdefault(tool, {})[model] = {
+                    "calls": s["calls"],
+                    "p50_ms": round(_percentile(list(lat), 50), 1),
+                    "p95_ms": round(_percentile(list(lat), 95), 1),
+                    "avg_prompt_tokens": round(s["prompt_tokens"] / s["calls"], 1),
+                    "avg_output_tokens": round(s["output_tokens"] / s["calls"], 1),
+                    "max_output_tokens_seen": s["max_output_tokens_seen"],
+                    "truncated": s["truncated"],
+                    "valid_rate": round(s["valid"] / s["calls"], 3),
+                }
+            return out
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+_PROFILE_SETTING = os.getenv("CLINAI_PROFILE", "0")
+PROFILE: Optional[Profiler] = (
+    None if _PROFILE_SETTING in ("", "0")
+    else Profiler(None if _PROFILE_SETTING == "1" else _PROFILE_SETTING)
+)